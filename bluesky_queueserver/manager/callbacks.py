@@ -0,0 +1,370 @@
+import importlib
+import pickle
+import queue
+import socket
+import threading
+import time as ttime
+import zmq
+
+import event_model
+from bluesky.callbacks.best_effort import BestEffortCallback
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class BufferedCallback:
+    """
+    Callback that places the documents emitted by Run Engine in a bounded queue and passes
+    them to the wrapped callback from a separate thread, so that slow processing of documents
+    does not block Run Engine. The documents are delivered in the order they were emitted.
+
+    The policy used when the queue is full (backpressure) is selected using the
+    parameter ``backpressure``:
+
+    - ``"block"``: Run Engine is blocked until there is free space in the queue (no documents
+      are lost, acquisition is throttled only when the queue is full);
+
+    - ``"drop_events"``: ``event`` documents are dropped (other documents are always delivered,
+      Run Engine is blocked if the queue is full and the document is not an ``event``).
+
+    Parameters
+    ----------
+    callback: callable
+        The callback with the signature ``callback(name, doc)``.
+    queue_size: int
+        Maximum number of documents in the queue.
+    backpressure: str
+        The policy used when the queue is full: ``"block"`` or ``"drop_events"``.
+    max_batch_size: int
+        Maximum number of documents processed as a single batch.
+    pack_events: bool
+        Combine sequences of ``event`` documents that belong to the same event descriptor
+        into ``event_page`` documents before they are passed to the callback.
+    name: str
+        Name of the thread that delivers the documents.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        cb = BufferedCallback(db.insert)
+        cb.start()
+        RE.subscribe(cb)
+        ...
+        cb.stop()
+    """
+    backpressure_policies = ("block", "drop_events")
+
+    def __init__(self, callback, *, queue_size=10000, backpressure="block",
+                 max_batch_size=1000, pack_events=False, name="Buffered Callback"):
+        if backpressure not in self.backpressure_policies:
+            raise ValueError(f"Unsupported backpressure policy '{backpressure}'. "
+                             f"Supported policies: {self.backpressure_policies}")
+        if queue_size < 1:
+            raise ValueError(f"Queue size must be positive: {queue_size}")
+
+        self._callback = callback
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._backpressure = backpressure
+        self._max_batch_size = max_batch_size
+        self._pack_events = pack_events
+        self._name = name
+        self._thread = None
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"n_received": 0,
+                       "n_processed": 0,
+                       "n_dropped": 0,
+                       "n_errors": 0,
+                       "n_batches": 0,
+                       "queue_depth_max": 0,
+                       "time_blocked": 0.0,
+                       "latency_last": 0.0,
+                       "latency_max": 0.0,
+                       "latency_total": 0.0}
+
+    def __call__(self, name, doc):
+        """
+        Called by Run Engine. Place the document in the queue.
+        """
+        item = (name, doc)
+        n_dropped, time_blocked = 0, 0.0
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if (self._backpressure == "drop_events") and (name == "event"):
+                n_dropped = 1
+            else:
+                t_start = ttime.monotonic()
+                self._queue.put(item)
+                time_blocked = ttime.monotonic() - t_start
+
+        queue_depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats["n_received"] += 1
+            self._stats["n_dropped"] += n_dropped
+            self._stats["time_blocked"] += time_blocked
+            self._stats["queue_depth_max"] = max(self._stats["queue_depth_max"], queue_depth)
+
+    def start(self):
+        """
+        Start the thread that delivers the documents.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def stop(self, *, timeout=10):
+        """
+        Deliver the documents remaining in the queue and stop the thread.
+
+        Parameters
+        ----------
+        timeout: float
+            Maximum time to wait for the remaining documents to be delivered.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.error("%s: timeout occurred while delivering the remaining documents "
+                             "(%d documents in the queue)", self._name, self._queue.qsize())
+            else:
+                self._thread = None
+
+    def get_stats(self):
+        """
+        Returns the counters: current and maximum depth of the queue, the numbers of received,
+        processed and dropped documents, the number of processed batches and the number of
+        errors, total time Run Engine was blocked by the full queue and the time of processing
+        of the batches (last, maximum, mean and total latency in seconds).
+
+        Returns
+        -------
+        dict
+            The dictionary of counters.
+        """
+        with self._stats_lock:
+            stats = self._stats.copy()
+        n_batches = stats["n_batches"]
+        stats["latency_mean"] = stats["latency_total"] / n_batches if n_batches else 0.0
+        stats["queue_depth"] = self._queue.qsize()
+        stats["backpressure"] = self._backpressure
+        return stats
+
+    def _deliver(self, name, doc):
+        """
+        Pass the document to the callback. Exceptions are logged and counted, so that
+        a failure does not prevent delivery of the following documents.
+        """
+        try:
+            self._callback(name, doc)
+        except Exception as ex:
+            logger.exception("%s: failed to process '%s' document: %s", self._name, name, str(ex))
+            with self._stats_lock:
+                self._stats["n_errors"] += 1
+
+    def _process_batch(self, batch):
+        """
+        Process the batch of documents (the list of tuples ``(name, doc)``). If ``pack_events``
+        is enabled, sequences of ``event`` documents that belong to the same event descriptor
+        are combined into ``event_page`` documents.
+        """
+        events = []
+
+        def deliver_events():
+            if events:
+                self._deliver("event_page", event_model.pack_event_page(*events))
+                events.clear()
+
+        for name, doc in batch:
+            if self._pack_events and (name == "event"):
+                if events and (events[-1]["descriptor"] != doc["descriptor"]):
+                    deliver_events()
+                events.append(doc)
+            else:
+                deliver_events()
+                self._deliver(name, doc)
+        deliver_events()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            while len(items) < self._max_batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if items[-1] is None:
+                # 'None' is always the last item placed in the queue
+                items.pop()
+                stopping = True
+            if not items:
+                continue
+
+            t_start = ttime.monotonic()
+            self._process_batch(items)
+            latency = ttime.monotonic() - t_start
+
+            with self._stats_lock:
+                self._stats["n_processed"] += len(items)
+                self._stats["n_batches"] += 1
+                self._stats["latency_last"] = latency
+                self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+                self._stats["latency_total"] += latency
+
+
+class DatabrokerInserter(BufferedCallback):
+    """
+    Inserts documents emitted by Run Engine into Databroker from a separate thread. Sequences
+    of ``event`` documents that belong to the same event descriptor are combined into
+    ``event_page`` documents, so they are inserted using a single call.
+
+    Parameters
+    ----------
+    db: databroker.Broker
+        The instance of Databroker.
+    kwargs
+        ``kwargs`` of `BufferedCallback` (``queue_size``, ``backpressure``, ``max_batch_size``).
+    """
+    def __init__(self, db, **kwargs):
+        kwargs.setdefault("name", "Databroker Inserter")
+        super().__init__(db.insert, pack_events=True, **kwargs)
+
+
+class DocumentPublisher(BufferedCallback):
+    """
+    Publishes documents emitted by Run Engine on ZMQ PUB socket. The messages have the format
+    used by ``bluesky.callbacks.zmq.Publisher`` (``prefix``, document name and serialized
+    document separated by ``b" "``), so the documents may be received using
+    ``bluesky.callbacks.zmq.RemoteDispatcher`` connected directly to the socket.
+    Sequences of ``event`` documents that belong to the same event descriptor are
+    published as ``event_page`` documents.
+
+    The socket is bound in `start()`, the messages are sent from the thread that
+    processes the documents, so Run Engine is not waiting for serialization of documents.
+
+    Parameters
+    ----------
+    address: str
+        Address of the socket, e.g. ``"tcp://*:5578"``. Use ``"tcp://127.0.0.1:*"`` to bind
+        the socket to a random port (the address is available as the ``address`` property).
+        If the socket is bound to all interfaces, the ``address`` property contains the host name.
+    prefix: bytes
+        Prefix of the messages. May not contain ``b" "``.
+    serializer: callable
+        The function used to serialize documents (default ``pickle.dumps``).
+    kwargs
+        ``kwargs`` of `BufferedCallback` (``queue_size``, ``backpressure``, ``max_batch_size``).
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        # RE Worker
+        publisher = DocumentPublisher("tcp://*:5578")
+        publisher.start()
+        RE.subscribe(publisher)
+
+        # Analysis process
+        from bluesky.callbacks.zmq import RemoteDispatcher
+        dispatcher = RemoteDispatcher("localhost:5578")
+        dispatcher.subscribe(callback)
+        dispatcher.start()
+    """
+    def __init__(self, address, *, prefix=b"", serializer=pickle.dumps, **kwargs):
+        if not isinstance(prefix, bytes) or (b" " in prefix):
+            raise ValueError(f"Prefix must be bytes and may not contain b' ': {prefix!r}")
+        kwargs.setdefault("name", "Document Publisher")
+        kwargs.setdefault("backpressure", "drop_events")
+        super().__init__(self._send_document, pack_events=True, **kwargs)
+
+        self._address = address
+        self._prefix = prefix
+        self._serializer = serializer
+        self._ctx = None
+        self._socket = None
+
+    @property
+    def address(self):
+        """
+        The address of the bound socket or None if the socket is not bound. The wildcard
+        address (all interfaces) is replaced by the host name, so that the address could be
+        used by remote clients.
+        """
+        if self._socket is None:
+            return None
+        address = self._socket.getsockopt(zmq.LAST_ENDPOINT).decode()
+        host_port, _, port = address.rpartition(":")
+        transport, _, host = host_port.partition("://")
+        if host in ("0.0.0.0", "[::]", "*"):
+            address = f"{transport}://{socket.gethostname()}:{port}"
+        return address
+
+    def start(self):
+        """
+        Bind the socket and start the thread that publishes the documents.
+        """
+        if self._socket is None:
+            self._ctx = zmq.Context()
+            self._socket = self._ctx.socket(zmq.PUB)
+            try:
+                self._socket.bind(self._address)
+            except Exception:
+                self._socket.close(linger=0)
+                self._socket = None
+                self._ctx.term()
+                raise
+        super().start()
+
+    def stop(self, *, timeout=10):
+        """
+        Publish the remaining documents, stop the thread and close the socket.
+        """
+        super().stop(timeout=timeout)
+        # The socket is still used if the thread failed to stop
+        if (self._thread is None) and (self._socket is not None):
+            self._socket.close(linger=0)
+            self._socket = None
+            self._ctx.term()
+
+    def _send_document(self, name, doc):
+        self._socket.send(b" ".join([self._prefix, name.encode(), self._serializer(doc)]))
+
+
+def create_callback(name):
+    """
+    Create the callback that processes documents emitted by Run Engine in RE Worker.
+
+    Parameters
+    ----------
+    name: str
+        ``"best_effort"`` (`BestEffortCallback` with plotting disabled) or the full name
+        of the class or the function that returns the callback (e.g. ``"mymodule.MyCallback"``).
+        The class or the function is called without parameters.
+
+    Returns
+    -------
+    callable
+        The callback with the signature ``callback(name, doc)``.
+
+    Raises
+    ------
+    ValueError
+        The name is not the full name of the class or the function.
+    """
+    if name == "best_effort":
+        callback = BestEffortCallback()
+        callback.disable_plots()
+        return callback
+
+    module_name, _, attr_name = name.rpartition(".")
+    if not module_name:
+        raise ValueError(f"Callback must be 'best_effort' or the full name of the class: '{name}'")
+    module = importlib.import_module(module_name)
+    return getattr(module, attr_name)()
@@ -0,0 +1,187 @@
+import json
+import pickle
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    # Available in Python 3.8+
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PickleCodec:
+    """
+    Encodes messages using ``pickle`` (the highest protocol). Any picklable object may be sent.
+    """
+    name = "pickle"
+
+    def encode(self, msg):
+        return pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+        return pickle.loads(data)
+
+
+class JsonCodec:
+    """
+    Encodes messages as UTF-8 encoded JSON. Tuples are decoded as lists.
+    """
+    name = "json"
+
+    def encode(self, msg):
+        return json.dumps(msg).encode("utf-8")
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """
+    Encodes messages using ``msgpack`` (must be installed). Tuples are decoded as lists.
+    """
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("Package 'msgpack' is not installed: 'msgpack' codec is not available")
+
+    def encode(self, msg):
+        return msgpack.packb(msg, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+_codecs = {"pickle": PickleCodec, "json": JsonCodec, "msgpack": MsgpackCodec}
+
+
+def get_codec(name):
+    """
+    Returns the codec used to encode messages sent over pipes.
+
+    Parameters
+    ----------
+    name: str
+        Name of the codec: ``"pickle"``, ``"json"`` or ``"msgpack"``.
+
+    Returns
+    -------
+    object
+        The codec with methods ``encode(msg)`` (returns ``bytes``) and ``decode(data)``.
+
+    Raises
+    ------
+    ValueError
+        Unknown codec.
+    RuntimeError
+        The codec is not available (the package is not installed).
+    """
+    if name not in _codecs:
+        raise ValueError(f"Unknown codec '{name}'. Supported codecs: {list(_codecs)}")
+    return _codecs[name]()
+
+
+class ShmRingBuffer:
+    """
+    Ring buffer in shared memory for passing large messages from one process to another
+    (single writer, single reader). The writer copies the message into the buffer and sends
+    the descriptor (position and size of the message) to the reader over the pipe. The reader
+    copies the message from the buffer and advances the read position stored in the buffer.
+    The writer never waits for the reader: if there is not enough free space, `write()` returns
+    None and the message should be sent over the pipe. The positions of the writer and the reader
+    are stored in the buffer, so the processes that use the buffer may be restarted.
+
+    The buffer is created by the process that starts the communicating processes (before
+    the processes are forked). The creator should call `close(unlink=True)` when the
+    buffer is no longer used. Requires Python 3.8+ (``multiprocessing.shared_memory``).
+
+    Parameters
+    ----------
+    size: int
+        Size of the data area of the buffer in bytes.
+    """
+    # Header: write position, read position (the total number of bytes written/consumed)
+    _header = struct.Struct("<QQ")
+
+    def __init__(self, size):
+        if shared_memory is None:
+            raise RuntimeError("Shared memory is not supported (Python 3.8+ is required)")
+        if size <= 0:
+            raise ValueError(f"Size of the ring buffer must be positive: {size}")
+        self._size = size
+        self._shm = shared_memory.SharedMemory(create=True, size=self._header.size + size)
+        self._header.pack_into(self._shm.buf, 0, 0, 0)
+
+    @property
+    def size(self):
+        """
+        Size of the data area of the buffer in bytes.
+        """
+        return self._size
+
+    def write(self, data):
+        """
+        Copy the message into the buffer.
+
+        Parameters
+        ----------
+        data: bytes
+            The message.
+
+        Returns
+        -------
+        tuple or None
+            The descriptor of the message (the offset, the size and the write position after
+            the message), which is passed to `read()`, or None if there is not enough free space.
+        """
+        n = len(data)
+        pos_write, pos_read = self._header.unpack_from(self._shm.buf, 0)
+        offset = pos_write % self._size
+        # The message is always stored in contiguous block: skip the end of the buffer if necessary
+        skip = self._size - offset if offset + n > self._size else 0
+        if n + skip > self._size - (pos_write - pos_read):
+            return None
+        offset = (offset + skip) % self._size
+        data_start = self._header.size + offset
+        self._shm.buf[data_start: data_start + n] = data
+        pos_write += skip + n
+        # Update the write position before the descriptor is sent, so that the space is not reused
+        #   if the writer process is restarted before the reader receives the message.
+        struct.pack_into("<Q", self._shm.buf, 0, pos_write)
+        return offset, n, pos_write
+
+    def read(self, offset, n, pos_end):
+        """
+        Copy the message from the buffer and release the space occupied by the message.
+        The messages must be read in the order in which they were written.
+
+        Parameters
+        ----------
+        offset, n, pos_end: int
+            The descriptor returned by `write()`.
+
+        Returns
+        -------
+        bytes
+            The message.
+        """
+        data_start = self._header.size + offset
+        data = bytes(self._shm.buf[data_start: data_start + n])
+        struct.pack_into("<Q", self._shm.buf, 8, pos_end)
+        return data
+
+    def close(self, *, unlink=False):
+        """
+        Close the buffer. The shared memory is released if ``unlink`` is True (called by the creator).
+        """
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
@@ -1,22 +1,144 @@
+import asyncio
+import concurrent.futures
 import threading
-import pprint
 import json
+import multiprocessing
+import selectors
+import socket
+import struct
+import zmq
+import zmq.asyncio
 from jsonrpc import JSONRPCResponseManager
 from jsonrpc.dispatcher import Dispatcher
+from jsonrpc.exceptions import JSONRPCInvalidRequest, JSONRPCInvalidRequestException
+from jsonrpc.jsonrpc import JSONRPCRequest
+from jsonrpc.jsonrpc2 import JSONRPC20Response
+
+from .codec import get_codec, ShmRingBuffer
+from .logging_setup import PPrintForLogging
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-class PipeJsonRpcReceive:
+class MessageConnection:
     """
-    The class contains functions for receiving and processing JSON RPC messages received on
-    communication pipe.
+    The end of a pipe that sends and receives messages encoded with the selected codec
+    (see `codec.get_codec()`). The interface is compatible with ``multiprocessing.Connection``
+    (``send``, ``recv``, ``poll``, ``fileno``), so the object may be registered with `ConnSelector`
+    or the event loop. The messages are written to the pipe as bytes, so there is no additional
+    pickling step. The function `send()` may be called from multiple threads.
+
+    If ring buffers in shared memory are provided, the messages with the size exceeding
+    ``shm_threshold`` are passed through the buffer and only short descriptors are sent over
+    the pipe. The messages are sent over the pipe if the buffer is full. Use
+    `create_message_pipe()` to create the pair of connections.
 
     Parameters
     ----------
     conn: multiprocessing.Connection
         Reference to bidirectional end of a pipe (multiprocessing.Pipe)
+    codec: str
+        Name of the codec.
+    shm_send: codec.ShmRingBuffer or None
+        The ring buffer for sent messages.
+    shm_recv: codec.ShmRingBuffer or None
+        The ring buffer for received messages.
+    shm_threshold: int
+        The minimum size (in bytes) of the encoded message passed through the ring buffer.
+    """
+    # The first byte of the message: the message is sent over the pipe or passed through shared memory
+    _TYPE_INLINE = b"I"
+    _TYPE_SHM = b"S"
+    _shm_descriptor = struct.Struct("<QQQ")
+
+    def __init__(self, conn, *, codec="pickle", shm_send=None, shm_recv=None, shm_threshold=65536):
+        self._conn = conn
+        self._codec = get_codec(codec)
+        self._shm_send = shm_send
+        self._shm_recv = shm_recv
+        self._shm_threshold = shm_threshold
+        self._send_lock = threading.Lock()
+
+    @property
+    def codec(self):
+        """
+        Name of the codec.
+        """
+        return self._codec.name
+
+    def send(self, msg):
+        """
+        Encode and send the message.
+        """
+        data = self._codec.encode(msg)
+        with self._send_lock:
+            if (self._shm_send is not None) and (len(data) >= self._shm_threshold):
+                descriptor = self._shm_send.write(data)
+                if descriptor is not None:
+                    self._conn.send_bytes(self._TYPE_SHM + self._shm_descriptor.pack(*descriptor))
+                    return
+            self._conn.send_bytes(self._TYPE_INLINE + data)
+
+    def recv(self):
+        """
+        Receive and decode the message. The function blocks until the message is available.
+        """
+        data = self._conn.recv_bytes()
+        if data[:1] == self._TYPE_SHM:
+            data = self._shm_recv.read(*self._shm_descriptor.unpack_from(data, 1))
+        else:
+            data = data[1:]
+        return self._codec.decode(data)
+
+    def poll(self, timeout=0.0):
+        return self._conn.poll(timeout)
+
+    def fileno(self):
+        return self._conn.fileno()
+
+    def close(self):
+        self._conn.close()
+
+
+def create_message_pipe(*, codec="pickle", shm_size=0, shm_threshold=65536):
+    """
+    Create the pair of connected `MessageConnection` objects. If ``shm_size`` is positive,
+    then a ring buffer of this size is created in shared memory for each direction
+    (requires Python 3.8+). The pipe should be created before the processes that use it
+    are started.
+
+    Parameters
+    ----------
+    codec: str
+        Name of the codec (see `codec.get_codec()`).
+    shm_size: int
+        Size of each ring buffer in bytes. Shared memory is not used if the size is 0.
+    shm_threshold: int
+        The minimum size of the encoded message passed through shared memory.
+
+    Returns
+    -------
+    MessageConnection, MessageConnection, list(codec.ShmRingBuffer)
+        The ends of the pipe and the list of created ring buffers. The buffers should be
+        closed by calling ``close(unlink=True)`` once the pipe is no longer used.
+    """
+    conn1, conn2 = multiprocessing.Pipe()
+    buffers = [ShmRingBuffer(shm_size), ShmRingBuffer(shm_size)] if shm_size > 0 else [None, None]
+    mc1 = MessageConnection(conn1, codec=codec, shm_send=buffers[0], shm_recv=buffers[1],
+                            shm_threshold=shm_threshold)
+    mc2 = MessageConnection(conn2, codec=codec, shm_send=buffers[1], shm_recv=buffers[0],
+                            shm_threshold=shm_threshold)
+    return mc1, mc2, [_ for _ in buffers if _ is not None]
+
+
+class ConnSelector:
+    """
+    Waits for messages on one or more pipe connections and passes the received messages
+    to the registered handlers. Waiting is implemented using ``selectors``, so the thread
+    that calls `run()` is idle until a message arrives and the messages are delivered
+    without any polling delay. The loop is stopped by calling `stop()` from any thread
+    (including the handlers).
 
     Examples
     --------
@@ -24,7 +146,105 @@ class PipeJsonRpcReceive:
     .. code-block:: python
 
         conn1, conn2 = multiprocessing.Pipe()
-        pc = PipeJsonRPC(conn=conn1)
+        cs = ConnSelector()
+
+        def handler(msg):
+            print(f"Message received: {msg}")
+
+        cs.register(conn1, handler)
+        thread = threading.Thread(target=cs.run)
+        thread.start()  # Wait and process messages
+        conn2.send("Testing")
+        cs.stop()  # Stop before exit to stop the thread.
+    """
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._stop = False
+
+        # The pair of sockets used to wake up the selector when the loop is stopped
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+
+    def register(self, conn, handler):
+        """
+        Register the connection.
+
+        Parameters
+        ----------
+        conn: multiprocessing.Connection
+            Reference to the end of a pipe (multiprocessing.Pipe)
+        handler: callable
+            The function that is called for each message received from `conn`.
+            The function accepts the received message as the only parameter.
+        """
+        self._selector.register(conn, selectors.EVENT_READ, handler)
+
+    def stop(self):
+        """
+        Stop the loop. The function may be called from any thread.
+        """
+        self._stop = True
+        try:
+            self._wakeup_send.send(b"\0")
+        except OSError:
+            pass  # The loop is already stopped or the buffer is full (the loop will be woken up)
+
+    def run(self):
+        """
+        Run the loop that waits for messages and passes them to handlers. The function
+        blocks until `stop()` is called or an exception is raised by the connection or a handler.
+        """
+        try:
+            while not self._stop:
+                for key, _ in self._selector.select():
+                    if key.data is None:
+                        self._wakeup_clear()
+                        continue
+                    conn, handler = key.fileobj, key.data
+                    while not self._stop and conn.poll():
+                        handler(conn.recv())
+        except Exception as ex:
+            logger.exception("Exception occurred while waiting for message: %s", str(ex))
+        finally:
+            self._stop = True
+            self._selector.close()
+            self._wakeup_recv.close()
+            self._wakeup_send.close()
+
+    def _wakeup_clear(self):
+        try:
+            while self._wakeup_recv.recv(1024):
+                pass
+        except OSError:
+            pass
+
+
+class PipeJsonRpcReceive:
+    """
+    The class contains functions for receiving and processing JSON RPC messages received on
+    communication pipe. Notifications are processed in the thread that receives messages
+    in the order in which they are received. Requests are processed in the thread pool, so that
+    slow requests do not delay notifications (e.g. heartbeats) or other requests. Responses
+    are sent in the order in which the requests are completed (the client is expected to
+    match the responses with requests by ID).
+
+    Parameters
+    ----------
+    conn: MessageConnection
+        Reference to bidirectional end of a pipe. Messages are expected to be encoded using
+        JSON codec (see `create_message_pipe()`). Responses are sent from multiple threads.
+    max_workers: int
+        Maximum number of requests processed concurrently.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        conn1, conn2, _ = create_message_pipe(codec="json")
+        pc = PipeJsonRpcReceive(conn=conn1)
 
         def func():
             print("Testing")
@@ -34,22 +254,31 @@ class PipeJsonRpcReceive:
         # The function 'func' is called when the message with method=="some_method" is received
         pc.stop()  # Stop before exit to stop the thread.
     """
-    def __init__(self, conn):
+    def __init__(self, conn, *, max_workers=4):
         self._conn = conn
         self._dispatcher = Dispatcher()  # json-rpc dispatcher
-        self._stop_thread = False  # Set True to exit the thread
+        self._conn_selector = None
+        self._thread_conn = None
+        self._max_workers = max_workers
+        self._executor = None  # Thread pool for processing requests
 
     def start(self):
         """
         Start processing of the pipe messages
         """
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers,
+                                                               thread_name_prefix="RE Watchdog Request")
         self._start_conn_thread()
 
     def stop(self):
         """
         Stop processing of the pipe messages (and exit the tread)
         """
-        self._stop_thread = True
+        if self._conn_selector:
+            self._conn_selector.stop()
+        if self._executor:
+            # Don't wait for the requests that are currently processed
+            self._executor.shutdown(wait=False)
 
     def __del__(self):
         self.stop()
@@ -69,34 +298,193 @@ class PipeJsonRpcReceive:
         self._dispatcher.add_method(handler, name)
 
     def _start_conn_thread(self):
-        self._thread_conn = threading.Thread(target=self._receive_conn_thread,
+        self._conn_selector = ConnSelector()
+        self._conn_selector.register(self._conn, self._conn_received)
+        self._thread_conn = threading.Thread(target=self._conn_selector.run,
                                              name="RE Watchdog Comm",
                                              daemon=True)
         self._thread_conn.start()
 
-    def _receive_conn_thread(self):
-        while True:
-            if self._conn.poll(0.1):
-                try:
-                    msg = self._conn.recv()
-                    # Messages should be handled in the event loop
-                    self._conn_received(msg)
-                except Exception as ex:
-                    logger.exception("Exception occurred while waiting for "
-                                     "RE Manager-> Watchdog message: %s", str(ex))
-                    break
-                if self._stop_thread:  # Exit thread
-                    break
-
     def _conn_received(self, msg):
 
-        if logger.level < 11:  # Print output only if logging level is DEBUG (10) or less
-            msg_json = json.loads(msg)
+        if logger.isEnabledFor(logging.DEBUG):
             # We don't want to print 'heartbeat' messages
-            if not isinstance(msg_json, dict) or (msg_json["method"] != "heartbeat"):
-                logger.debug("Command received RE Manager->Watchdog: %s", pprint.pformat(msg_json))
+            if not isinstance(msg, dict) or (msg.get("method", None) != "heartbeat"):
+                logger.debug("Command received RE Manager->Watchdog: %s", PPrintForLogging(msg))
+
+        # The message is decoded by the connection (JSON codec)
+        try:
+            request = JSONRPCRequest.from_data(msg)
+        except JSONRPCInvalidRequestException:
+            self._conn.send(JSONRPC20Response(error=JSONRPCInvalidRequest()._data).data)
+            return
+
+        if getattr(request, "is_notification", False):
+            self._handle_request(request)
+        else:
+            try:
+                self._executor.submit(self._handle_request, request)
+            except RuntimeError:
+                # The executor is shut down
+                logger.warning("Request RE Manager->Watchdog is ignored: %s", PPrintForLogging(msg))
+
+    def _handle_request(self, request):
+        try:
+            response = JSONRPCResponseManager.handle_request(request, self._dispatcher)
+            if response:
+                self._conn.send(response.data)
+        except Exception as ex:
+            logger.exception("Failed to process request RE Manager->Watchdog: %s", str(ex))
+
+
+class ZMQCommSendAsync:
+    """
+    Asynchronous client for sending requests to RE Manager over ZeroMQ. The requests are sent
+    through a single DEALER socket, so any number of requests may be in flight at the same time.
+    Each request is tagged with a unique ID, which is returned by RE Manager (ROUTER socket)
+    with the reply and used to pass the reply to the waiting coroutine. Timeout of a request
+    does not affect other requests. If the socket fails, it is closed, the pending requests
+    fail and a new socket is created for the next request.
+
+    The socket is created when the first request is sent, so the object may be created
+    before the event loop is started, but it must be used from a single event loop.
+
+    Parameters
+    ----------
+    zmq_server_address: str
+        Address of the ZeroMQ socket of RE Manager.
+    timeout: float
+        Default timeout (in seconds) for waiting for the reply.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        zmq_comm = ZMQCommSendAsync()
+
+        async def communicate():
+            msg = await zmq_comm.send_message(command="queue_view")
+            zmq_comm.close()
+    """
+    def __init__(self, *, zmq_server_address="tcp://localhost:5555", timeout=2.0):
+        self._zmq_server_address = zmq_server_address
+        self._timeout = timeout
+
+        self._ctx = None
+        self._zmq_socket = None
+        self._task_receive = None
+        self._request_id = 0
+        self._pending_requests = {}  # Futures of the requests waiting for reply (key: request ID)
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        Close the socket. The pending requests are cancelled.
+        """
+        self._close_socket()
+        if self._ctx is not None:
+            self._ctx.term()
+            self._ctx = None
+
+    def _open_socket(self):
+        if self._ctx is None:
+            self._ctx = zmq.asyncio.Context()
+        self._zmq_socket = self._ctx.socket(zmq.DEALER)
+        # Don't queue requests while RE Manager is not connected: the requests time out
+        #   instead of being executed after RE Manager is restarted.
+        self._zmq_socket.setsockopt(zmq.IMMEDIATE, 1)
+        self._zmq_socket.connect(self._zmq_server_address)
+        self._task_receive = asyncio.ensure_future(self._receive_replies(self._zmq_socket))
+        logger.info("Connected to ZeroMQ server '%s'", self._zmq_server_address)
+
+    def _close_socket(self, exception=None):
+        if self._task_receive is not None:
+            if not self._task_receive.done():
+                self._task_receive.cancel()
+            self._task_receive = None
+        if self._zmq_socket is not None:
+            self._zmq_socket.close(linger=0)
+            self._zmq_socket = None
+        for fut in self._pending_requests.values():
+            if not fut.done():
+                if exception is None:
+                    fut.cancel()
+                else:
+                    fut.set_exception(exception)
+        self._pending_requests.clear()
+
+    async def _receive_replies(self, zmq_socket):
+        """
+        Receive replies and pass them to the coroutines waiting for the replies.
+        """
+        try:
+            while True:
+                frames = await zmq_socket.recv_multipart()
+                # The message: request ID, empty delimiter frame, JSON encoded reply
+                request_id, msg_json = frames[0], frames[-1]
+                fut = self._pending_requests.pop(request_id, None)
+                if fut is None:
+                    # The request is timed out: discard the reply
+                    logger.warning("Received reply to unknown request (ID %s)", request_id.decode())
+                elif not fut.done():
+                    try:
+                        fut.set_result(json.loads(msg_json))
+                    except Exception as ex:
+                        fut.set_exception(ex)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.exception("ZeroMQ communication failed: %s", str(ex))
+            # The socket is replaced for the next request
+            if zmq_socket is self._zmq_socket:
+                self._task_receive = None
+                self._close_socket(exception=RuntimeError(f"ZeroMQ communication failed: {str(ex)}"))
+
+    async def send_message(self, *, command, value=None, timeout=None):
+        """
+        Send the request to RE Manager and wait for the reply.
+
+        Parameters
+        ----------
+        command: str
+            The command.
+        value: object
+            Parameters of the command. Must be JSON serializable.
+        timeout: float or None
+            Timeout (in seconds). The default timeout is used if None.
+
+        Returns
+        -------
+        dict
+            The reply from RE Manager.
+
+        Raises
+        ------
+        asyncio.TimeoutError
+            No reply was received before timeout.
+        RuntimeError
+            Communication failed.
+        """
+        timeout = self._timeout if timeout is None else timeout
+
+        if self._zmq_socket is None:
+            self._open_socket()
+
+        self._request_id += 1
+        request_id = str(self._request_id).encode()
+        fut = asyncio.get_event_loop().create_future()
+        self._pending_requests[request_id] = fut
+
+        msg = {"command": command, "value": value}
+
+        async def communicate(zmq_socket):
+            await zmq_socket.send_multipart([request_id, b"", json.dumps(msg).encode()])
+            return await fut
 
-        response = JSONRPCResponseManager.handle(msg, self._dispatcher)
-        if response:
-            response = response.json
-            self._conn.send(response)
+        try:
+            return await asyncio.wait_for(communicate(self._zmq_socket), timeout=timeout)
+        finally:
+            self._pending_requests.pop(request_id, None)
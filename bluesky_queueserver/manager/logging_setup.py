@@ -0,0 +1,107 @@
+import logging
+import pprint
+
+
+class _Summary:
+    """
+    Placeholder that replaces the omitted part of a large payload. ``repr()`` returns
+    the message without quotes, so the placeholder looks natural in pretty-printed output.
+    """
+    def __init__(self, msg):
+        self._msg = msg
+
+    def __repr__(self):
+        return f"<{self._msg}>"
+
+
+def summarize_payload(value, *, max_items=10, max_str_len=200, max_depth=5):
+    """
+    Create the copy of the payload suitable for logging. Lists, tuples and dictionaries with
+    more than ``max_items`` elements are truncated and the placeholder with the total number
+    of items is added. Long strings and bytes are truncated and the total size is displayed.
+    The nested containers deeper than ``max_depth`` are replaced by the placeholder.
+
+    Parameters
+    ----------
+    value: object
+        The payload (typically JSON serializable message).
+    max_items: int
+        Maximum number of displayed items of a list, tuple or dictionary.
+    max_str_len: int
+        Maximum number of displayed characters of a string or bytes.
+    max_depth: int
+        Maximum depth of nested containers.
+
+    Returns
+    -------
+    object
+        Summarized copy of the payload. The original payload is not modified.
+    """
+    def summarize(v, depth):
+        if isinstance(v, (str, bytes)):
+            if len(v) > max_str_len:
+                units = "characters" if isinstance(v, str) else "bytes"
+                return _Summary(f"{v[:max_str_len]!r}... {len(v)} {units} total")
+            return v
+        elif isinstance(v, (list, tuple, dict)):
+            if depth >= max_depth:
+                return _Summary(f"{type(v).__name__} of {len(v)} items")
+            if isinstance(v, dict):
+                summary = {k: summarize(v[k], depth + 1) for k in list(v)[:max_items]}
+                if len(v) > max_items:
+                    summary["..."] = _Summary(f"{len(v)} items total")
+                return summary
+            summary = [summarize(_, depth + 1) for _ in v[:max_items]]
+            if len(v) > max_items:
+                summary.append(_Summary(f"{len(v)} items total"))
+            return tuple(summary) if isinstance(v, tuple) else summary
+        return v
+
+    return summarize(value, 0)
+
+
+class PPrintForLogging:
+    """
+    Wrapper for the payload passed to the logger as an argument. The payload is summarized
+    (see `summarize_payload()`) and pretty-printed only if the log record is actually
+    emitted, so logging of large messages costs nothing if the logging level is disabled.
+
+    Parameters
+    ----------
+    msg: object
+        The payload.
+    max_items, max_str_len, max_depth: int
+        Parameters passed to `summarize_payload()`.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        logger.info("ZeroMQ server received request: %s", PPrintForLogging(msg_in))
+    """
+    def __init__(self, msg, *, max_items=10, max_str_len=200, max_depth=5):
+        self._msg = msg
+        self._max_items = max_items
+        self._max_str_len = max_str_len
+        self._max_depth = max_depth
+
+    def __str__(self):
+        msg = summarize_payload(self._msg, max_items=self._max_items,
+                                max_str_len=self._max_str_len, max_depth=self._max_depth)
+        return pprint.pformat(msg)
+
+
+def setup_loggers(*, log_level=logging.DEBUG, name="bluesky_queueserver"):
+    """
+    Configure logging for the package.
+
+    Parameters
+    ----------
+    log_level: int or str
+        Logging level for the package loggers.
+    name: str
+        Name of the top level logger of the package.
+    """
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger(name).setLevel(log_level)
@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import os
+import sys
+import threading
+import time as ttime
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _frame_name(frame):
+    """
+    Returns the name of the function executed in the frame, e.g. ``manager.py:_ping_handler``.
+    """
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)  # 'co_qualname' is available in Python 3.11+
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+def _find_offending_function(frame):
+    """
+    Find the function that blocks the event loop in the stack of the thread running the loop.
+    The innermost request handler (function name ends with ``_handler``) is selected if there
+    is one in the stack, otherwise the innermost function of the package, otherwise the
+    innermost function.
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    innermost, innermost_package = frame, None
+    while frame is not None:
+        if frame.f_code.co_name.endswith("_handler"):
+            return _frame_name(frame)
+        if (innermost_package is None) and frame.f_code.co_filename.startswith(package_dir):
+            innermost_package = frame
+        frame = frame.f_back
+    return _frame_name(innermost_package or innermost)
+
+
+class LoopLagMonitor:
+    """
+    Monitors the lag of the event loop. The coroutine running in the loop (`run()`) periodically
+    updates the time stamp. The monitor thread checks the time stamp and, if the loop is blocked
+    for longer than ``threshold``, samples the stack of the thread that runs the loop to find the
+    offending function (typically the request handler). The duration of the stall is measured once
+    the loop is unblocked. The longest stalls are kept and reported by `get_stats()`, each stall
+    is logged as a warning.
+
+    Parameters
+    ----------
+    interval: float
+        The period of updates of the time stamp in the loop, s.
+    threshold: float
+        The lag that is considered a stall, s.
+    n_stalls: int
+        The number of longest stalls that are kept.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        monitor = LoopLagMonitor()
+        task = asyncio.ensure_future(monitor.run())
+        ...
+        task.cancel()
+        print(monitor.get_stats())
+    """
+    def __init__(self, *, interval=0.05, threshold=0.2, n_stalls=10):
+        self._interval = interval
+        self._threshold = threshold
+        self._n_stalls = n_stalls
+
+        self._lock = threading.Lock()
+        self._time_tick = None
+        self._loop_thread_id = None
+        # Name of the function that blocks the loop (determined by the monitor thread)
+        self._offender = None
+
+        self._lag_max = 0.0
+        self._lag_last = 0.0
+        self._n_stalls_total = 0
+        # Heap of the longest stalls: tuples (duration, sequence number, function name, time)
+        self._stalls = []
+
+        self._thread = None
+        self._thread_stop = threading.Event()
+
+    async def run(self):
+        """
+        The coroutine that measures the lag. Cancel the task to stop monitoring.
+        """
+        self._loop_thread_id = threading.get_ident()
+        self._time_tick = ttime.monotonic()
+        self._thread_stop.clear()
+        self._thread = threading.Thread(target=self._monitor_thread, name="RE Manager Loop Monitor", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                t_start = ttime.monotonic()
+                await asyncio.sleep(self._interval)
+                t_now = ttime.monotonic()
+                self._register_lag(t_now - t_start - self._interval)
+                with self._lock:
+                    self._time_tick = t_now
+        finally:
+            self._thread_stop.set()
+            self._thread.join()
+
+    def _register_lag(self, lag):
+        with self._lock:
+            offender, self._offender = self._offender, None
+            self._lag_last = lag
+            self._lag_max = max(self._lag_max, lag)
+            if lag < self._threshold:
+                return
+            self._n_stalls_total += 1
+            offender = offender or "unknown"
+            stall = (lag, self._n_stalls_total, offender, ttime.time())
+            if len(self._stalls) < self._n_stalls:
+                heapq.heappush(self._stalls, stall)
+            else:
+                heapq.heappushpop(self._stalls, stall)
+        logger.warning("Event loop of RE Manager was blocked for %.3f s by %s", lag, offender)
+
+    def _monitor_thread(self):
+        while not self._thread_stop.wait(self._interval):
+            with self._lock:
+                blocked = ttime.monotonic() - self._time_tick > self._threshold
+                sampled = self._offender is not None
+            if blocked and not sampled:
+                frame = sys._current_frames().get(self._loop_thread_id, None)
+                if frame is not None:
+                    offender = _find_offending_function(frame)
+                    with self._lock:
+                        self._offender = offender
+
+    def get_stats(self):
+        """
+        Returns the statistics: the last and the maximum lag, the number of stalls and the list
+        of longest stalls (dictionaries with keys ``duration``, ``handler`` and ``time``)
+        sorted by duration.
+
+        Returns
+        -------
+        dict
+            The statistics.
+        """
+        with self._lock:
+            stalls = sorted(self._stalls, reverse=True)
+            return {"lag_last": self._lag_last,
+                    "lag_max": self._lag_max,
+                    "n_stalls": self._n_stalls_total,
+                    "longest_stalls": [{"duration": _[0], "handler": _[2], "time": _[3]} for _ in stalls]}
@@ -1,15 +1,22 @@
 import asyncio
+import concurrent.futures
+import functools
 import json
-import aioredis
+import pprint
 import zmq
 import zmq.asyncio
 from multiprocessing import Process
-import threading
 import time as ttime
-import pprint
 import uuid
 
 from .worker import DB
+from .plan_queue_ops import PlanQueueOperations
+from .plan_registry import PlanValidator
+from .run_catalog import RunCatalog
+from .loop_monitor import LoopLagMonitor
+from .metrics import Metrics
+from .plan_stats import PlanStats
+from .logging_setup import PPrintForLogging
 
 import logging
 
@@ -34,14 +41,18 @@ class RunEngineManager(Process):
 
     Parameters
     ----------
-    conn_watchdog: multiprocessing.Connection
-        One end of bidirectional (input/output) for communication to Watchdog process.
-    conn_worker: multiprocessing.Connection
+    conn_watchdog: MessageConnection
+        One end of bidirectional (input/output) for communication to Watchdog process
+        (JSON codec).
+    conn_worker: multiprocessing.Connection or MessageConnection
         One end of bidirectional (input/output) for communication to RE Worker process.
+    zmq_max_requests: int
+        Maximum number of ZMQ requests that are processed concurrently. New requests
+        are not received from the socket while the limit is reached.
     args, kwargs
         `args` and `kwargs` of the `multiprocessing.Process`
     """
-    def __init__(self, *args, conn_watchdog, conn_worker, **kwargs):
+    def __init__(self, *args, conn_watchdog, conn_worker, zmq_max_requests=100, **kwargs):
 
         if not conn_watchdog:
             raise RuntimeError("Value of the parameter 'conn_watchdog' is invalid: %s.",
@@ -49,6 +60,9 @@ class RunEngineManager(Process):
         if not conn_worker:
             raise RuntimeError("Value of the parameter 'conn_worker' is invalid: %s.",
                                str(conn_worker))
+        if zmq_max_requests < 1:
+            raise RuntimeError("Value of the parameter 'zmq_max_requests' is invalid: %s.",
+                               str(zmq_max_requests))
 
         super().__init__(*args, **kwargs)
         self._re_worker = None
@@ -59,10 +73,10 @@ class RunEngineManager(Process):
         self._manager_stopping = False  # Set True to exit manager (by _stop_manager_handler)
 
         self._environment_exists = False
-
-        # Threads must be started in the 'run' function so that they run in the correct process.
-        self._thread_conn_worker = None
-        self._thread_conn_watchdog = None
+        # Address of ZMQ socket used by RE Worker to publish documents (None if documents are not published)
+        self._document_stream_address = None
+        # Lock that prevents concurrent creation/closing of RE environment
+        self._lock_environment = None
 
         self._loop = None
 
@@ -70,8 +84,46 @@ class RunEngineManager(Process):
         self._ctx = None
         self._zmq_socket = None
         self._ip_zmq_server = "tcp://*:5555"
-
-        self._r_pool = None
+        self._zmq_max_requests = zmq_max_requests
+        self._zmq_request_semaphore = None  # Limits the number of concurrently processed requests
+        self._zmq_request_tasks = set()  # Tasks that process ZMQ requests
+        self._event_zmq_stop = None  # The event is set to stop ZMQ server
+        self._zmq_restart_delay = 1  # Delay (s) before the failed ZMQ receiver is restarted
+
+        # Events (changes of the queue and RE Manager state) are published using ZMQ PUB socket.
+        #   The messages consist of two frames: event name (used as a topic) and JSON encoded event.
+        self._zmq_pub_socket = None
+        self._ip_zmq_publisher = "tcp://*:5556"
+        self._event_seq_num = 0  # Sequence number of the published event
+
+        self._plan_queue = None  # Object of class PlanQueueOperations (operations with Redis)
+
+        # Plans are validated using the registry of plans and devices received from RE Worker.
+        #   The registry is requested each time the environment is created and kept after
+        #   the environment is closed. Plans are not validated before the registry is received.
+        self._plan_validator = PlanValidator()
+        self._fut_worker_plan_registry = None
+
+        # Blocking calls (e.g. access to the database) are executed in the thread pool,
+        #   so that they don't block the event loop that serves requests and sends heartbeats.
+        self._executor = None
+        self._executor_max_workers = 4
+        # Messages are sent to RE Worker from a separate thread. Single thread guarantees
+        #   that the messages are sent in the order in which they were submitted.
+        self._worker_send_executor = None
+        # Reports the longest stalls of the event loop
+        self._loop_monitor = LoopLagMonitor()
+        self._loop_monitor_task = None
+
+        # Instrumentation: latency of request handlers, Redis calls, pipe messages etc.
+        self._metrics = Metrics()
+        self._declare_metrics()
+
+        # Rolling statistics of timings of executed plans (reported by RE Worker)
+        self._plan_stats = PlanStats()
+
+        # Index of runs in 'temp' database (used by 'list_runs' and 'print_db_uids')
+        self._run_catalog = RunCatalog(DB[0])
 
         self._heartbeat_generator_task = None  # Task for heartbeat generator
 
@@ -79,68 +131,100 @@ class RunEngineManager(Process):
         self._event_worker_closed = None
         self._fut_worker_status = None
 
-        self._fut_watchdog_comm = None  # Future for waiting for messages from watchdog
-        self._event_watchdog_comm = None  # Event which is set when message is expected from watchdog
-        # Lock that prevents sending of the next message before response
-        #   to the previous message is received
-        self._lock_watchdog_comm = None
-        self._timeout_watchdog_comm = 0.5  # Timeout (time to wait for response to a message)
-
-    def _start_conn_threads(self):
-        self._thread_conn_watchdog = threading.Thread(target=self._receive_packet_watchdog_thread,
-                                                      name="RE QServer Comm1",
-                                                      daemon=True)
-        self._thread_conn_watchdog.start()
-        self._thread_conn_worker = threading.Thread(target=self._receive_packet_worker_thread,
-                                                    name="RE QServer Comm2",
-                                                    daemon=True)
-        self._thread_conn_worker.start()
+        # Futures of the requests to Watchdog waiting for response (key: JSON-RPC request ID).
+        #   Any number of requests may be waiting for response at the same time.
+        self._watchdog_pending_requests = {}
+        self._timeout_watchdog_comm = 0.5  # Default timeout (time to wait for response to a request)
 
-    async def _heartbeat_generator(self):
+    def _start_conn_readers(self):
         """
-        Heartbeat generator for Watchdog (indicates that the loop is running)
+        Register the pipe connections with the event loop. The messages are processed
+        as soon as they arrive. Readers must be registered in the 'run' function so that
+        they run in the correct process.
         """
-        t_period = 0.5
-        while True:
-            await asyncio.sleep(t_period)
-            await self._watchdog_send_heartbeat()
+        self._loop.add_reader(self._watchdog_conn.fileno(), self._receive_packet_watchdog)
+        self._loop.add_reader(self._worker_conn.fileno(), self._receive_packet_worker)
 
-    # ======================================================================
-    #          Communication with Redis
+    def _stop_conn_readers(self):
+        self._loop.remove_reader(self._watchdog_conn.fileno())
+        self._loop.remove_reader(self._worker_conn.fileno())
+
+    def _publish_event(self, event, **kwargs):
+        """
+        Publish the event. Publishing never blocks: the event is dropped if there are
+        no subscribers or the subscribers are too slow to receive events.
+
+        Parameters
+        ----------
+        event: str
+            Event name. Used as a topic of the published message, so subscribers
+            may subscribe to selected events.
+        kwargs
+            Event parameters. Must be JSON serializable.
+        """
+        if self._zmq_pub_socket is None:
+            return
+        self._event_seq_num += 1
+        msg = {"event": event, "seq_num": self._event_seq_num, "time": ttime.time()}
+        msg.update(kwargs)
+        try:
+            self._zmq_pub_socket.send_multipart([event.encode(), json.dumps(msg).encode()],
+                                                flags=zmq.NOBLOCK)
+        except Exception as ex:
+            logger.error("Failed to publish the event '%s': %s", event, str(ex))
 
-    async def _set_running_plan_info(self, plan):
+    def _queue_changed(self, queue_status):
         """
-        Write info on the currently running to Redis
+        Called each time the queue or the running plan is changed.
         """
-        await self._r_pool.set("running_plan", json.dumps(plan))
+        self._publish_event("queue_changed", **queue_status)
 
-    async def _get_running_plan_info(self):
+    def _declare_metrics(self):
         """
-        Read info on the currently running plan from Redis
+        Declare the metrics collected by RE Manager (see `_metrics_handler`). Metrics
+        of Redis calls are declared by `PlanQueueOperations`.
         """
-        return json.loads(await self._r_pool.get("running_plan"))
+        m = self._metrics
+        m.declare_histogram("request_duration_seconds", "Time of processing of ZMQ requests by command")
+        m.declare_counter("request_failures_total", "Number of ZMQ requests that failed with exception")
+        m.declare_counter("pipe_messages_total", "Number of messages sent and received via pipes")
+        m.declare_histogram("worker_request_duration_seconds",
+                            "Round-trip time of requests to RE Worker via pipe")
+        m.declare_gauge("queue_length", "Number of plans in the queue")
+        m.declare_gauge("queue_version", "Version of the queue")
+        m.declare_gauge("plan_running", "1 if a plan is running, 0 otherwise")
+        m.declare_gauge("environment_exists", "1 if RE environment exists, 0 otherwise")
+        m.declare_counter("published_events_total", "Number of events published on ZMQ PUB socket")
+        m.declare_gauge("loop_lag_seconds", "The last measured lag of the event loop")
+        m.declare_gauge("loop_lag_max_seconds", "The maximum lag of the event loop")
+        m.declare_counter("loop_stalls_total", "Number of times the event loop was blocked for too long")
 
-    async def _clear_running_plan_info(self):
+    async def _run_in_executor(self, func, *args, **kwargs):
         """
-        Clear info on the currently running plan in Redis.
+        Execute the blocking function in the thread pool and return the result.
         """
-        await self._set_running_plan_info({})
+        return await self._loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
 
-    async def _exists_running_plan_info(self):
+    def _worker_send(self, msg):
         """
-        Check if plan exists in the ppol
+        Send the message to RE Worker. The message is encoded and written to the pipe in
+        a separate thread, so the function never blocks the event loop.
         """
-        return await self._r_pool.exists("running_plan")
+        def check_result(fut):
+            if fut.exception() is not None:
+                logger.error("Failed to send the message to RE Worker: %s", str(fut.exception()))
 
-    async def _init_running_plan_info(self):
+        self._worker_send_executor.submit(self._worker_conn.send, msg).add_done_callback(check_result)
+        self._metrics.inc("pipe_messages_total", peer="worker", direction="sent")
+
+    async def _heartbeat_generator(self):
         """
-        Initialize running plan info: create Redis entry that hold empty plan ({})
-        a record doesn't exist.
+        Heartbeat generator for Watchdog (indicates that the loop is running)
         """
-        # Create entry 'running_plan' in the pool if it does not exist yet
-        if (not await self._exists_running_plan_info()) \
-                or (not await self._get_running_plan_info()):
-            await self._clear_running_plan_info()
+        t_period = 0.5
+        while True:
+            await asyncio.sleep(t_period)
+            await self._watchdog_send_heartbeat()
 
     # ======================================================================
     #          Functions that implement functionality of the server
@@ -161,9 +245,12 @@ class RunEngineManager(Process):
         except Exception as ex:
             logger.exception("Failed to start_Worker: %s", str(ex))
 
-    async def _started_re_worker(self):
+    async def _started_re_worker(self, document_stream_address=None):
         # Report from RE Worker received: environment was created successfully.
+        self._document_stream_address = document_stream_address
+        await self._load_plan_registry()
         self._event_worker_created.set()
+        self._publish_event("environment_created", document_stream_address=document_stream_address)
 
     async def _stop_re_worker(self):
         """
@@ -175,7 +262,7 @@ class RunEngineManager(Process):
             self._event_worker_closed = asyncio.Event()
 
             msg = {"type": "command", "value": "quit"}
-            self._worker_conn.send(msg)
+            self._worker_send(msg)
 
             logger.debug("Waiting for RE Worker to close ...")
             await self._event_worker_closed.wait()
@@ -194,7 +281,9 @@ class RunEngineManager(Process):
 
     async def _stopped_re_worker(self):
         # Report from RE Worker received: environment was closed successfully.
+        self._document_stream_address = None
         self._event_worker_closed.set()
+        self._publish_event("environment_closed")
 
     async def _is_worker_alive(self):
         return await self._watchdog_is_worker_alive()
@@ -203,13 +292,54 @@ class RunEngineManager(Process):
         self._fut_worker_status = self._loop.create_future()
 
         msg = {"type": "request", "value": "status"}
-        self._worker_conn.send(msg)
+        t_start = ttime.perf_counter()
+        self._worker_send(msg)
 
-        return await self._fut_worker_status
+        status = await self._fut_worker_status
+        self._metrics.observe("worker_request_duration_seconds", ttime.perf_counter() - t_start, request="status")
+        return status
 
     async def _worker_status_received(self, status):
         self._fut_worker_status.set_result(status)
 
+    async def _worker_plan_registry_request(self):
+        self._fut_worker_plan_registry = self._loop.create_future()
+
+        msg = {"type": "request", "value": "plan_registry"}
+        t_start = ttime.perf_counter()
+        self._worker_send(msg)
+
+        registry = await self._fut_worker_plan_registry
+        self._metrics.observe("worker_request_duration_seconds", ttime.perf_counter() - t_start,
+                              request="plan_registry")
+        return registry
+
+    async def _worker_plan_registry_received(self, registry):
+        self._fut_worker_plan_registry.set_result(registry)
+
+    async def _load_plan_registry(self, timeout=5):
+        """
+        Request the registry of plans and devices from RE Worker and use it for validation of plans.
+        """
+        try:
+            registry = await asyncio.wait_for(self._worker_plan_registry_request(), timeout=timeout)
+            self._plan_validator.set_registry(registry)
+            logger.info("Registry of plans and devices is loaded: %d plans, %d devices",
+                        len(registry["plans"]), len(registry["devices"]))
+        except Exception as ex:
+            logger.exception("Failed to load the registry of plans and devices: %s", str(ex))
+
+    def _validate_plans(self, plans):
+        """
+        Validate the plans. Returns the error message for the first invalid plan
+        or an empty string if all plans are valid.
+        """
+        for n, plan in enumerate(plans):
+            success, msg = self._plan_validator.validate_plan(plan)
+            if not success:
+                return f"Plan #{n + 1} is invalid: {msg}" if len(plans) > 1 else f"Plan is invalid: {msg}"
+        return ""
+
     async def _run_task(self):
         """
         Upload the plan to the worker process for execution.
@@ -217,13 +347,9 @@ class RunEngineManager(Process):
         "args" (list of args), "kwargs" (list of kwargs). Only the plan name is mandatory.
         Names of plans and devices are strings.
         """
-        n_pending_plans = await self._r_pool.llen('plan_queue')
-        logger.info("Starting a new plan: %d plans are left in the queue", n_pending_plans)
-
-        new_plan = await self._r_pool.lpop('plan_queue')
-        if new_plan is not None:
-            new_plan = json.loads(new_plan)
-            await self._set_running_plan_info(new_plan)
+        new_plan, n_pending_plans = await self._plan_queue.set_next_plan_as_running()
+        if new_plan:
+            logger.info("Starting a new plan: %d plans are left in the queue", n_pending_plans)
 
             plan_name = new_plan["name"]
             args = new_plan["args"] if "args" in new_plan else []
@@ -234,49 +360,68 @@ class RunEngineManager(Process):
                    "value": {"name": plan_name,
                              "args": args,
                              "kwargs": kwargs,
-                             "plan_uid": plan_uid
+                             "plan_uid": plan_uid,
+                             "time_dispatched": ttime.time(),
                              }
                    }
 
-            self._worker_conn.send(msg)
+            self._worker_send(msg)
+            self._publish_event("plan_started", plan_uid=plan_uid, name=plan_name,
+                                n_plans=n_pending_plans)
             return True
         else:
             logger.info("Queue is empty")
             return False
 
+    def _add_plan_stats_record(self, plan, plan_state, timing):
+        """
+        Add the timings of the finished plan (reported by RE Worker) to the plan statistics.
+        The time the plan spent in the queue is computed from the time the plan was added
+        to the queue and the time the plan was dispatched to RE Worker.
+        """
+        time_added = plan.get("time_added", None)
+        time_dispatched = timing.get("time_dispatched", None)
+        time_queued = None
+        if (time_added is not None) and (time_dispatched is not None):
+            time_queued = max(time_dispatched - time_added, 0)
+        record = {"plan_uid": plan.get("plan_uid", None),
+                  "name": plan.get("name", None),
+                  "plan_state": plan_state,
+                  "time_finished": ttime.time(),
+                  "time_queued": time_queued,
+                  "time_to_start": timing.get("time_to_start", None),
+                  "time_run": timing.get("time_run", None),
+                  "time_db_insert": timing.get("time_db_insert", None),
+                  "n_documents": timing.get("n_documents", None),
+                  "n_documents_db_pending": timing.get("n_documents_db_pending", None)}
+        self._plan_stats.add_record(record)
+
     def _pause_run_engine(self, option):
         """
         Pause execution of a running plan. Run Engine must be in 'running' state in order for
         the request to pause to be accepted by RE Worker.
         """
         msg = {"type": "command", "value": "pause", "option": option}
-        self._worker_conn.send(msg)
+        self._worker_send(msg)
 
     def _continue_run_engine(self, option):
         """
         Continue handling of a paused plan.
         """
         msg = {"type": "command", "value": "continue", "option": option}
-        self._worker_conn.send(msg)
+        self._worker_send(msg)
 
     def _print_db_uids(self):
         """
         Prints the UIDs of the scans in 'temp' database. Just for the demo.
         Not part of future API.
         """
+        runs, n_runs = self._run_catalog.list_runs()
         print("\n===================================================================")
         print("             The contents of 'temp' database.")
         print("-------------------------------------------------------------------")
-        n_runs = 0
-        db_instance = DB[0]
-        for run_id in range(1, 100000):
-            try:
-                hdr = db_instance[run_id]
-                uid = hdr.start["uid"]
-                n_runs += 1
-                print(f"Run ID: {run_id}   UID: {uid}")
-            except Exception:
-                break
+        for run in runs:
+            print(f"Scan ID: {run['scan_id']}   UID: {run['uid']}")
         print("-------------------------------------------------------------------")
         print(f"  Total of {n_runs} runs were found in 'temp' database.")
         print("===================================================================\n")
@@ -284,30 +429,33 @@ class RunEngineManager(Process):
     # ================================================================================
     #         Functions for communication with the worker process (via Pipe)
 
-    def _receive_packet_watchdog_thread(self):
-        while True:
-            if self._watchdog_conn.poll(0.1):
-                try:
-                    msg_json = self._watchdog_conn.recv()
-                    msg = json.loads(msg_json)
-                    logger.debug("Message Watchdog->Manager received: '%s'", pprint.pformat(msg))
-                    # Messages should be handled in the event loop
-                    self._loop.call_soon_threadsafe(self._conn_watchdog_received, msg)
-                except Exception as ex:
-                    logger.exception("Exception occurred while waiting for packet: %s", str(ex))
-                    break
-
-    def _receive_packet_worker_thread(self):
-        while True:
-            if self._worker_conn.poll(0.1):
-                try:
-                    msg = self._worker_conn.recv()
-                    logger.debug("Message received from RE Worker: %s", pprint.pformat(msg))
-                    # Messages should be handled in the event loop
-                    self._loop.call_soon_threadsafe(self._conn_worker_received, msg)
-                except Exception as ex:
-                    logger.exception("Exception occurred while waiting for packet: %s", str(ex))
-                    break
+    def _receive_packet_watchdog(self):
+        """
+        Called by the event loop when the pipe connected to Watchdog is ready for reading.
+        """
+        try:
+            while self._watchdog_conn.poll():
+                msg = self._watchdog_conn.recv()
+                self._metrics.inc("pipe_messages_total", peer="watchdog", direction="received")
+                logger.debug("Message Watchdog->Manager received: '%s'", PPrintForLogging(msg))
+                self._conn_watchdog_received(msg)
+        except Exception as ex:
+            logger.exception("Exception occurred while waiting for packet: %s", str(ex))
+            self._loop.remove_reader(self._watchdog_conn.fileno())
+
+    def _receive_packet_worker(self):
+        """
+        Called by the event loop when the pipe connected to RE Worker is ready for reading.
+        """
+        try:
+            while self._worker_conn.poll():
+                msg = self._worker_conn.recv()
+                self._metrics.inc("pipe_messages_total", peer="worker", direction="received")
+                logger.debug("Message received from RE Worker: %s", PPrintForLogging(msg))
+                self._conn_worker_received(msg)
+        except Exception as ex:
+            logger.exception("Exception occurred while waiting for packet: %s", str(ex))
+            self._loop.remove_reader(self._worker_conn.fileno())
 
     def _conn_worker_received(self, msg):
         async def process_message(msg):
@@ -328,26 +476,35 @@ class RunEngineManager(Process):
                                 "success=%s\n%s\n)",
                                 plan_state, str(success), str(msg_display))
 
+                    running_plan = await self._plan_queue.get_running_plan_info()
+                    self._publish_event("plan_exit", plan_uid=running_plan.get("plan_uid", None),
+                                        plan_state=plan_state, success=success, err_msg=err_msg,
+                                        re_state=value["re_state"])
+
+                    if (plan_state != "paused") and ("timing" in value):
+                        self._add_plan_stats_record(running_plan, plan_state, value["timing"])
+
                     if plan_state == "completed":
                         # Executed plan is removed from the queue only after it is successfully completed.
                         # If a plan was not completed or not successful (exception was raised), then
                         # execution of the queue is stopped. It can be restarted later (failed or
                         # interrupted plan will still be in the queue.
-                        await self._clear_running_plan_info()
+                        await self._plan_queue.set_processed_plan_as_completed()
                         await self._run_task()
                     elif plan_state in ("stopped", "error"):
                         # Paused plan was stopped/aborted/halted
-                        p = await self._get_running_plan_info()
-                        await self._r_pool.lpush('plan_queue', json.dumps(p))
-                        await self._clear_running_plan_info()
+                        await self._plan_queue.set_processed_plan_as_stopped()
                     elif plan_state == "paused":
                         # The plan was paused (nothing should be done)
                         pass
                     else:
                         logger.error("Unknown plan state %s was returned by RE Worker.", plan_state)
 
+                elif action == "re_state_changed":
+                    self._publish_event("re_state_changed", re_state=value["re_state"],
+                                        prev_re_state=value["prev_re_state"])
                 elif action == "environment_created":
-                    await self._started_re_worker()
+                    await self._started_re_worker(value.get("document_stream_address", None))
                 elif action == "environment_closed":
                     await self._stopped_re_worker()
 
@@ -357,93 +514,189 @@ class RunEngineManager(Process):
                 msg_original = value["msg"]
                 logger.info("Acknownegement received from RE Worker:\n"
                             "Status: '%s'\nResult: '%s'\nMessage: %s",
-                            str(status), str(result), pprint.pformat(msg_original))
+                            str(status), str(result), PPrintForLogging(msg_original))
 
             elif type == "result":
                 contains = msg["contains"]
                 logger.info("Result received from RE Worker:\n"
                             "Contains: '%s'\n Value: '%s'",
-                            str(contains), pprint.pformat(value))
+                            str(contains), PPrintForLogging(value))
                 if contains == "status":
                     await self._worker_status_received(value)
+                elif contains == "plan_registry":
+                    await self._worker_plan_registry_received(value)
 
         asyncio.create_task(process_message(msg))
 
     def _conn_watchdog_received(self, response):
-        asyncio.create_task(self._watchdog_response(response))
+        self._watchdog_response(response)
 
     # =========================================================================
     #                        ZMQ message handlers
 
     async def _ping_handler(self, request):
         """
-        May be called to get response from the Manager. Returns the number of plans in the queue.
+        May be called to get response from the Manager. Returns the number of plans in the queue
+        and the address of ZMQ socket used by RE Worker to publish documents (if enabled).
         """
         logger.info("Processing 'Hello' request.")
-        n_pending_plans = await self._r_pool.llen('plan_queue')
+        n_pending_plans = await self._plan_queue.get_queue_size()
         msg = {"msg": "RE Manager",
                "n_plans": n_pending_plans,
-               "is_plan_running": bool(await self._get_running_plan_info())}
+               "is_plan_running": await self._plan_queue.is_plan_running(),
+               "queue_version": self._plan_queue.queue_version,
+               "document_stream_address": self._document_stream_address}
         return msg
 
     async def _queue_view_handler(self, request):
         """
-         Returns the contents of the current queue.
-         """
-        logger.info("Returning current queue.")
-        all_plans = await self._r_pool.lrange('plan_queue', 0, -1)
+        Returns the contents of the current queue. The request may contain optional
+        parameters 'start' (index of the first plan, default 0) and 'count' (maximum number
+        of returned plans, by default all plans starting from 'start' are returned).
+        The reply contains the selected plans and the total number of plans in the queue.
 
-        return {"queue": [json.loads(_) for _ in all_plans]}
+        If the request for the full queue (no 'start' or 'count') contains the parameter
+        'queue_version' (the version returned by the previous 'queue_view' or 'ping' request)
+        and the queue was not modified since, then the reply contains only ``"modified": False``
+        and the current version. The version is not associated with any range of the queue,
+        so the selected range of plans is always returned if 'start' or 'count' is specified.
+        """
+        logger.info("Returning current queue.")
+        request = request or {}
+        start = request.get("start", 0)
+        count = request.get("count", None)
+        queue_version = self._plan_queue.queue_version
+        full_queue = ("start" not in request) and ("count" not in request)
+        if full_queue and (request.get("queue_version", None) == queue_version):
+            return {"modified": False, "queue_version": queue_version, "success": True, "msg": ""}
+        try:
+            plans, n_plans = await self._plan_queue.get_queue_range(start=start, count=count)
+            success, msg = True, ""
+        except ValueError as ex:
+            plans, n_plans = [], 0
+            success, msg = False, str(ex)
+        return {"queue": plans, "n_plans": n_plans, "start": start, "modified": True,
+                "queue_version": queue_version, "success": success, "msg": msg}
 
     async def _add_to_queue_handler(self, request):
         """
-        Adds new plan to the end of the queue
+        Adds new plan to the end of the queue. Returns the plan with assigned plan UID.
         """
-        # TODO: validate inputs!
-        logger.info("Adding new plan to the queue: %s", pprint.pformat(request))
+        logger.info("Adding new plan to the queue: %s", PPrintForLogging(request))
         if "plan" in request:
             plan = request["plan"]
+            msg = self._validate_plans([plan])
+            if msg:
+                return {"success": False, "msg": msg}
             # Create Plan UID (used internally by QServer, user is not expected to see it)
             # Note, Plan UID is not related to Scan UID generated by Run Engine
             plan["plan_uid"] = str(uuid.uuid4())
-            await self._r_pool.rpush('plan_queue', json.dumps(plan))
+            plan["time_added"] = ttime.time()
+            try:
+                await self._plan_queue.add_plan_to_queue(plan)
+            except ValueError as ex:
+                return {"success": False, "msg": f"Failed to add the plan: {str(ex)}"}
         else:
             plan = {}
         return plan
 
+    async def _add_to_queue_batch_handler(self, request):
+        """
+        Adds the list of plans to the end of the queue in a single operation. Either all
+        plans are added or the queue is not changed. Returns the list of plan UIDs
+        assigned to the plans (in the same order as the plans).
+        """
+        plans = request.get("plans", None) if isinstance(request, dict) else None
+        if not isinstance(plans, list):
+            return {"success": False, "msg": f"The list of plans is expected: {pprint.pformat(request)}"}
+        for n, plan in enumerate(plans):
+            if not isinstance(plan, dict):
+                return {"success": False, "msg": f"Plan #{n + 1} is not a dictionary: {pprint.pformat(plan)}"}
+        msg = self._validate_plans(plans)
+        if msg:
+            return {"success": False, "msg": msg}
+
+        logger.info("Adding %d plans to the queue", len(plans))
+        time_added = ttime.time()
+        for plan in plans:
+            plan["plan_uid"] = str(uuid.uuid4())
+            plan["time_added"] = time_added
+        try:
+            await self._plan_queue.add_plans_to_queue(plans)
+        except ValueError as ex:
+            return {"success": False, "msg": f"Failed to add the plans: {str(ex)}"}
+        return {"success": True, "msg": "", "n_added": len(plans),
+                "plan_uids": [_["plan_uid"] for _ in plans]}
+
+    async def _insert_into_queue_handler(self, request):
+        """
+        Inserts the plan into the queue at the position 'pos' (index of the plan in the queue,
+        negative values are counted from the back of the queue). Returns the inserted plan
+        (with assigned plan UID) and its position.
+        """
+        logger.info("Inserting new plan into the queue: %s", PPrintForLogging(request))
+        try:
+            plan, pos = request["plan"], request["pos"]
+            msg = self._validate_plans([plan])
+            if msg:
+                return {"success": False, "msg": msg}
+            plan["plan_uid"] = str(uuid.uuid4())
+            plan["time_added"] = ttime.time()
+            pos = await self._plan_queue.insert_plan_to_queue(plan, pos)
+            return {"success": True, "msg": "", "plan": plan, "pos": pos}
+        except Exception as ex:
+            return {"success": False, "msg": f"Failed to insert the plan: {str(ex)}"}
+
+    async def _move_in_queue_handler(self, request):
+        """
+        Moves the plan with UID 'plan_uid' to the position 'pos' in the queue.
+        Returns the new position of the plan.
+        """
+        logger.info("Moving the plan: %s", PPrintForLogging(request))
+        try:
+            pos = await self._plan_queue.move_plan_in_queue(request["plan_uid"], request["pos"])
+            return {"success": True, "msg": "", "pos": pos}
+        except Exception as ex:
+            return {"success": False, "msg": f"Failed to move the plan: {str(ex)}"}
+
+    async def _remove_from_queue_handler(self, request):
+        """
+        Removes the plan with UID 'plan_uid' from the queue. Returns the removed plan.
+        """
+        logger.info("Removing the plan: %s", PPrintForLogging(request))
+        try:
+            plan = await self._plan_queue.remove_plan_from_queue(request["plan_uid"])
+            return {"success": True, "msg": "", "plan": plan}
+        except Exception as ex:
+            return {"success": False, "msg": f"Failed to remove the plan: {str(ex)}"}
+
     async def _pop_from_queue_handler(self, request):
         """
         Pop the last item from back of the queue
         """
         logger.info("Popping the last item from the queue.")
-        plan = await self._r_pool.rpop('plan_queue')
-        if plan is not None:
-            return json.loads(plan)
-        else:
-            return {}  # No items
+        return await self._plan_queue.pop_plan_from_queue()  # Returns {} if the queue is empty
 
     async def _clear_queue_handler(self, request):
         """
         Remove all entries from the plan queue (does not affect currently executed run)
         """
         logger.info("Clearing the queue")
-        while True:
-            plan = await self._r_pool.rpop('plan_queue')
-            if plan is None:
-                break
-        return {"success": True, "msg": "Plan queue is now empty."}
+        n_removed = await self._plan_queue.clear_queue()
+        return {"success": True, "msg": "Plan queue is now empty.", "n_removed": n_removed}
 
     async def _create_environment_handler(self, request):
         """
         Creates RE environment: creates RE Worker process, starts and configures Run Engine.
         """
         logger.info("Creating the new RE environment.")
-        if not self._environment_exists:
-            await self._start_re_worker()
-            self._environment_exists = True
-            success, msg = True, ""
-        else:
-            success, msg = False, "Environment already exists."
+        async with self._lock_environment:
+            if not self._environment_exists:
+                await self._start_re_worker()
+                self._environment_exists = True
+                success, msg = True, ""
+            else:
+                success, msg = False, "Environment already exists."
         return {"success": success, "msg": msg}
 
     async def _close_environment_handler(self, request):
@@ -452,7 +705,8 @@ class RunEngineManager(Process):
         only after RE completes the current scan.
         """
         logger.info("Closing current RE environment.")
-        success = await self._stop_re_worker()
+        async with self._lock_environment:
+            success = await self._stop_re_worker()
         msg = "" if success else "Environment does not exist."
         return {"success": success, "msg": msg}
 
@@ -511,16 +765,78 @@ class RunEngineManager(Process):
         Not part of future API.
         """
         logger.info("Print UIDs of collected run ('temp' Databroker).")
-        self._print_db_uids()
+        await self._run_in_executor(self._print_db_uids)
         return {"success": True, "msg": ""}
 
+    async def _list_runs_handler(self, request):
+        """
+        Returns the list of runs in 'temp' database. The request may contain optional
+        parameters 'start' (index of the first run, default 0), 'count' (maximum number of
+        returned runs, default 100, None - all runs) and 'reverse' (return the newest runs
+        first, default False). The reply contains the selected runs and the total number of runs.
+        The database is queried in a separate thread, so the event loop is not blocked.
+        """
+        logger.info("Returning the list of runs.")
+        request = request or {}
+        start = request.get("start", 0)
+        count = request.get("count", 100)
+        reverse = request.get("reverse", False)
+        try:
+            runs, n_runs = await self._run_in_executor(self._run_catalog.list_runs,
+                                                       start=start, count=count, reverse=bool(reverse))
+            success, msg = True, ""
+        except Exception as ex:
+            runs, n_runs = [], 0
+            success, msg = False, f"Failed to list runs: {str(ex)}"
+        return {"runs": runs, "n_runs": n_runs, "start": start, "success": success, "msg": msg}
+
+    async def _metrics_handler(self, request):
+        """
+        Returns the metrics collected by RE Manager: latency of request handlers (by command),
+        duration of Redis calls, the number of messages sent and received via pipes, round-trip
+        time of requests to RE Worker, queue length and the lag of the event loop. The reply
+        also contains the list of the longest stalls of the event loop with names of the
+        offending functions.
+        """
+        m = self._metrics
+        m.set("queue_length", await self._plan_queue.get_queue_size())
+        m.set("queue_version", self._plan_queue.queue_version)
+        m.set("plan_running", int(await self._plan_queue.is_plan_running()))
+        m.set("environment_exists", int(self._environment_exists))
+        m.set("published_events_total", self._event_seq_num)
+        loop_stats = self._loop_monitor.get_stats()
+        m.set("loop_lag_seconds", loop_stats["lag_last"])
+        m.set("loop_lag_max_seconds", loop_stats["lag_max"])
+        m.set("loop_stalls_total", loop_stats["n_stalls"])
+        return {"success": True, "msg": "", "metrics": m.get_metrics(),
+                "loop_stalls": loop_stats["longest_stalls"]}
+
+    async def _plan_stats_handler(self, request):
+        """
+        Returns rolling statistics of timings of the executed plans: the time spent in the queue,
+        the time from dispatching the plan to the start of Run Engine, the time of execution
+        by Run Engine, the time of inserting documents into Databroker (approximate, see
+        `PlanStats`) and the number of emitted documents. The request may contain optional
+        parameters 'name' (plan name, default None - all plans) and 'n_recent' (the number
+        of returned records for the most recent plans, default 10).
+        """
+        logger.info("Returning plan statistics.")
+        request = request or {}
+        name = request.get("name", None)
+        n_recent = request.get("n_recent", 10)
+        if not isinstance(n_recent, int):
+            return {"success": False, "msg": f"The number of records must be an integer: {n_recent!r}"}
+        stats = self._plan_stats.get_stats(name=name, n_recent=n_recent)
+        return {"success": True, "msg": "", **stats}
+
     async def _stop_manager_handler(self, request):
         # This is expected to block the event loop forever
         self._manager_stopping = True
         return {"success": True, "msg": "Initiated sequence of stopping RE Manager."}
 
     async def _kill_manager_handler(self, request):
-        # This is expected to block the event loop forever
+        # This is expected to block the event loop forever. The loop is blocked intentionally
+        #   (the command is used to test restarting of RE Manager by Watchdog).
         while True:
             ttime.sleep(10)
 
@@ -531,6 +847,10 @@ class RunEngineManager(Process):
             "": "_ping_handler",
             "queue_view": "_queue_view_handler",
             "add_to_queue": "_add_to_queue_handler",
+            "add_to_queue_batch": "_add_to_queue_batch_handler",
+            "insert_into_queue": "_insert_into_queue_handler",
+            "move_in_queue": "_move_in_queue_handler",
+            "remove_from_queue": "_remove_from_queue_handler",
             "pop_from_queue": "_pop_from_queue_handler",
             "clear_queue": "_clear_queue_handler",
             "create_environment": "_create_environment_handler",
@@ -539,6 +859,9 @@ class RunEngineManager(Process):
             "re_pause": "_re_pause_handler",
             "re_continue": "_re_continue_handler",
             "print_db_uids": "_print_db_uids_handler",
+            "list_runs": "_list_runs_handler",
+            "metrics": "_metrics_handler",
+            "plan_stats": "_plan_stats_handler",
             "stop_manager": "_stop_manager_handler",
             "kill_manager": "_kill_manager_handler",
         }
@@ -546,22 +869,87 @@ class RunEngineManager(Process):
         try:
             handler_name = handler_dict[command]
             handler = getattr(self, handler_name)
-            result = await handler(value)
         except KeyError:
-            result = {"success": False, "msg": f"Unknown command '{command}'"}
+            return {"success": False, "msg": f"Unknown command '{command}'"}
         except AttributeError:
-            result = {"success": False, "msg": f"Handler for the command '{command}' is not implemented"}
+            return {"success": False, "msg": f"Handler for the command '{command}' is not implemented"}
+
+        t_start = ttime.perf_counter()
+        result = await handler(value)
+        self._metrics.observe("request_duration_seconds", ttime.perf_counter() - t_start,
+                              command=command or "ping")
         return result
 
     # ======================================================================
     #          Functions that support communication via 0MQ
 
     async def _zmq_receive(self):
-        msg_in = await self._zmq_socket.recv_json()
+        msg_in = await self._zmq_socket.recv_multipart()
         return msg_in
 
     async def _zmq_send(self, msg):
-        await self._zmq_socket.send_json(msg)
+        await self._zmq_socket.send_multipart(msg)
+
+    async def _zmq_receive_requests(self):
+        """
+        Receive requests from ZMQ socket and start a separate task to process each request.
+        The number of concurrently processed requests is limited by `self._zmq_max_requests`.
+        """
+        while True:
+            await self._zmq_request_semaphore.acquire()
+            try:
+                #  Wait for next request from client
+                frames = await self._zmq_receive()
+            except BaseException:
+                self._zmq_request_semaphore.release()
+                raise
+            task = asyncio.ensure_future(self._zmq_process_request(frames))
+            self._zmq_request_tasks.add(task)
+            task.add_done_callback(self._zmq_request_tasks.discard)
+
+    async def _zmq_process_request(self, frames):
+        """
+        Process a single request and send the reply to the client. The message received by
+        ROUTER socket consists of the envelope (client identity and empty delimiter frame)
+        and the JSON encoded request. The reply is routed to the client using the same envelope.
+        """
+        try:
+            envelope, msg_json = frames[:-1], frames[-1]
+            try:
+                msg_in = json.loads(msg_json)
+                logger.info("ZeroMQ server received request: %s", PPrintForLogging(msg_in))
+                msg_out = await self._zmq_execute(msg_in)
+            except Exception as ex:
+                self._metrics.inc("request_failures_total")
+                logger.exception("Failed to process ZeroMQ request: %s", str(ex))
+                msg_out = {"success": False, "msg": f"Failed to process the request: {str(ex)}"}
+
+            #  Send reply back to client
+            logger.info("ZeroMQ server sending response: %s", PPrintForLogging(msg_out))
+            await self._zmq_send(envelope + [json.dumps(msg_out).encode()])
+        finally:
+            self._zmq_request_semaphore.release()
+
+        if self._manager_stopping:
+            self._event_zmq_stop.set()
+
+    async def _zmq_wait_for_stop(self):
+        """
+        Run the task that receives requests until the event '_event_zmq_stop' is set
+        (the response to 'stop_manager' request is sent). If receiving of requests fails,
+        the error is logged and the receiver is restarted.
+        Returns the task that receives requests.
+        """
+        task_stop = asyncio.ensure_future(self._event_zmq_stop.wait())
+        while True:
+            task_receive = asyncio.ensure_future(self._zmq_receive_requests())
+            await asyncio.wait([task_receive, task_stop], return_when=asyncio.FIRST_COMPLETED)
+            if task_stop.done():
+                return task_receive
+            ex = task_receive.exception() if not task_receive.cancelled() else None
+            logger.error("Receiving of ZeroMQ requests failed: %s. Restarting the receiver.", str(ex))
+            # Wait to avoid fast restarts if the error is persistent
+            await asyncio.sleep(self._zmq_restart_delay)
 
     async def zmq_server_comm(self):
         """
@@ -570,39 +958,42 @@ class RunEngineManager(Process):
         self._ctx = zmq.asyncio.Context()
 
         self._loop = asyncio.get_running_loop()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._executor_max_workers,
+                                                               thread_name_prefix="RE Manager Executor")
+        self._worker_send_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                           thread_name_prefix="RE Manager Send")
+        self._loop_monitor_task = asyncio.ensure_future(self._loop_monitor.run())
 
-        self._start_conn_threads()
-        self._event_watchdog_comm = asyncio.Event()  # Create the event on the loop
-        self._lock_watchdog_comm = asyncio.Lock()
+        self._start_conn_readers()
+        self._lock_environment = asyncio.Lock()
 
         # Start heartbeat generator
         self._heartbeat_generator_task = asyncio.ensure_future(self._heartbeat_generator(), loop=self._loop)
 
-        self._r_pool = await aioredis.create_redis_pool(
-            'redis://localhost', encoding='utf8')
+        self._zmq_pub_socket = self._ctx.socket(zmq.PUB)
+        self._zmq_pub_socket.bind(self._ip_zmq_publisher)
+        logger.info("ZeroMQ server is publishing events on %s", str(self._ip_zmq_publisher))
 
-        # It may be useful to have an API that would delete all used entries in Redis pool
-        #   The following code may go into this new API.
-        # await self._r_pool.delete("running_plan")
-        # await self._r_pool.delete("plan_queue")
-
-        # Create entry 'running_plan' in the pool if it does not exist yet
-        await self._init_running_plan_info()
+        self._plan_queue = PlanQueueOperations(queue_changed_callback=self._queue_changed,
+                                               metrics=self._metrics)
+        await self._plan_queue.start()
 
         # Set the environment state based on whether the worker process is alive (request Watchdog)
         self._environment_exists = await self._is_worker_alive()
 
         # Now check if the plan is still being executed (if it was executed)
         if self._environment_exists:
+            await self._load_plan_registry()
             worker_status = await self._worker_status_request()
+            self._document_stream_address = worker_status.get("document_stream_address", None)
             plan_uid_running = worker_status["running_plan_uid"]
             if not plan_uid_running:
                 # Plan is not being executed (even if it was executed when the manager
                 #   process was stopped.
-                await self._clear_running_plan_info()
+                await self._plan_queue.clear_running_plan_info()
             else:
                 # Plan is running. Check if it is the same plan as in redis.
-                plan_stored = await self._get_running_plan_info()
+                plan_stored = await self._plan_queue.get_running_plan_info()
                 plan_uid_stored = plan_stored["plan_uid"]
                 if plan_uid_stored != plan_uid_running:
                     # Guess is that the environment may still work, so restart is
@@ -615,89 +1006,86 @@ class RunEngineManager(Process):
                         "to restore data integrity.", plan_uid_running, plan_uid_stored)
         else:
             # Environment does not exist, so there is no running plan
-            await self._clear_running_plan_info()
+            await self._plan_queue.clear_running_plan_info()
 
         logger.info("Starting ZeroMQ server")
-        self._zmq_socket = self._ctx.socket(zmq.REP)
+        self._zmq_socket = self._ctx.socket(zmq.ROUTER)
         self._zmq_socket.bind(self._ip_zmq_server)
         logger.info("ZeroMQ server is waiting on %s", str(self._ip_zmq_server))
 
-        while True:
-            #  Wait for next request from client
-            msg_in = await self._zmq_receive()
-            logger.info("ZeroMQ server received request: %s", pprint.pformat(msg_in))
-
-            msg_out = await self._zmq_execute(msg_in)
-
-            #  Send reply back to client
-            logger.info("ZeroMQ server sending response: %s", pprint.pformat(msg_out))
-            await self._zmq_send(msg_out)
-
-            if self._manager_stopping:
-                await self._stop_re_worker()  # Quitting RE Manager
-                await self._watchdog_manager_stopping()
-                self._zmq_socket.close()
-                logger.info("RE Manager was stopped by ZMQ command.")
-                break
+        self._event_zmq_stop = asyncio.Event()
+        self._zmq_request_semaphore = asyncio.Semaphore(self._zmq_max_requests)
+        task_receive = await self._zmq_wait_for_stop()
+
+        task_receive.cancel()
+        # Let the requests that are currently processed to complete
+        if self._zmq_request_tasks:
+            await asyncio.wait(self._zmq_request_tasks)
+
+        async with self._lock_environment:
+            await self._stop_re_worker()  # Quitting RE Manager
+        await self._watchdog_manager_stopping()
+        self._zmq_socket.close()
+        self._zmq_pub_socket.close()
+        self._stop_conn_readers()
+        await self._plan_queue.stop()
+        self._loop_monitor_task.cancel()
+        self._worker_send_executor.shutdown()
+        self._executor.shutdown()
+        logger.info("RE Manager was stopped by ZMQ command.")
 
     # ======================================================================
     #            Support of communication with Watchdog process
 
-    async def _watchdog_send(self, method, notification=False, **kwargs):
+    async def _watchdog_send(self, method, notification=False, timeout_comm=None, **kwargs):
         """
-        The function will raise `asyncio.TimeoutError` in case of communication timeout
+        Send JSON-RPC request or notification to Watchdog. Requests are correlated with responses
+        by request ID, so multiple requests may wait for responses at the same time and
+        notifications (e.g. heartbeats) are sent immediately. The function will raise
+        `asyncio.TimeoutError` if no response is received before timeout. The default timeout
+        (`self._timeout_watchdog_comm`) may be overridden using ``timeout_comm``.
+        Returns the response (without ``id``) or None for notifications.
         """
-        # The lock protects from sending the next message
-        #   before response to the previous message is received.
-        async with self._lock_watchdog_comm:
-            msg = {"method": method, "jsonrpc": "2.0"}
+        msg = {"method": method, "jsonrpc": "2.0"}
 
-            # Don't include parameters if there are none
-            if kwargs:
-                msg["params"] = kwargs
+        # Don't include parameters if there are none
+        if kwargs:
+            msg["params"] = kwargs
 
-            # Don't include 'id' if this is notification
-            if not notification:
-                msg["id"] = str(uuid.uuid4())
+        # No response is expected if this is a notification ('id' is not included)
+        if notification:
+            self._watchdog_conn.send(msg)
+            self._metrics.inc("pipe_messages_total", peer="watchdog", direction="sent")
+            return None
 
-            try:
-                if not notification:
-                    self._fut_watchdog_comm = self._loop.create_future()
-                    self._event_watchdog_comm.set()  # We don't expect response if this is not a notification
-
-                msg_json = json.dumps(msg)
-                self._watchdog_conn.send(msg_json)
-
-                # No response is expected if this is a notification
-                if not notification:
-                    # Waiting for the future may raise 'asyncio.TimeoutError'
-                    await asyncio.wait_for(self._fut_watchdog_comm,
-                                           timeout=self._timeout_watchdog_comm)
-                    response = self._fut_watchdog_comm.result()
-                    if "id" in response:
-                        if response["id"] != msg["id"]:
-                            logger.error("Response Watchdog->RE Manager contains incorrect ID: %s. Expected %s",
-                                         response["id"], msg["id"])
-                        del response["id"]
-                    else:
-                        logger.error("Response Watchdog->RE Manager contains no id: %s", pprint.pformat(response))
-                else:
-                    response = None
-                return response
+        request_id = str(uuid.uuid4())
+        msg["id"] = request_id
+        fut = self._loop.create_future()
+        self._watchdog_pending_requests[request_id] = fut
+        timeout_comm = self._timeout_watchdog_comm if timeout_comm is None else timeout_comm
+        try:
+            self._watchdog_conn.send(msg)
+            self._metrics.inc("pipe_messages_total", peer="watchdog", direction="sent")
+            # Waiting for the future may raise 'asyncio.TimeoutError'
+            response = await asyncio.wait_for(fut, timeout=timeout_comm)
+        finally:
+            self._watchdog_pending_requests.pop(request_id, None)
 
-            finally:
-                self._event_watchdog_comm.clear()  # Clear before the exit as well
+        del response["id"]
+        return response
 
-    async def _watchdog_response(self, response):
+    def _watchdog_response(self, response):
         """
-        Set the future with the results
+        Pass the response to the request waiting for it.
         """
-        if self._event_watchdog_comm.is_set():
-            self._event_watchdog_comm.clear()  # Clear once the message received
-            self._fut_watchdog_comm.set_result(response)
-        else:
+        request_id = response.get("id", None) if isinstance(response, dict) else None
+        fut = self._watchdog_pending_requests.pop(request_id, None)
+        if fut is None:
+            # The request is timed out or the response contains no valid ID
             logger.error("Unsolicited message received Watchdog->Re Manager: %s. Message is ignored",
-                         pprint.pformat(response))
+                         PPrintForLogging(response))
+        elif not fut.done():
+            fut.set_result(response)
 
     # ===============================================================================
     #         Functions that send commands/request data from Watchdog process
@@ -720,7 +1108,9 @@ class RunEngineManager(Process):
         needs to be initiated before attempting to join the process.
         """
         try:
-            response = await self._watchdog_send("join_re_worker", timeout=timeout)
+            # The request is processed for up to 'timeout' seconds
+            response = await self._watchdog_send("join_re_worker", timeout=timeout,
+                                                 timeout_comm=timeout + self._timeout_watchdog_comm)
             success = response["result"]["success"]
         except asyncio.TimeoutError:
             success = False
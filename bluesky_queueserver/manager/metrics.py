@@ -0,0 +1,180 @@
+import bisect
+import math
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Default buckets of histograms of durations (s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is '+Inf'
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Collection of metrics (counters, gauges and histograms) of RE Manager. Metrics are declared
+    once and then updated by name. Each metric may have multiple series distinguished by labels.
+    Updating of a metric is a few dictionary operations, so the metrics may be collected
+    in production. The class is not thread-safe: metrics should be updated from the thread
+    that runs the event loop.
+
+    The collected metrics are returned by `get_metrics()` as a JSON serializable dictionary,
+    which may be converted to Prometheus text format using `format_prometheus()`.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        metrics = Metrics()
+        metrics.declare_histogram("request_duration_seconds", "Time of processing of requests")
+        metrics.observe("request_duration_seconds", 0.003, command="queue_view")
+    """
+    def __init__(self):
+        # name -> (type, help, buckets)
+        self._declarations = {}
+        # name -> {labels: value}, labels is a tuple of pairs (label, value)
+        self._values = {}
+
+    def _declare(self, name, metric_type, help, buckets=None):
+        if name in self._declarations:
+            raise ValueError(f"Metric '{name}' is already declared")
+        self._declarations[name] = (metric_type, help, buckets)
+        self._values[name] = {}
+
+    def declare_counter(self, name, help):
+        """
+        Declare the counter (the value that may only increase).
+        """
+        self._declare(name, "counter", help)
+
+    def declare_gauge(self, name, help):
+        """
+        Declare the gauge (the value that may increase or decrease).
+        """
+        self._declare(name, "gauge", help)
+
+    def declare_histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        """
+        Declare the histogram. ``buckets`` is the sorted sequence of upper bounds of the buckets.
+        """
+        self._declare(name, "histogram", help, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increment the counter.
+        """
+        series = self._values[name]
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Set the value of the gauge.
+        """
+        self._values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Add the observation (e.g. duration of an operation) to the histogram.
+        """
+        series = self._values[name]
+        key = tuple(sorted(labels.items()))
+        hist = series.get(key, None)
+        if hist is None:
+            hist = series[key] = _Histogram(self._declarations[name][2])
+        hist.observe(value)
+
+    def get_metrics(self):
+        """
+        Returns the collected metrics.
+
+        Returns
+        -------
+        list(dict)
+            The list of metrics. Each metric is represented as a dictionary with keys ``name``,
+            ``type``, ``help`` and ``series``. Each element of ``series`` contains ``labels``
+            (dictionary) and ``value`` (counters and gauges) or ``buckets`` (the list of pairs
+            upper bound and cumulative count, the last bound is ``"+Inf"``), ``sum`` and
+            ``count`` (histograms).
+        """
+        metrics = []
+        for name, (metric_type, help, buckets) in self._declarations.items():
+            series = []
+            for labels, value in self._values[name].items():
+                s = {"labels": dict(labels)}
+                if metric_type == "histogram":
+                    counts, total = [], 0
+                    for bound, n in zip(list(buckets) + ["+Inf"], value.counts):
+                        total += n
+                        counts.append([bound, total])
+                    s.update({"buckets": counts, "sum": value.sum, "count": value.count})
+                else:
+                    s["value"] = value
+                series.append(s)
+            metrics.append({"name": name, "type": metric_type, "help": help, "series": series})
+        return metrics
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    items = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        items.append(f'{k}="{v}"')
+    return "{" + ",".join(items) + "}"
+
+
+def _format_value(value):
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def format_prometheus(metrics, *, prefix="qserver_"):
+    """
+    Convert metrics returned by `Metrics.get_metrics()` to Prometheus text format.
+
+    Parameters
+    ----------
+    metrics: list(dict)
+        The list of metrics.
+    prefix: str
+        The prefix added to the names of the metrics.
+
+    Returns
+    -------
+    str
+        Metrics in Prometheus text format (version 0.0.4).
+    """
+    lines = []
+    for metric in metrics:
+        name = prefix + metric["name"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for s in metric["series"]:
+            labels = s["labels"]
+            if metric["type"] == "histogram":
+                for bound, count in s["buckets"]:
+                    le = bound if bound == "+Inf" else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(dict(labels, le=le))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(s['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {s['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(s['value'])}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,801 @@
+import asyncio
+import json
+import time as ttime
+import uuid
+import aioredis
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Lua scripts that implement operations that modify the queue or the running plan. Redis
+#   executes each script atomically, so the operations are never partially applied.
+#   The scripts are registered with Redis ('SCRIPT LOAD') and called by SHA1 digest.
+#   The queue is stored as a sorted set of plan UIDs (the score defines the position
+#   of the plan in the queue) and a hash that maps plan UIDs to plans (JSON), so the plans
+#   can be inserted, moved and removed without rewriting the queue.
+#   KEYS for all scripts: queue index (sorted set), queue items (hash), running plan,
+#   queue version. The scripts increment the queue version if the queue or the running plan
+#   is modified and return the new version as the first element of the result (0 if nothing
+#   was modified).
+
+# Plans are placed in the queue according to their priorities. The plans with higher
+#   priority are placed closer to the front of the queue. Plans with the same priority
+#   are ordered as they were added to the queue (FIFO) unless they are inserted at
+#   a specific position or moved. The range of scores is split into lanes (one lane
+#   per priority level): the plan with priority P has the score in the range
+#   -P * LANE_WIDTH +/- LANE_WIDTH / 2. The plans can't be moved outside their lane.
+PRIORITY_MIN, PRIORITY_MAX = -10, 10
+_LANE_WIDTH = 2 ** 32
+
+# Functions used by the scripts that insert plans into the queue
+_lua_functions = """
+    local LANE_WIDTH = %d
+
+    local function fmt(score)
+        return string.format('%%.17g', score)
+    end
+
+    -- Returns the score (string) for the plan with the given priority inserted at position
+    --   'pos' of the queue. The position is clipped to the range of positions of plans with
+    --   the same priority ('pos' < 0 - the back of the range). The scores of all plans with
+    --   the same priority are reassigned if no gap is left between the neighboring plans.
+    local function get_score_at_pos(pos, priority)
+        local center = -priority * LANE_WIDTH
+        local lane_min, lane_max = fmt(center - LANE_WIDTH / 2), fmt(center + LANE_WIDTH / 2)
+        local n_before = redis.call('ZCOUNT', KEYS[1], '-inf', '(' .. lane_min)
+        local n_lane = redis.call('ZCOUNT', KEYS[1], lane_min, '(' .. lane_max)
+
+        -- Position of the plan among the plans with the same priority
+        local k = pos - n_before
+        if (pos < 0) or (k > n_lane) then
+            k = n_lane
+        elseif k < 0 then
+            k = 0
+        end
+
+        if n_lane == 0 then
+            return fmt(center)
+        elseif k == n_lane then
+            local last = redis.call('ZRANGE', KEYS[1], n_before + n_lane - 1, n_before + n_lane - 1, 'WITHSCORES')
+            return fmt(tonumber(last[2]) + 1)
+        elseif k == 0 then
+            local first = redis.call('ZRANGE', KEYS[1], n_before, n_before, 'WITHSCORES')
+            return fmt(tonumber(first[2]) - 1)
+        end
+        local r = redis.call('ZRANGE', KEYS[1], n_before + k - 1, n_before + k, 'WITHSCORES')
+        local s1, s2 = tonumber(r[2]), tonumber(r[4])
+        local score = fmt((s1 + s2) / 2)
+        if (tonumber(score) > s1) and (tonumber(score) < s2) then
+            return score
+        end
+        -- Assign new scores (center, center + 1, center + 2 ...) to the plans in the lane
+        local uids = redis.call('ZRANGE', KEYS[1], n_before, n_before + n_lane - 1)
+        for i = 1, #uids, 500 do
+            local zadd_args = {}
+            for m = i, math.min(i + 499, #uids) do
+                table.insert(zadd_args, fmt(center + m - 1))
+                table.insert(zadd_args, uids[m])
+            end
+            redis.call('ZADD', KEYS[1], unpack(zadd_args))
+        end
+        return fmt(center + k - 0.5)
+    end
+
+    -- Returns the priority of the plan (JSON)
+    local function get_priority(plan)
+        return cjson.decode(plan)['priority'] or 0
+    end
+
+    -- Removes the plan from the queue. Returns the plan (JSON) or nil.
+    local function remove_plan(uid)
+        local plan = redis.call('HGET', KEYS[2], uid)
+        redis.call('ZREM', KEYS[1], uid)
+        redis.call('HDEL', KEYS[2], uid)
+        return plan
+    end
+
+    -- Adds the plans to the back of the range of plans with the same priority.
+    --   ARGV: UID, priority and plan (JSON) for each plan. Returns the list of positions
+    --   of the added plans.
+    local function add_plans()
+        local last_scores = {}
+        for i = 1, #ARGV, 3 do
+            local priority = tonumber(ARGV[i + 1])
+            local score = last_scores[priority]
+            if score then
+                score = score + 1
+            else
+                score = tonumber(get_score_at_pos(-1, priority))
+            end
+            last_scores[priority] = score
+            redis.call('ZADD', KEYS[1], fmt(score), ARGV[i])
+        end
+        local positions = {}
+        for i = 1, #ARGV, 999 do
+            local hset_args = {}
+            for m = i, math.min(i + 998, #ARGV), 3 do
+                table.insert(hset_args, ARGV[m])
+                table.insert(hset_args, ARGV[m + 2])
+                table.insert(positions, redis.call('ZRANK', KEYS[1], ARGV[m]))
+            end
+            redis.call('HSET', KEYS[2], unpack(hset_args))
+        end
+        return positions
+    end
+""" % _LANE_WIDTH
+
+_lua_scripts = {
+    # Insert the plan (ARGV[3]) with UID (ARGV[1]) and priority (ARGV[2]) at the position ARGV[4].
+    #   The position is clipped to the range of positions of the plans with the same priority.
+    #   Returns: [version, position of the plan] or [0, -1] if the UID already exists
+    "insert_plan_to_queue": """
+        if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 1 then
+            return {0, -1}
+        end
+        local score = get_score_at_pos(tonumber(ARGV[4]), tonumber(ARGV[2]))
+        redis.call('ZADD', KEYS[1], score, ARGV[1])
+        redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+        return {redis.call('INCR', KEYS[4]), redis.call('ZRANK', KEYS[1], ARGV[1])}
+    """,
+    # Add the plans to the back of the ranges of plans with the same priority. ARGV: UID,
+    #   priority and plan (JSON) for each plan. Returns: [version, list of positions of the plans]
+    #   or [-1, {}] if one of the UIDs already exists
+    "add_plans_to_queue": """
+        if #ARGV == 0 then
+            return {0, {}}
+        end
+        for i = 1, #ARGV, 3 do
+            if redis.call('HEXISTS', KEYS[2], ARGV[i]) == 1 then
+                return {-1, {}}
+            end
+        end
+        local positions = add_plans()
+        return {redis.call('INCR', KEYS[4]), positions}
+    """,
+    # Pop the plan from the back of the queue. Returns: [version, plan or nil]
+    "pop_plan_from_queue": """
+        local uids = redis.call('ZRANGE', KEYS[1], -1, -1)
+        if #uids == 0 then
+            return {0, false}
+        end
+        local plan = remove_plan(uids[1])
+        return {redis.call('INCR', KEYS[4]), plan}
+    """,
+    # Remove the plan with UID (ARGV[1]) from the queue.
+    #   Returns: [version, former position of the plan, plan] or [0, -1, nil] if UID is not found
+    "remove_plan_from_queue": """
+        local pos = redis.call('ZRANK', KEYS[1], ARGV[1])
+        if not pos then
+            return {0, -1, false}
+        end
+        local plan = remove_plan(ARGV[1])
+        return {redis.call('INCR', KEYS[4]), pos, plan}
+    """,
+    # Move the plan with UID (ARGV[1]) to the position ARGV[2]. The position is clipped
+    #   to the range of positions of the plans with the same priority. Returns: [version,
+    #   former position, new position] or [0, -1, -1] if UID is not found
+    "move_plan_in_queue": """
+        local pos = redis.call('ZRANK', KEYS[1], ARGV[1])
+        if not pos then
+            return {0, -1, -1}
+        end
+        local priority = get_priority(redis.call('HGET', KEYS[2], ARGV[1]))
+        redis.call('ZREM', KEYS[1], ARGV[1])
+        local score = get_score_at_pos(tonumber(ARGV[2]), priority)
+        redis.call('ZADD', KEYS[1], score, ARGV[1])
+        return {redis.call('INCR', KEYS[4]), pos, redis.call('ZRANK', KEYS[1], ARGV[1])}
+    """,
+    # Remove all plans from the queue. Returns: [version, the number of removed plans]
+    "clear_queue": """
+        local n_plans = redis.call('ZCARD', KEYS[1])
+        if n_plans == 0 then
+            return {0, 0}
+        end
+        redis.call('DEL', KEYS[1], KEYS[2])
+        return {redis.call('INCR', KEYS[4]), n_plans}
+    """,
+    # Save the plan (ARGV[1]) as the running plan. Returns: [version]
+    "set_running_plan_info": """
+        redis.call('SET', KEYS[3], ARGV[1])
+        return {redis.call('INCR', KEYS[4])}
+    """,
+    # Move the plan from the front of the queue (the plan with the highest priority) to 'running_plan'.
+    #   Returns: [version, number of plans left in the queue, plan or nil]
+    "set_next_plan_as_running": """
+        local uids = redis.call('ZRANGE', KEYS[1], 0, 0)
+        if #uids == 0 then
+            return {0, 0, false}
+        end
+        local plan = remove_plan(uids[1])
+        redis.call('SET', KEYS[3], plan)
+        return {redis.call('INCR', KEYS[4]), redis.call('ZCARD', KEYS[1]), plan}
+    """,
+    # Push the running plan back to the front of the range of plans with the same priority
+    #   and clear 'running_plan'.
+    #   Returns: [version, the plan or nil if no plan is running, position of the plan]
+    "push_running_plan_to_queue": """
+        local plan = redis.call('GET', KEYS[3])
+        if (not plan) or (plan == '{}') then
+            return {0, false, -1}
+        end
+        local uid = cjson.decode(plan)['plan_uid']
+        redis.call('ZADD', KEYS[1], get_score_at_pos(0, get_priority(plan)), uid)
+        redis.call('HSET', KEYS[2], uid, plan)
+        redis.call('SET', KEYS[3], '{}')
+        return {redis.call('INCR', KEYS[4]), plan, redis.call('ZRANK', KEYS[1], uid)}
+    """,
+    # Move the plans from the list (KEYS[5]) used by older versions to store the queue
+    #   to the queue and delete the list. ARGV: UID, priority and plan (JSON) for each plan
+    #   in the list (in the same order). Returns: [version]
+    "migrate_plan_queue_list": """
+        redis.call('DEL', KEYS[5])
+        add_plans()
+        return {redis.call('INCR', KEYS[4])}
+    """,
+    # Delete the queue and clear the running plan. Returns: [version]
+    "delete_pool_entries": """
+        redis.call('DEL', KEYS[1], KEYS[2])
+        redis.call('SET', KEYS[3], '{}')
+        return {redis.call('INCR', KEYS[4])}
+    """,
+}
+
+
+class PlanQueueOperations:
+    """
+    The class supports operations with the plan queue and the record of the currently
+    running plan stored in Redis. The operations that change more than one Redis entry
+    (e.g. starting the next plan) are performed atomically in a single round-trip,
+    so the plan can never be lost or duplicated if RE Manager is killed.
+
+    Each plan in the queue is identified by the unique ``plan_uid``. Plans may be inserted
+    at any position of the queue, moved or removed by UID. The queue is stored in Redis as
+    the sorted set of UIDs (index) and the hash of plans, so each of those operations requires
+    O(log n) time in Redis and doesn't rewrite the queue.
+
+    Plans may have priorities (optional key ``priority`` of the plan, integer in the range
+    from `PRIORITY_MIN` to `PRIORITY_MAX`). Plans with higher priority are placed closer to
+    the front of the queue and executed first. Plans with the same priority are executed
+    in the order they were added (FIFO) unless they are inserted at a specific position
+    or moved. Plans can be inserted or moved only within the range of plans with the same
+    priority. The default priority is 0, so the queue is FIFO if priorities are not used.
+
+    The class keeps a copy of the queue and the running plan in memory, so read operations
+    don't access Redis. The copy is loaded by `start()` and updated by each operation
+    that modifies the queue. No other process is expected to modify the Redis entries
+    while the object exists. Each modification of the queue or the running plan increments
+    the queue version. The version is stored in Redis, so it keeps increasing when RE Manager
+    is restarted.
+
+    Parameters
+    ----------
+    redis_host: str
+        Address of Redis server.
+    queue_changed_callback: callable or None
+        The function is called each time the queue or the running plan is modified.
+        The function accepts the dictionary with the keys ``queue_version``, ``n_plans``
+        and ``is_plan_running`` as the only parameter.
+    metrics: Metrics or None
+        If not None, duration of Redis calls and the number of failed calls are recorded
+        (metrics ``redis_call_duration_seconds`` and ``redis_call_errors_total``).
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        pq = PlanQueueOperations()
+        await pq.start()
+
+        await pq.add_plan_to_queue({"name": "count", "args": [["det1", "det2"]], "plan_uid": "abc"})
+        plan, n_pending = await pq.set_next_plan_as_running()
+        await pq.set_processed_plan_as_completed()
+
+        await pq.stop()
+    """
+    def __init__(self, redis_host="localhost", queue_changed_callback=None, metrics=None):
+        self._redis_host = redis_host
+        # Duration of Redis calls is recorded if 'metrics' (object of class Metrics) is passed
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.declare_histogram("redis_call_duration_seconds", "Duration of Redis calls by script")
+            metrics.declare_counter("redis_call_errors_total", "Number of failed Redis calls by script")
+        self._r_pool = None
+        self._queue_changed_callback = queue_changed_callback
+
+        # Names of Redis entries
+        self._name_plan_queue_index = "plan_queue_index"
+        self._name_plan_queue_items = "plan_queue_items"
+        self._name_plan_queue_list = "plan_queue"  # The list used by older versions
+        self._name_running_plan = "running_plan"
+        self._name_queue_version = "plan_queue_version"
+
+        self._script_sha = {}  # SHA1 digests of the registered Lua scripts
+
+        # Copy of the queue and the running plan
+        self._plan_queue = []
+        self._running_plan = {}
+        self._queue_version = 0
+
+        # The lock serializes the operations that modify the queue, so that the changes
+        #   are applied to the copy in the same order as they are applied in Redis.
+        self._lock = None
+
+    async def start(self):
+        """
+        Connect to Redis, register the scripts, initialize the record of the running plan
+        and load the queue.
+        """
+        self._lock = asyncio.Lock()
+        self._r_pool = await aioredis.create_redis_pool(f"redis://{self._redis_host}", encoding="utf8")
+        await self._load_scripts()
+        await self._migrate_plan_queue_list()
+        await self._load_plan_queue()
+
+        # Create entry 'running_plan' in the pool if it does not exist yet
+        await self._init_running_plan_info()
+
+    async def stop(self):
+        """
+        Close connection to Redis.
+        """
+        self._r_pool.close()
+        await self._r_pool.wait_closed()
+
+    async def delete_pool_entries(self):
+        """
+        Delete the queue and clear the record of the running plan. The queue version
+        is incremented (not reset).
+        """
+        async with self._lock:
+            version, = await self._run_script("delete_pool_entries")
+            self._plan_queue.clear()
+            self._running_plan = {}
+            self._update_version(version)
+
+    async def _load_plan_queue(self):
+        """
+        Load the queue, the running plan and the queue version from Redis.
+        """
+        tr = self._r_pool.multi_exec()
+        fut_uids = tr.zrange(self._name_plan_queue_index, 0, -1)
+        fut_items = tr.hgetall(self._name_plan_queue_items)
+        fut_running_plan = tr.get(self._name_running_plan)
+        fut_version = tr.get(self._name_queue_version)
+        await tr.execute()
+
+        items = await fut_items
+        self._plan_queue = [json.loads(items[_]) for _ in await fut_uids]
+        running_plan = await fut_running_plan
+        self._running_plan = json.loads(running_plan) if running_plan is not None else {}
+        version = await fut_version
+        self._queue_version = int(version) if version is not None else 0
+
+    async def _migrate_plan_queue_list(self):
+        """
+        Move the plans from the list used by older versions to store the queue (if the list
+        exists). UIDs are assigned to the plans that have no UID or duplicate UID.
+        """
+        if await self._r_pool.type(self._name_plan_queue_list) != "list":
+            return
+        plans = [json.loads(_) for _ in await self._r_pool.lrange(self._name_plan_queue_list, 0, -1)]
+        logger.info("Moving %d plans from the list '%s' to the queue", len(plans), self._name_plan_queue_list)
+
+        uids, args = set(), []
+        for plan in plans:
+            if ("plan_uid" not in plan) or (plan["plan_uid"] in uids):
+                plan["plan_uid"] = str(uuid.uuid4())
+            uids.add(plan["plan_uid"])
+            args.extend([plan["plan_uid"], self._get_plan_priority(plan), json.dumps(plan)])
+        await self._run_script("migrate_plan_queue_list", args=args,
+                               extra_keys=[self._name_plan_queue_list])
+
+    async def _load_scripts(self):
+        for name, script in _lua_scripts.items():
+            self._script_sha[name] = await self._r_pool.script_load(_lua_functions + script)
+
+    async def _run_script(self, name, *, args=None, extra_keys=None):
+        """
+        Execute the registered Lua script. The scripts are registered again if Redis
+        has no record of them (e.g. Redis was restarted or the script cache was flushed).
+        """
+        keys = [self._name_plan_queue_index, self._name_plan_queue_items,
+                self._name_running_plan, self._name_queue_version]
+        keys += extra_keys or []
+        args = args or []
+        t_start = ttime.perf_counter()
+        try:
+            try:
+                result = await self._r_pool.evalsha(self._script_sha[name], keys=keys, args=args)
+            except aioredis.ReplyError as ex:
+                if not str(ex).startswith("NOSCRIPT"):
+                    raise
+                await self._load_scripts()
+                result = await self._r_pool.evalsha(self._script_sha[name], keys=keys, args=args)
+        except Exception:
+            if self._metrics is not None:
+                self._metrics.inc("redis_call_errors_total", script=name)
+            raise
+        if self._metrics is not None:
+            self._metrics.observe("redis_call_duration_seconds", ttime.perf_counter() - t_start, script=name)
+        return result
+
+    def _update_version(self, version):
+        # Version 0 is returned by the scripts if nothing was modified
+        if version:
+            self._queue_version = version
+            if self._queue_changed_callback:
+                try:
+                    self._queue_changed_callback({"queue_version": self._queue_version,
+                                                  "n_plans": len(self._plan_queue),
+                                                  "is_plan_running": bool(self._running_plan)})
+                except Exception as ex:
+                    logger.exception("Exception occurred in the queue change callback: %s", str(ex))
+
+    @property
+    def queue_version(self):
+        """
+        Current version of the queue. The version is incremented each time the queue
+        or the running plan is modified.
+        """
+        return self._queue_version
+
+    # -------------------------------------------------------------------------------
+    #                          Currently running plan
+
+    async def _set_running_plan_info(self, plan):
+        """
+        Write info on the currently running to Redis
+        """
+        async with self._lock:
+            version, = await self._run_script("set_running_plan_info", args=[json.dumps(plan)])
+            self._running_plan = plan
+            self._update_version(version)
+
+    async def get_running_plan_info(self):
+        """
+        Returns info on the currently running plan.
+
+        Returns
+        -------
+        dict
+            Parameters of the running plan or ``{}`` if no plan is running.
+        """
+        return self._running_plan
+
+    async def clear_running_plan_info(self):
+        """
+        Clear info on the currently running plan in Redis.
+        """
+        await self._set_running_plan_info({})
+
+    async def _init_running_plan_info(self):
+        """
+        Initialize running plan info: create Redis entry that hold empty plan ({})
+        a record doesn't exist.
+        """
+        # Create entry 'running_plan' in the pool if it does not exist yet
+        if not self._running_plan and not await self._r_pool.exists(self._name_running_plan):
+            await self.clear_running_plan_info()
+
+    async def is_plan_running(self):
+        """
+        Check if a plan is currently running.
+        """
+        return bool(self._running_plan)
+
+    # -------------------------------------------------------------------------------
+    #                             Plan queue
+
+    async def get_queue_size(self):
+        """
+        Returns the number of plans in the queue.
+        """
+        return len(self._plan_queue)
+
+    async def get_queue(self):
+        """
+        Returns the list of plans in the queue.
+        """
+        return list(self._plan_queue)
+
+    async def get_queue_range(self, start=0, count=None):
+        """
+        Returns a range of plans from the queue and the total number of plans in the queue.
+
+        Parameters
+        ----------
+        start: int
+            Index of the first plan (0 - the front of the queue).
+        count: int or None
+            Maximum number of returned plans. All plans starting from `start` are
+            returned if `count` is None.
+
+        Returns
+        -------
+        list(dict), int
+            The list of selected plans and the total number of plans in the queue.
+
+        Raises
+        ------
+        ValueError
+            Invalid values of `start` or `count`.
+        """
+        if not isinstance(start, int) or (start < 0):
+            raise ValueError(f"Index of the first plan must be a non-negative integer: start={start!r}")
+        if (count is not None) and (not isinstance(count, int) or (count < 0)):
+            raise ValueError(f"Number of plans must be a non-negative integer: count={count!r}")
+
+        stop = None if count is None else start + count
+        return self._plan_queue[start: stop], len(self._plan_queue)
+
+    def _normalize_pos(self, pos):
+        """
+        Convert the position of the plan in the queue to non-negative index. Negative
+        positions are counted from the back of the queue (as indices of Python lists).
+        Positions that are out of range are clipped.
+        """
+        if not isinstance(pos, int) or isinstance(pos, bool):
+            raise ValueError(f"Position of the plan must be an integer: pos={pos!r}")
+        n_plans = len(self._plan_queue)
+        if pos < 0:
+            pos = max(n_plans + pos, 0)
+        return min(pos, n_plans)
+
+    @staticmethod
+    def _get_plan_uid(plan):
+        if not isinstance(plan, dict) or not isinstance(plan.get("plan_uid", None), str):
+            raise ValueError(f"Plan must be a dictionary with the key 'plan_uid': plan={plan!r}")
+        return plan["plan_uid"]
+
+    @staticmethod
+    def _get_plan_priority(plan):
+        priority = plan.get("priority", 0)
+        if not isinstance(priority, int) or isinstance(priority, bool) or \
+                not (PRIORITY_MIN <= priority <= PRIORITY_MAX):
+            raise ValueError(f"Priority of the plan must be an integer in the range "
+                             f"[{PRIORITY_MIN}, {PRIORITY_MAX}]: priority={priority!r}")
+        return priority
+
+    def _insert_plans_to_copy(self, plans, positions):
+        """
+        Insert the plans into the copy of the queue. 'positions' are the positions of the plans
+        in the queue after all plans are inserted.
+        """
+        n_plans = len(self._plan_queue)
+        if positions == list(range(n_plans, n_plans + len(plans))):
+            self._plan_queue.extend(plans)  # All plans are added to the back of the queue
+            return
+        queue_iter, queue = iter(self._plan_queue), []
+        for pos, plan in sorted(zip(positions, plans), key=lambda _: _[0]):
+            while len(queue) < pos:
+                queue.append(next(queue_iter))
+            queue.append(plan)
+        queue.extend(queue_iter)
+        self._plan_queue = queue
+
+    async def add_plan_to_queue(self, plan):
+        """
+        Add the plan to the back of the queue (behind all the plans with the same
+        or higher priority).
+
+        Raises
+        ------
+        ValueError
+            The plan has no UID or the plan with the same UID is already in the queue.
+        """
+        await self.insert_plan_to_queue(plan)
+
+    async def insert_plan_to_queue(self, plan, pos=None):
+        """
+        Insert the plan into the queue.
+
+        Parameters
+        ----------
+        plan: dict
+            The plan. The plan must have unique UID (``plan_uid``). The optional key ``priority``
+            sets the priority of the plan (see `PRIORITY_MIN` and `PRIORITY_MAX`, default 0).
+        pos: int or None
+            Position of the plan in the queue (as the index in `list.insert()`, negative values
+            are counted from the back of the queue). The plan is added to the back of the queue
+            if None. The position is clipped to the range of positions of the plans
+            with the same priority.
+
+        Returns
+        -------
+        int
+            Position (non-negative index) of the inserted plan.
+
+        Raises
+        ------
+        ValueError
+            Invalid position or priority, the plan has no UID or the plan with the same UID
+            is already in the queue.
+        """
+        plan_uid = self._get_plan_uid(plan)
+        priority = self._get_plan_priority(plan)
+        async with self._lock:
+            pos = -1 if pos is None else self._normalize_pos(pos)
+            version, pos = await self._run_script("insert_plan_to_queue",
+                                                  args=[plan_uid, priority, json.dumps(plan), pos])
+            if pos < 0:
+                raise ValueError(f"Plan with UID '{plan_uid}' is already in the queue")
+            self._plan_queue.insert(pos, plan)
+            self._update_version(version)
+            return pos
+
+    async def add_plans_to_queue(self, plans):
+        """
+        Add the list of plans to the queue. Each plan is placed behind the plans with the same
+        or higher priority. The plans are added in a single atomic operation (one round-trip to Redis).
+
+        Parameters
+        ----------
+        plans: list(dict)
+            The list of plans. Each plan must have unique UID (``plan_uid``).
+
+        Raises
+        ------
+        ValueError
+            One of the plans has no UID, has invalid priority or has the same UID as other plan
+            in the list or in the queue. No plans are added to the queue.
+        """
+        args = []
+        for plan in plans:
+            args.extend([self._get_plan_uid(plan), self._get_plan_priority(plan), json.dumps(plan)])
+        if len(set(args[::3])) != len(plans):
+            raise ValueError("The list contains plans with identical UIDs")
+
+        async with self._lock:
+            version, positions = await self._run_script("add_plans_to_queue", args=args)
+            if version < 0:
+                raise ValueError("The list contains plans with UIDs that are already in the queue")
+            self._insert_plans_to_copy(plans, positions)
+            self._update_version(version)
+
+    async def pop_plan_from_queue(self):
+        """
+        Pop the plan from the back of the queue.
+
+        Returns
+        -------
+        dict
+            The plan or ``{}`` if the queue is empty.
+        """
+        async with self._lock:
+            version, plan = await self._run_script("pop_plan_from_queue")
+            if plan is None:
+                return {}
+            self._plan_queue.pop()
+            self._update_version(version)
+            return json.loads(plan)
+
+    async def remove_plan_from_queue(self, plan_uid):
+        """
+        Remove the plan from the queue.
+
+        Parameters
+        ----------
+        plan_uid: str
+            UID of the plan.
+
+        Returns
+        -------
+        dict
+            The removed plan.
+
+        Raises
+        ------
+        ValueError
+            The plan with the UID is not in the queue.
+        """
+        async with self._lock:
+            version, pos, plan = await self._run_script("remove_plan_from_queue", args=[plan_uid])
+            if pos < 0:
+                raise ValueError(f"Plan with UID '{plan_uid}' is not in the queue")
+            self._plan_queue.pop(pos)
+            self._update_version(version)
+            return json.loads(plan)
+
+    async def move_plan_in_queue(self, plan_uid, pos):
+        """
+        Move the plan to a new position in the queue.
+
+        Parameters
+        ----------
+        plan_uid: str
+            UID of the plan.
+        pos: int
+            New position of the plan: the index of the plan in the queue after the plan is
+            moved. Negative values are counted from the back of the queue (-1 - the back
+            of the queue). The position is clipped to the range of positions of the plans
+            with the same priority.
+
+        Returns
+        -------
+        int
+            New position (non-negative index) of the plan.
+
+        Raises
+        ------
+        ValueError
+            Invalid position or the plan with the UID is not in the queue.
+        """
+        async with self._lock:
+            n_plans = len(self._plan_queue)
+            if not isinstance(pos, int) or isinstance(pos, bool):
+                raise ValueError(f"Position of the plan must be an integer: pos={pos!r}")
+            # Position in the queue after the plan is removed
+            pos = min(max(n_plans + pos if pos < 0 else pos, 0), n_plans - 1)
+            version, pos_old, pos_new = await self._run_script("move_plan_in_queue", args=[plan_uid, pos])
+            if pos_old < 0:
+                raise ValueError(f"Plan with UID '{plan_uid}' is not in the queue")
+            self._plan_queue.insert(pos_new, self._plan_queue.pop(pos_old))
+            self._update_version(version)
+            return pos_new
+
+    async def clear_queue(self):
+        """
+        Remove all plans from the queue (does not affect the running plan). The queue is
+        cleared in a single atomic operation.
+
+        Returns
+        -------
+        int
+            The number of removed plans.
+        """
+        async with self._lock:
+            version, n_plans = await self._run_script("clear_queue")
+            self._plan_queue.clear()
+            self._update_version(version)
+            return n_plans
+
+    # -------------------------------------------------------------------------------
+    #                    Transitions between the queue and the running plan
+
+    async def set_next_plan_as_running(self):
+        """
+        Atomically remove the plan from the front of the queue (the plan with the highest priority)
+        and save it as the running plan.
+
+        Returns
+        -------
+        dict, int
+            The plan (``{}`` if the queue is empty) and the number of plans left in the queue.
+        """
+        async with self._lock:
+            version, n_pending_plans, plan = await self._run_script("set_next_plan_as_running")
+            if plan is None:
+                return {}, 0
+            self._plan_queue.pop(0)
+            self._running_plan = json.loads(plan)
+            self._update_version(version)
+            return self._running_plan, n_pending_plans
+
+    async def set_processed_plan_as_completed(self):
+        """
+        The running plan was completed: clear the record of the running plan.
+        """
+        await self.clear_running_plan_info()
+
+    async def set_processed_plan_as_stopped(self):
+        """
+        The running plan was stopped or failed: atomically push the plan back to the front
+        of the queue (in front of the plans with the same priority) and clear the record
+        of the running plan.
+
+        Returns
+        -------
+        dict
+            The plan pushed to the queue or ``{}`` if no plan was running.
+        """
+        async with self._lock:
+            version, plan, pos = await self._run_script("push_running_plan_to_queue")
+            if plan is None:
+                return {}
+            plan = json.loads(plan)
+            self._plan_queue.insert(pos, plan)
+            self._running_plan = {}
+            self._update_version(version)
+            return plan
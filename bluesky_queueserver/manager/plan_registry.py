@@ -0,0 +1,213 @@
+import collections
+import hashlib
+import inspect
+import json
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Names of plan parameters that accept devices (or lists of devices) in bluesky plans
+_DEVICE_PARAMETER_NAMES = {"detector", "detectors", "motor", "motors", "movable", "movables",
+                           "readable", "readables", "flyer", "flyers"}
+
+
+def _is_plan(obj):
+    """
+    Plans are generator functions.
+    """
+    return inspect.isgeneratorfunction(obj)
+
+
+def _is_device(obj):
+    """
+    Devices are objects (not classes) that support the 'readable' protocol.
+    """
+    return not inspect.isclass(obj) and hasattr(obj, "read") and hasattr(obj, "describe")
+
+
+def _takes_devices(parameter):
+    """
+    Parameter accepts devices if it has one of the names conventionally used for devices
+    in bluesky plans (e.g. ``detectors`` or ``motor``).
+    """
+    is_variadic = parameter.kind in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
+    return not is_variadic and parameter.name in _DEVICE_PARAMETER_NAMES
+
+
+def _describe_plan(plan):
+    """
+    Returns JSON serializable description of the plan parameters.
+    """
+    parameters = []
+    for p in inspect.signature(plan).parameters.values():
+        parameters.append({"name": p.name,
+                           "kind": p.kind.name,
+                           "has_default": p.default is not inspect.Parameter.empty,
+                           "takes_devices": _takes_devices(p)})
+    return {"parameters": parameters}
+
+
+def create_plan_registry(namespace):
+    """
+    Create the registry of plans and devices found in the namespace. The registry is
+    JSON serializable, so it can be sent to RE Manager and used to validate plans without
+    access to the namespace.
+
+    Parameters
+    ----------
+    namespace: dict
+        The namespace (e.g. ``globals()`` of the module) that contains plans and devices.
+        Names that start with ``_`` are ignored.
+
+    Returns
+    -------
+    dict
+        The dictionary with the keys ``plans`` (maps plan names to descriptions of plan parameters)
+        and ``devices`` (maps device names to descriptions of devices).
+    """
+    plans, devices = {}, {}
+    for name, obj in namespace.items():
+        if name.startswith("_"):
+            continue
+        try:
+            if _is_plan(obj):
+                plans[name] = _describe_plan(obj)
+            elif _is_device(obj):
+                devices[name] = {"classname": type(obj).__name__,
+                                 "is_movable": hasattr(obj, "set")}
+        except Exception as ex:
+            logger.warning("Failed to add '%s' to the registry of plans and devices: %s", name, str(ex))
+    return {"plans": plans, "devices": devices}
+
+
+class PlanValidator:
+    """
+    Validation of plans using the registry of plans and devices created by
+    `create_plan_registry()`. The plan is valid if the plan name is in the registry,
+    ``args`` and ``kwargs`` match the parameters of the plan and all names of the devices
+    passed in ``args`` are in the registry. RE Worker replaces the strings in ``args`` (including
+    strings in lists) that are names of objects in its namespace and passes other strings
+    unchanged, so only the strings passed to the parameters that accept devices
+    (``takes_devices`` in the registry, e.g. ``detectors`` or ``motor``) are checked.
+
+    The results of validation are cached, so validation of the plan identical to one of
+    the recently validated plans requires only computing the hash of the plan.
+    The cache is cleared when the registry is replaced.
+
+    Parameters
+    ----------
+    cache_size: int
+        Maximum number of cached results.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        pv = PlanValidator()
+        pv.set_registry(create_plan_registry(namespace))
+        success, msg = pv.validate_plan({"name": "count", "args": [["det1", "det2"]]})
+    """
+    def __init__(self, *, cache_size=10000):
+        self._registry = None
+        self._signatures = {}
+        self._device_parameters = {}  # Names of the parameters that accept devices
+        self._cache = collections.OrderedDict()
+        self._cache_size = cache_size
+
+    def set_registry(self, registry):
+        """
+        Set the registry of plans and devices. The cached results of validation are discarded.
+
+        Parameters
+        ----------
+        registry: dict
+            The registry created by `create_plan_registry()`.
+        """
+        signatures, device_parameters = {}, {}
+        for name, desc in registry["plans"].items():
+            parameters = [inspect.Parameter(p["name"], getattr(inspect.Parameter, p["kind"]),
+                                            default=None if p["has_default"] else inspect.Parameter.empty)
+                          for p in desc["parameters"]]
+            signatures[name] = inspect.Signature(parameters)
+            device_parameters[name] = {p["name"] for p in desc["parameters"] if p.get("takes_devices", False)}
+        self._registry = registry
+        self._signatures = signatures
+        self._device_parameters = device_parameters
+        self._cache.clear()
+
+    @property
+    def registry(self):
+        """
+        The registry of plans and devices or None if the registry is not set.
+        """
+        return self._registry
+
+    @staticmethod
+    def _plan_hash(plan):
+        spec = {"name": plan.get("name", None), "args": plan.get("args", []), "kwargs": plan.get("kwargs", {})}
+        return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    def _validate(self, plan):
+        name = plan.get("name", None)
+        args = plan.get("args", [])
+        kwargs = plan.get("kwargs", {})
+
+        if not isinstance(name, str):
+            return False, f"Plan name must be a string: {name!r}"
+        if name not in self._signatures:
+            return False, f"Plan '{name}' is not in the list of allowed plans"
+        if not isinstance(args, list):
+            return False, f"Plan args must be a list: {args!r}"
+        if not isinstance(kwargs, dict):
+            return False, f"Plan kwargs must be a dictionary: {kwargs!r}"
+
+        try:
+            bound = self._signatures[name].bind(*args, **kwargs)
+        except TypeError as ex:
+            return False, f"Parameters of the plan '{name}' are invalid: {str(ex)}"
+
+        # Only 'args' are parsed by RE Worker: strings passed in 'kwargs' are never device names
+        devices = self._registry["devices"]
+        for p_name in self._device_parameters[name]:
+            if (p_name not in bound.arguments) or (p_name in kwargs):
+                continue
+            value = bound.arguments[p_name]
+            for v in (value if isinstance(value, list) else [value]):
+                if isinstance(v, str) and (v not in devices):
+                    return False, f"Device '{v}' is not in the list of allowed devices"
+
+        return True, ""
+
+    def validate_plan(self, plan):
+        """
+        Validate the plan. All plans are considered valid if the registry is not set.
+
+        Parameters
+        ----------
+        plan: dict
+            The plan (the dictionary with keys ``name``, ``args`` and ``kwargs``).
+
+        Returns
+        -------
+        bool, str
+            The result of validation and the error message (empty string if the plan is valid).
+        """
+        if self._registry is None:
+            return True, ""
+
+        try:
+            key = self._plan_hash(plan)
+        except Exception as ex:
+            return False, f"Plan parameters are not JSON serializable: {str(ex)}"
+
+        result = self._cache.get(key, None)
+        if result is not None:
+            self._cache.move_to_end(key)
+            return result
+
+        result = self._validate(plan)
+        self._cache[key] = result
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return result
@@ -0,0 +1,102 @@
+import collections
+import math
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Stages of plan execution (keys of the records) for which the statistics are computed
+PLAN_STAGES = ("time_queued", "time_to_start", "time_run", "time_db_insert", "n_documents")
+
+
+def _percentile(values_sorted, p):
+    """
+    Returns the percentile ``p`` (0..100) of the sorted list of values (nearest-rank method).
+    """
+    n = max(int(math.ceil(p / 100 * len(values_sorted))), 1)
+    return values_sorted[n - 1]
+
+
+def _summarize(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {"count": len(values),
+            "total": sum(values),
+            "mean": sum(values) / len(values),
+            "min": values[0],
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "max": values[-1]}
+
+
+class PlanStats:
+    """
+    Rolling statistics of plan execution. Records of the most recently finished plans are kept
+    (the number of records is limited by ``max_records``). Each record contains the timings reported
+    by RE Worker (see `PLAN_STAGES`): the time the plan spent in the queue (``time_queued``),
+    the time from dispatching of the plan to RE Worker to the start of Run Engine
+    (``time_to_start``), the time of execution by Run Engine (``time_run``), the time spent inserting
+    documents into Databroker (``time_db_insert``) and the number of emitted documents
+    (``n_documents``). The values that are not available are None.
+
+    Documents are inserted into Databroker asynchronously, so ``time_db_insert`` is approximate:
+    it is the time spent inserting documents while the plan was executed. The documents that are
+    still waiting for insertion when the plan is finished (``n_documents_db_pending``, not included
+    in the statistics) are counted for the next plan.
+
+    Parameters
+    ----------
+    max_records: int
+        Maximum number of kept records.
+    """
+    def __init__(self, *, max_records=1000):
+        self._records = collections.deque(maxlen=max_records)
+
+    def add_record(self, record):
+        """
+        Add the record for the finished plan.
+
+        Parameters
+        ----------
+        record: dict
+            The record with the keys ``plan_uid``, ``name``, ``plan_state``, ``time_finished``,
+            ``n_documents_db_pending`` and the keys from `PLAN_STAGES`.
+        """
+        self._records.append(record)
+
+    def get_stats(self, *, name=None, n_recent=10):
+        """
+        Returns the statistics for the kept records.
+
+        Parameters
+        ----------
+        name: str or None
+            Name of the plan. If None, then the statistics are computed for all plans.
+        n_recent: int
+            The number of the most recent records included in the result.
+
+        Returns
+        -------
+        dict
+            The dictionary with the keys ``n_records`` (the number of records), ``stages`` (statistics
+            for each stage: ``count``, ``total``, ``mean``, ``min``, ``p50``, ``p95`` and ``max``,
+            None if there is no data), ``plans`` (for each plan name: the number of executions
+            and total time of each stage, sorted by total run time) and ``recent``
+            (the list of the most recent records, the newest first).
+        """
+        records = [_ for _ in self._records if (name is None) or (_["name"] == name)]
+
+        stages = {}
+        for stage in PLAN_STAGES:
+            stages[stage] = _summarize([_[stage] for _ in records if _.get(stage, None) is not None])
+
+        plans = {}
+        for r in records:
+            p = plans.setdefault(r["name"], {"count": 0, **{_: 0 for _ in PLAN_STAGES}})
+            p["count"] += 1
+            for stage in PLAN_STAGES:
+                p[stage] += r.get(stage, None) or 0
+        plans = dict(sorted(plans.items(), key=lambda _: _[1]["time_run"], reverse=True))
+
+        recent = records[::-1][:max(n_recent, 0)]
+        return {"n_records": len(records), "stages": stages, "plans": plans, "recent": recent}
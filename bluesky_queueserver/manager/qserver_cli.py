@@ -3,14 +3,14 @@ import asyncio
 import ast
 import time as ttime
 from datetime import datetime
+import json
 import pprint
 import re
 import sys
-import zmq
-import zmq.asyncio
 import argparse
 
 import bluesky_queueserver
+from .comms import ZMQCommSendAsync
 
 import logging
 logger = logging.getLogger(__name__)
@@ -31,16 +31,41 @@ http POST 0.0.0.0:8080/add_to_queue plan:='{"name":"scan", "args":[["det1", "det
 
 
 class CliClient:
+    """
+    Client for sending requests to RE Manager.
 
-    def __init__(self, *, address=None):
-        # ZeroMQ communication
-        self._ctx = zmq.asyncio.Context()
-        self._zmq_socket = None
+    The client supports long-lived sessions: the session owns an event loop and a connection
+    to RE Manager, which are reused by all requests sent during the session. The connection
+    is restored automatically if RE Manager is restarted. The session is opened by calling
+    `open_session()` or by using the object as a context manager.
 
+    Parameters
+    ----------
+    address: str or None
+        Address of RE Manager. The default address is used if None.
+    timeout: float
+        Timeout (in seconds) for waiting for the reply from RE Manager.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        with CliClient() as re_server:
+            for n in range(1000):
+                msg = re_server.send_request("ping")
+    """
+
+    def __init__(self, *, address=None, timeout=2.0):
         if address is None:
             self._zmq_server_address = "tcp://localhost:5555"
         else:
             self._zmq_server_address = address
+        self._timeout = timeout
+
+        # Event loop and connection used in the session
+        self._loop = None
+        self._zmq_comm = None
 
         # The attributes for storing output command and received input
         self._msg_command_out = ""
@@ -48,6 +73,25 @@ class CliClient:
         self._msg_in = {}
         self._msg_err_in = ""
 
+    def __enter__(self):
+        self.open_session()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_session()
+
+    def __del__(self):
+        # The finalizer must not run the event loop (another loop may be running in the thread
+        #   or the interpreter may be shutting down): only the socket and the loop are closed.
+        #   The session should be closed using `close_session()` or the context manager.
+        try:
+            if self._zmq_comm is not None:
+                self._zmq_comm.close()
+            if (self._loop is not None) and not self._loop.is_running():
+                self._loop.close()
+        except Exception:
+            pass
+
     @staticmethod
     def get_supported_commands():
         """
@@ -63,6 +107,10 @@ class CliClient:
             "ping": "",
             "queue_view": "queue_view",
             "add_to_queue": "add_to_queue",
+            "add_to_queue_batch": "add_to_queue_batch",
+            "insert_into_queue": "insert_into_queue",
+            "move_in_queue": "move_in_queue",
+            "remove_from_queue": "remove_from_queue",
             "pop_from_queue": "pop_from_queue",
             "clear_queue": "clear_queue",
             "create_environment": "create_environment",
@@ -71,6 +119,9 @@ class CliClient:
             "re_pause": "re_pause",
             "re_continue": "re_continue",
             "print_db_uids": "print_db_uids",
+            "list_runs": "list_runs",
+            "metrics": "metrics",
+            "plan_stats": "plan_stats",
             "stop_manager": "stop_manager",
             "kill_manager": "kill_manager",
         }
@@ -79,52 +130,85 @@ class CliClient:
     # ==========================================================================
     #    Functions that support ZeroMQ communications with RE Manager
 
-    async def _zmq_send(self, msg):
-        await self._zmq_socket.send_json(msg)
+    def _create_zmq_comm(self):
+        return ZMQCommSendAsync(zmq_server_address=self._zmq_server_address, timeout=self._timeout)
 
-    async def _zmq_receive(self):
-        return await self._zmq_socket.recv_json()
-
-    async def _zmq_communicate(self, msg_out):
+    async def _send_command(self, zmq_comm, *, command, value=None):
+        msg_out = self._create_msg(command=command, value=value)
         try:
-            await self._zmq_send(msg_out)
-            msg_in = await self._zmq_receive()
-            return msg_in
+            return await zmq_comm.send_message(**msg_out)
+        except asyncio.TimeoutError:
+            raise RuntimeError("ZeroMQ communication failed: timeout occurred")
         except Exception as ex:
             raise RuntimeError(f"ZeroMQ communication failed: {str(ex)}")
 
-    async def _zmq_open_connection(self, address):
-        if self._zmq_socket.connect(address):
-            msg_err = f"Failed to connect to the server '{address}'"
-            raise RuntimeError(msg_err)
+    def open_session(self):
+        """
+        Open the session: create the event loop and the connection to RE Manager.
+        The function does nothing if the session is already open.
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._zmq_comm = self._create_zmq_comm()
+            logger.info("Opened session with ZeroMQ server '%s'", self._zmq_server_address)
 
-    async def zmq_single_request(self):
-        self._zmq_socket = self._ctx.socket(zmq.REQ)
-        self._zmq_socket.RCVTIMEO = 2000  # Timeout for 'recv' operation
-        self._zmq_socket.SNDTIMEO = 500  # Timeout for 'send' operation
-        # Clear the buffer quickly after the socket is closed
-        self._zmq_socket.setsockopt(zmq.LINGER, 100)
+    def close_session(self):
+        """
+        Close the connection to RE Manager and the event loop.
+        """
+        if self._loop is not None:
+            self._zmq_comm.close()
+            # Let the cancelled tasks finish before the loop is closed
+            pending = asyncio.all_tasks(self._loop)
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+            self._loop, self._zmq_comm = None, None
+
+    def send_request(self, command, value=None):
+        """
+        Send the request to RE Manager and wait for the reply. The session is opened
+        if it is not open yet.
 
+        Parameters
+        ----------
+        command: str
+            The command (see `get_supported_commands()`).
+        value: object
+            The value sent with the command.
+
+        Returns
+        -------
+        dict
+            The reply from RE Manager.
+
+        Raises
+        ------
+        RuntimeError
+            Communication with RE Manager failed.
+        """
+        self.open_session()
+        return self._loop.run_until_complete(
+            self._send_command(self._zmq_comm, command=command, value=value))
+
+    async def zmq_single_request(self):
+        """
+        Send the request set by `set_msg_out()` using a temporary connection. The result
+        may be retrieved by calling `get_msg_in()`. Use `send_request()` to send multiple requests.
+        """
+        zmq_comm = self._create_zmq_comm()
         try:
-            await self._zmq_open_connection(self._zmq_server_address)
-            logger.info("Connected to ZeroMQ server '%s'", self._zmq_server_address)
-            self._msg_in = await self._send_command(command=self._msg_command_out,
+            self._msg_in = await self._send_command(zmq_comm, command=self._msg_command_out,
                                                     value=self._msg_value_out)
             self._msg_err_in = ""
         except Exception as ex:
             self._msg_in = None
             self._msg_err_in = str(ex)
-            # Close the socket to clear the buffer quickly in case of an error.
-            self._zmq_socket.close()
+        finally:
+            zmq_comm.close()
 
         if self._msg_err_in:
             logger.warning("Communication with RE Manager failed: %s", str(self._msg_err_in))
 
-    async def _send_command(self, *, command, value=None):
-        msg_out = self._create_msg(command=command, value=value)
-        msg_in = await self._zmq_communicate(msg_out)
-        return msg_in
-
     def _create_msg(self, command, value=None):
         # This function may transform human-friendly command names to API names
         command_dict = self.get_supported_commands()
@@ -133,6 +217,14 @@ class CliClient:
             # Present value in the proper format. This will change as the format is changed.
             if command == "add_to_queue":
                 value = {"plan": value}  # Value is dict
+            elif command == "add_to_queue_batch":
+                value = {"plans": value}  # Value is a list of dict
+            elif command in ("queue_view", "list_runs", "plan_stats"):
+                # Value is dict with optional keys 'start' and 'count' ('reverse' for 'list_runs')
+                #   or 'name' and 'n_recent' ('plan_stats')
+                value = value if isinstance(value, dict) else {}
+            elif command in ("insert_into_queue", "move_in_queue", "remove_from_queue"):
+                pass  # Value is dict with keys 'plan', 'plan_uid' and/or 'pos'
             else:
                 value = {"option": value}  # Value is str
             return {"command": command, "value": value}
@@ -147,6 +239,43 @@ class CliClient:
         return self._msg_in, self._msg_err_in
 
 
+def load_plans_from_file(file_name):
+    """
+    Load the list of plans from a file. The file may contain the list of plans in JSON
+    format or one plan (JSON) per line (JSONL). Empty lines in JSONL files are ignored.
+
+    Parameters
+    ----------
+    file_name: str
+        The name of the file.
+
+    Returns
+    -------
+    list(dict)
+        The list of plans.
+
+    Raises
+    ------
+    ValueError
+        The file contents has invalid format.
+    """
+    with open(file_name, "r") as f:
+        text = f.read()
+
+    try:
+        plans = json.loads(text)
+    except json.JSONDecodeError:
+        # The file is expected to be JSONL
+        try:
+            plans = [json.loads(_) for _ in text.splitlines() if _.strip()]
+        except json.JSONDecodeError as ex:
+            raise ValueError(f"File '{file_name}' contains invalid JSON or JSONL: {str(ex)}")
+
+    if not isinstance(plans, list) or not all(isinstance(_, dict) for _ in plans):
+        raise ValueError(f"File '{file_name}' must contain a list of plans (dictionaries)")
+    return plans
+
+
 def qserver():
 
     logging.basicConfig(level=logging.WARNING)
@@ -163,6 +292,9 @@ def qserver():
     parser.add_argument('--value', '-v', dest="value", action='store', default=None,
                         help="Arguments that are sent with the command. Currently the arguments "
                              "must be represented as a string that contains a python dictionary.")
+    parser.add_argument('--file', '-f', dest="file", action='store', default=None,
+                        help="File with the list of plans (JSON or JSONL, one plan per line). "
+                             "The plans are used as the value of the command 'add_to_queue_batch'.")
     parser.add_argument('--address', '-a', dest="address", action='store', default=None,
                         help="Address of the server (e.g. 'tcp://localhost:5555', quoted string)")
 
@@ -185,6 +317,19 @@ def qserver():
                   f"The value must be a valid Python dictionary")
             sys.exit(1)
 
+    if args.file is not None:
+        if command != "add_to_queue_batch":
+            print("The option '--file' is supported only by the command 'add_to_queue_batch'")
+            sys.exit(1)
+        if value is not None:
+            print("The options '--file' and '--value' can not be used at the same time")
+            sys.exit(1)
+        try:
+            value = load_plans_from_file(args.file)
+        except Exception as ex:
+            print(f"Failed to load plans from file: {str(ex)}")
+            sys.exit(1)
+
     # 'ping' command will be sent to RE Manager periodically if 'monitor' command is entered
     monitor_on = (command == "monitor")
     if monitor_on:
@@ -194,9 +339,10 @@ def qserver():
     re_server = CliClient(address=args.address)
     try:
         while True:
-            re_server.set_msg_out(command, value)
-            asyncio.run(re_server.zmq_single_request())
-            msg, msg_err = re_server.get_msg_in()
+            try:
+                msg, msg_err = re_server.send_request(command, value), ""
+            except Exception as ex:
+                msg, msg_err = None, str(ex)
 
             now = datetime.now()
             current_time = now.strftime("%H:%M:%S")
@@ -211,3 +357,5 @@ def qserver():
             ttime.sleep(1)
     except KeyboardInterrupt:
         print("\nThe program was manually stopped.")
+    finally:
+        re_server.close_session()
@@ -0,0 +1,99 @@
+import bisect
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RunCatalog:
+    """
+    Index of runs in Databroker catalog. The runs are ordered by the time of the start document.
+    The index is updated incrementally: metadata is read only for the runs that were added since
+    the previous request, so the time needed to select a page of runs does not depend on the number
+    of runs in the database (except for the time needed to load the new runs into the catalog).
+    The runs are not opened: metadata (start and stop documents) is read from the catalog entries.
+
+    The functions are blocking and should be called from a separate thread if used in the
+    event loop. The functions may be called concurrently from multiple threads.
+
+    Parameters
+    ----------
+    db: databroker.Broker
+        Databroker instance (v1 interface, the catalog is accessed using ``db.v2``).
+    """
+    def __init__(self, db):
+        self._db = db
+        self._lock = threading.Lock()
+        # Sorted list of tuples (time, uid)
+        self._index = []
+        self._uids = set()
+
+    def _update_index(self, entries):
+        """
+        Add new runs to the index. The index is rebuilt if runs were removed from the catalog.
+        """
+        uids = set(entries)
+        if not uids.issuperset(self._uids):
+            self._index, self._uids = [], set()
+
+        for uid in uids - self._uids:
+            start = entries[uid].describe()["metadata"]["start"] or {}
+            bisect.insort(self._index, (start.get("time", 0), uid))
+            self._uids.add(uid)
+
+    def list_runs(self, *, start=0, count=None, reverse=False):
+        """
+        Returns the list of runs.
+
+        Parameters
+        ----------
+        start: int
+            Index of the first selected run.
+        count: int or None
+            Maximum number of selected runs. All runs starting from ``start`` are selected
+            if ``count`` is None.
+        reverse: bool
+            Runs are ordered from the newest to the oldest if True.
+
+        Returns
+        -------
+        list(dict), int
+            The list of runs (dictionaries with keys ``uid``, ``scan_id``, ``plan_name``,
+            ``time`` and ``exit_status``) and the total number of runs in the catalog.
+
+        Raises
+        ------
+        ValueError
+            Invalid values of ``start`` or ``count``.
+        """
+        if not isinstance(start, int) or (start < 0):
+            raise ValueError(f"Index of the first run must be a non-negative integer: {start!r}")
+        if (count is not None) and (not isinstance(count, int) or (count < 0)):
+            raise ValueError(f"The number of runs must be a non-negative integer: {count!r}")
+
+        with self._lock:
+            catalog = self._db.v2
+            # Only new or modified files are loaded
+            catalog.force_reload()
+            # Catalog entries (runs are not opened)
+            entries = catalog.walk(depth=1)
+            self._update_index(entries)
+
+            n_runs = len(self._index)
+            stop = n_runs if count is None else min(start + count, n_runs)
+            if reverse:
+                selected = self._index[n_runs - stop: n_runs - start][::-1] if start < n_runs else []
+            else:
+                selected = self._index[start:stop]
+
+            runs = []
+            for _, uid in selected:
+                md = entries[uid].describe()["metadata"]
+                run_start, run_stop = md["start"] or {}, md["stop"] or {}
+                runs.append({"uid": uid,
+                             "scan_id": run_start.get("scan_id", None),
+                             "plan_name": run_start.get("plan_name", None),
+                             "time": run_start.get("time", None),
+                             "exit_status": run_stop.get("exit_status", None)})
+
+        return runs, n_runs
@@ -1,17 +1,39 @@
-from multiprocessing import Pipe
+import argparse
 import threading
 import time as ttime
 
 from .worker import RunEngineWorker
 from .manager import RunEngineManager
-from .comms import PipeJsonRpcReceive
+from .comms import PipeJsonRpcReceive, create_message_pipe
+from .logging_setup import setup_loggers
 
 import logging
 logger = logging.getLogger(__name__)
 
 
 class WatchdogProcess:
-    def __init__(self):
+    """
+    Watchdog process: starts RE Manager and RE Worker and restarts RE Manager if it stops
+    responding.
+
+    Parameters
+    ----------
+    config_worker: dict or None
+        Configuration passed to RE Worker (see `RunEngineWorker`).
+    pipe_codec: str
+        Codec used to encode messages sent between RE Manager and RE Worker
+        (``"pickle"`` or ``"msgpack"``). Messages sent between Watchdog and RE Manager
+        are always encoded as JSON.
+    pipe_shm_size: int
+        Size (in bytes) of ring buffers in shared memory used to pass large messages between
+        RE Manager and RE Worker. Shared memory is not used if the size is 0.
+    """
+    def __init__(self, *, config_worker=None, pipe_codec="pickle", pipe_shm_size=0):
+        self._config_worker = config_worker or {}
+        self._pipe_codec = pipe_codec
+        self._pipe_shm_size = pipe_shm_size
+        self._shm_buffers = []  # Ring buffers in shared memory (released on exit)
+
         self._re_manager = None
         self._re_worker = None
 
@@ -32,9 +54,10 @@ class WatchdogProcess:
 
     def _create_conn_pipes(self):
         # Manager to worker
-        self._manager_conn, self._worker_conn = Pipe()
+        self._manager_conn, self._worker_conn, self._shm_buffers = \
+            create_message_pipe(codec=self._pipe_codec, shm_size=self._pipe_shm_size)
         # Watchdog to manager
-        self._watchdog_to_manager_conn, self._manager_to_watchdog_conn = Pipe()
+        self._watchdog_to_manager_conn, self._manager_to_watchdog_conn, _ = create_message_pipe(codec="json")
 
     # ======================================================================
     #             Handlers for messages from RE Manager
@@ -46,7 +69,9 @@ class WatchdogProcess:
         """
         logger.info("Starting RE Worker ...")
         try:
-            self._re_worker = RunEngineWorker(conn=self._manager_conn, name="RE Worker Process")
+            self._re_worker = RunEngineWorker(conn=self._manager_conn,
+                                              config=self._config_worker,
+                                              name="RE Worker Process")
             self._re_worker.start()
             success, err_msg = True, ""
         except Exception as ex:
@@ -111,45 +136,91 @@ class WatchdogProcess:
 
     def run(self):
 
-        # Requests
+        # Requests (processed concurrently in the thread pool)
         self._comm_to_manager.add_method(self._start_re_worker_handler, "start_re_worker")
         self._comm_to_manager.add_method(self._join_re_worker_handler, "join_re_worker")
         self._comm_to_manager.add_method(self._kill_re_worker_handler, "kill_re_worker")
-        self._comm_to_manager.add_method(self._manager_stopping_handler, "manager_stopping")
-        # Notifications
         self._comm_to_manager.add_method(self._is_worker_alive_handler, "is_worker_alive")
+        # Notifications (processed immediately as they are received)
+        self._comm_to_manager.add_method(self._manager_stopping_handler, "manager_stopping")
         self._comm_to_manager.add_method(self._register_heartbeat_handler, "heartbeat")
 
         self._comm_to_manager.start()
 
-        self._start_re_manager()
-        while True:
-            # Primitive implementation of the loop that restarts the process.
-            self._re_manager.join(0.1)  # Small timeout
-
-            if self._manager_is_stopping and not self._re_manager.is_alive():
-                break  # Exit if the program was actually stopped (process joined)
-
-            with self._watchdog_state_lock:
-                time_passed = ttime.time() - self._watchdog_state
-
-            # Interval is used to protect the system from restarting in case of clock issues.
-            # It may be a better idea to implement a ticker in a separate thread to act as
-            #   a clock to be completely independent from system clock.
-            if (time_passed > 5.0) and (time_passed < 15.0) and not self._manager_is_stopping:
-                logger.error("Timeout detected by Watchdog. RE Manager malfunctioned and must be restarted.")
-                self._re_manager.kill()
-                self._start_re_manager()
-
-        self._comm_to_manager.stop()
+        try:
+            self._start_re_manager()
+            while True:
+                # Primitive implementation of the loop that restarts the process.
+                self._re_manager.join(0.1)  # Small timeout
+
+                if self._manager_is_stopping and not self._re_manager.is_alive():
+                    break  # Exit if the program was actually stopped (process joined)
+
+                with self._watchdog_state_lock:
+                    time_passed = ttime.time() - self._watchdog_state
+
+                # Interval is used to protect the system from restarting in case of clock issues.
+                # It may be a better idea to implement a ticker in a separate thread to act as
+                #   a clock to be completely independent from system clock.
+                if (time_passed > 5.0) and (time_passed < 15.0) and not self._manager_is_stopping:
+                    logger.error("Timeout detected by Watchdog. RE Manager malfunctioned and must be restarted.")
+                    self._re_manager.kill()
+                    self._start_re_manager()
+        finally:
+            self._comm_to_manager.stop()
+            for buffer in self._shm_buffers:
+                buffer.close(unlink=True)
 
 
 def start_manager():
 
-    logging.basicConfig(level=logging.WARNING)
-    logging.getLogger('bluesky_queueserver').setLevel("DEBUG")
+    parser = argparse.ArgumentParser(description="Start Run Engine (RE) Manager.")
+    parser.add_argument("--log-level", dest="log_level", action="store", default="DEBUG",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Logging level of RE Manager. Messages received and sent by RE Manager "
+                             "are logged at the level INFO, reduce the level to WARNING to disable "
+                             "logging of messages on busy servers (default: DEBUG).")
+    parser.add_argument("--databroker-queue-size", dest="databroker_queue_size", action="store",
+                        type=int, default=10000,
+                        help="Maximum number of documents waiting to be inserted into Databroker "
+                             "(default: 10000).")
+    parser.add_argument("--databroker-backpressure", dest="databroker_backpressure", action="store",
+                        default="block", choices=["block", "drop_events"],
+                        help="The policy used when the queue of documents waiting to be inserted into "
+                             "Databroker is full: 'block' - block Run Engine until there is free space "
+                             "in the queue, 'drop_events' - drop 'event' documents (default: 'block').")
+    parser.add_argument("--callbacks", dest="callbacks", action="store", nargs="*", default=["best_effort"],
+                        help="Callbacks subscribed to Run Engine in RE Worker: 'best_effort' (BestEffortCallback, "
+                             "prints tables with the collected data) or the full names of the classes "
+                             "(e.g. 'mymodule.MyCallback'). No callbacks are subscribed if the list "
+                             "is empty (default: 'best_effort').")
+    parser.add_argument("--zmq-publish-documents", dest="document_publisher_address", action="store",
+                        default=None,
+                        help="Address of ZMQ socket used by RE Worker to publish documents emitted by "
+                             "Run Engine, e.g. 'tcp://*:5578'. Documents are not published by default.")
+    parser.add_argument("--pipe-codec", dest="pipe_codec", action="store", default="pickle",
+                        choices=["pickle", "msgpack"],
+                        help="Codec used to encode messages sent between RE Manager and RE Worker "
+                             "('msgpack' requires 'msgpack' package) (default: 'pickle').")
+    parser.add_argument("--pipe-shm-size", dest="pipe_shm_size", action="store", type=int, default=0,
+                        help="Size (in bytes) of ring buffers in shared memory used to pass large messages "
+                             "between RE Manager and RE Worker (requires Python 3.8+). Shared memory "
+                             "is not used by default.")
+    args = parser.parse_args()
+
+    setup_loggers(log_level=args.log_level)
+
+    config_worker = {"databroker_queue_size": args.databroker_queue_size,
+                     "databroker_backpressure": args.databroker_backpressure,
+                     "callbacks": args.callbacks,
+                     "document_publisher_address": args.document_publisher_address}
 
-    wp = WatchdogProcess()
+    try:
+        wp = WatchdogProcess(config_worker=config_worker, pipe_codec=args.pipe_codec,
+                             pipe_shm_size=args.pipe_shm_size)
+    except (ValueError, RuntimeError) as ex:
+        logger.error("Failed to start RE Manager: %s", str(ex))
+        return 1
     try:
         wp.run()
     except KeyboardInterrupt:
@@ -0,0 +1,246 @@
+import pickle
+import threading
+import time as ttime
+import pytest
+import zmq
+from socket import gethostname
+
+from bluesky import RunEngine
+from bluesky.plans import count
+from bluesky.callbacks.best_effort import BestEffortCallback
+from bluesky.callbacks.core import CallbackCounter
+from databroker import Broker
+from ophyd.sim import det1, det2
+
+from bluesky_queueserver.manager.callbacks import (BufferedCallback, DatabrokerInserter, DocumentPublisher,
+                                                   create_callback)
+
+
+class _SlowBroker:
+    """
+    Imitates Databroker with slow backend: each call to 'insert' takes 'delay' seconds.
+    Insertion may be blocked using 'event_unblock'.
+    """
+    def __init__(self, *, delay=0):
+        self.delay = delay
+        self.docs = []
+        self.event_unblock = threading.Event()
+        self.event_unblock.set()
+
+    def insert(self, name, doc):
+        self.event_unblock.wait()
+        ttime.sleep(self.delay)
+        self.docs.append((name, doc))
+
+
+def test_databroker_inserter_event_pages():
+    """
+    Events are inserted as event pages, the data is inserted into Databroker correctly.
+    Slow insertion does not throttle Run Engine.
+    """
+    n_events, delay = 100, 0.01
+    db = _SlowBroker(delay=delay)
+    inserter = DatabrokerInserter(db)
+    inserter.start()
+
+    RE = RunEngine({})
+    RE.subscribe(inserter)
+
+    t_start = ttime.time()
+    RE(count([det1, det2], num=n_events))
+    t_elapsed = ttime.time() - t_start
+    # Each event would be inserted separately if the documents were inserted synchronously
+    assert t_elapsed < n_events * delay
+
+    inserter.stop()
+    names = [_[0] for _ in db.docs]
+    assert names[:2] == ["start", "descriptor"]
+    assert names[-1] == "stop"
+    assert "event" not in names
+    assert sum(len(doc["seq_num"]) for name, doc in db.docs if name == "event_page") == n_events
+
+    stats = inserter.get_stats()
+    assert stats["n_received"] == stats["n_processed"] == n_events + 3
+    assert stats["n_dropped"] == stats["n_errors"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["queue_depth_max"] > 0
+    assert stats["latency_max"] >= stats["latency_mean"] > 0
+
+    # Documents are inserted into Databroker and can be read back
+    db = Broker.named("temp")
+    inserter = DatabrokerInserter(db)
+    inserter.start()
+    RE.subscribe(inserter)
+    uid, = RE(count([det1], num=5))
+    inserter.stop()
+    assert list(db[uid].table()["det1"]) == [5.0] * 5
+
+
+@pytest.mark.parametrize("backpressure", ["block", "drop_events"])
+def test_buffered_callback_backpressure(backpressure):
+    """
+    Events are dropped if the queue is full and the policy is 'drop_events', otherwise
+    Run Engine is blocked until there is free space in the queue.
+    """
+    n_events, queue_size = 20, 5
+    db = _SlowBroker()
+    db.event_unblock.clear()
+    cb = BufferedCallback(db.insert, queue_size=queue_size, backpressure=backpressure)
+    cb.start()
+
+    RE = RunEngine({})
+    RE.subscribe(cb)
+
+    # Unblock insertion after delay
+    timer = threading.Timer(0.5, db.event_unblock.set)
+    timer.start()
+    RE(count([det1], num=n_events))
+    cb.stop()
+    timer.join()
+
+    stats = cb.get_stats()
+    names = [_[0] for _ in db.docs]
+    assert names[:2] == ["start", "descriptor"]
+    assert names[-1] == "stop"
+    assert stats["queue_depth_max"] <= queue_size
+    if backpressure == "block":
+        assert names.count("event") == n_events
+        assert stats["n_dropped"] == 0
+        assert stats["time_blocked"] > 0.2
+    else:
+        assert stats["n_dropped"] > 0
+        assert names.count("event") == n_events - stats["n_dropped"]
+    assert stats["n_processed"] + stats["n_dropped"] == stats["n_received"] == n_events + 3
+
+
+def test_buffered_callback_errors():
+    """
+    Exceptions raised by the callback are counted and don't stop processing of documents.
+    """
+    docs = []
+
+    def callback(name, doc):
+        if doc.get("fail", False):
+            raise RuntimeError("Callback failed")
+        docs.append(doc)
+
+    cb = BufferedCallback(callback)
+    cb.start()
+    for n in range(10):
+        cb("event", {"n": n, "fail": n % 2 == 1})
+    cb.stop()
+
+    assert [_["n"] for _ in docs] == [0, 2, 4, 6, 8]
+    assert cb.get_stats()["n_errors"] == 5
+
+    with pytest.raises(ValueError, match="Unsupported backpressure policy"):
+        BufferedCallback(callback, backpressure="unknown")
+
+
+def test_buffered_best_effort_callback(capsys):
+    """
+    BestEffortCallback processes documents in a separate thread: Run Engine only places
+    documents in the queue. The table with the data is still printed.
+    """
+    n_events = 50
+
+    bec = BestEffortCallback()
+    bec.disable_plots()
+    cb = BufferedCallback(bec, queue_size=1000, backpressure="drop_events")
+    cb.start()
+
+    # Slow callback: Run Engine is not waiting for the callback
+    def slow_callback(name, doc):
+        ttime.sleep(0.02)
+
+    cb_slow = BufferedCallback(slow_callback, queue_size=1000, backpressure="drop_events")
+    cb_slow.start()
+
+    RE = RunEngine({})
+    RE.subscribe(cb)
+    RE.subscribe(cb_slow)
+
+    t_start = ttime.time()
+    RE(count([det1], num=n_events))
+    t_elapsed = ttime.time() - t_start
+    assert t_elapsed < n_events * 0.02
+
+    cb.stop()
+    cb_slow.stop()
+    assert cb.get_stats()["n_errors"] == 0
+    assert cb_slow.get_stats()["n_processed"] == n_events + 3
+    assert "det1" in capsys.readouterr().out
+
+
+def test_create_callback():
+    """
+    Callbacks are created by name: 'best_effort' or the full name of the class.
+    """
+    bec = create_callback("best_effort")
+    assert isinstance(bec, BestEffortCallback)
+    assert bec._plots_enabled is False
+    assert isinstance(create_callback("bluesky.callbacks.core.CallbackCounter"), CallbackCounter)
+
+    with pytest.raises(ValueError, match="full name of the class"):
+        create_callback("CallbackCounter")
+    with pytest.raises(AttributeError):
+        create_callback("bluesky.callbacks.core.UnknownCallback")
+    with pytest.raises(ImportError):
+        create_callback("unknown_module.UnknownCallback")
+
+
+def test_document_publisher():
+    """
+    Documents are published on ZMQ socket in the format of ``bluesky.callbacks.zmq.Publisher``,
+    events are published as event pages.
+    """
+    n_events = 20
+    publisher = DocumentPublisher("tcp://127.0.0.1:*", prefix=b"qserver")
+    publisher.start()
+    address = publisher.address
+    assert address.startswith("tcp://127.0.0.1:")
+
+    ctx = zmq.Context()
+    socket = ctx.socket(zmq.SUB)
+    socket.connect(address)
+    socket.setsockopt(zmq.SUBSCRIBE, b"qserver")
+    # Allow the subscription to be established
+    ttime.sleep(0.5)
+
+    RE = RunEngine({})
+    RE.subscribe(publisher)
+    RE(count([det1], num=n_events))
+    publisher.stop()
+    assert publisher.address is None
+
+    docs = []
+    while socket.poll(1000):
+        prefix, name, doc = socket.recv().split(b" ", 2)
+        assert prefix == b"qserver"
+        docs.append((name.decode(), pickle.loads(doc)))
+    socket.close(linger=0)
+    ctx.term()
+
+    names = [_[0] for _ in docs]
+    assert names[:2] == ["start", "descriptor"]
+    assert names[-1] == "stop"
+    assert set(names[2:-1]) == {"event_page"}
+    assert sum(len(doc["seq_num"]) for name, doc in docs if name == "event_page") == n_events
+
+    with pytest.raises(ValueError, match="Prefix must be bytes"):
+        DocumentPublisher("tcp://127.0.0.1:*", prefix=b"a b")
+
+
+def test_document_publisher_wildcard_address():
+    """
+    If the socket is bound to all interfaces, the host name is reported in the address.
+    """
+    publisher = DocumentPublisher("tcp://*:*")
+    publisher.start()
+    try:
+        address = publisher.address
+    finally:
+        publisher.stop()
+    host, port = address.rsplit(":", 1)
+    assert host == f"tcp://{gethostname()}"
+    assert int(port) > 0
@@ -0,0 +1,193 @@
+import json
+from multiprocessing import Pipe, Process
+import os
+import threading
+import time as ttime
+import pytest
+
+from bluesky_queueserver.manager.codec import get_codec, ShmRingBuffer, msgpack, shared_memory
+from bluesky_queueserver.manager.comms import create_message_pipe, MessageConnection, PipeJsonRpcReceive
+
+_codec_names = ["pickle", "json", pytest.param("msgpack", marks=pytest.mark.skipif(
+    msgpack is None, reason="'msgpack' is not installed"))]
+_skip_no_shm = pytest.mark.skipif(shared_memory is None, reason="Shared memory requires Python 3.8+")
+# Benchmarks are not run by default: set the environment variable QSERVER_RUN_BENCHMARKS=1 to run them
+_benchmark = pytest.mark.skipif(not os.environ.get("QSERVER_RUN_BENCHMARKS"),
+                                reason="Benchmarks are run only if QSERVER_RUN_BENCHMARKS is set")
+
+
+def _plan_list(n_plans):
+    return [{"name": "count", "args": [["det1", "det2"]], "kwargs": {"num": 10, "delay": 0.1},
+             "plan_uid": f"{n:032d}"} for n in range(n_plans)]
+
+
+@pytest.mark.parametrize("codec", _codec_names)
+def test_codecs(codec):
+    """
+    Messages are encoded as bytes and decoded without changes.
+    """
+    msg = {"type": "report", "value": {"action": "plan_exit", "success": True, "result": ["abc"],
+                                       "err_msg": "", "timing": {"time_run": 0.5}, "data": None},
+           "plans": _plan_list(5)}
+    c = get_codec(codec)
+    assert c.name == codec
+    data = c.encode(msg)
+    assert isinstance(data, bytes)
+    assert c.decode(data) == msg
+
+    with pytest.raises(ValueError, match="Unknown codec"):
+        get_codec("unknown")
+
+
+@_skip_no_shm
+def test_shm_ring_buffer():
+    """
+    Messages are written to the ring buffer until it is full, the space is released
+    once the messages are read. Messages are stored in contiguous blocks (the end
+    of the buffer is skipped if necessary).
+    """
+    buffer = ShmRingBuffer(100)
+    try:
+        d1 = buffer.write(b"a" * 40)
+        d2 = buffer.write(b"b" * 40)
+        assert buffer.write(b"c" * 40) is None  # The buffer is full
+        assert buffer.read(*d1) == b"a" * 40
+
+        # 20 bytes at the end of the buffer are skipped
+        d3 = buffer.write(b"c" * 30)
+        assert d3 == (0, 30, 130)
+        assert buffer.write(b"d" * 20) is None
+        assert buffer.read(*d2) == b"b" * 40
+        assert buffer.read(*d3) == b"c" * 30
+
+        assert buffer.write(b"e" * 101) is None
+        # The message doesn't fit at the end of the buffer
+        assert buffer.write(b"e" * 71) is None
+        d4 = buffer.write(b"e" * 70)
+        assert d4 == (30, 70, 200)
+        assert buffer.read(*d4) == b"e" * 70
+    finally:
+        buffer.close(unlink=True)
+
+    with pytest.raises(ValueError, match="must be positive"):
+        ShmRingBuffer(0)
+
+
+def _echo(conn, n_messages):
+    for _ in range(n_messages):
+        conn.send(conn.recv())
+
+
+@pytest.mark.parametrize("shm_size", [0, pytest.param(1000000, marks=_skip_no_shm)])
+@pytest.mark.parametrize("codec", _codec_names)
+def test_message_connection(codec, shm_size):
+    """
+    Messages of different sizes are sent to another process and returned back. Large messages
+    are passed through shared memory if it is enabled.
+    """
+    conn1, conn2, buffers = create_message_pipe(codec=codec, shm_size=shm_size, shm_threshold=1000)
+    assert len(buffers) == (2 if shm_size else 0)
+    messages = [{"n": n, "plans": _plan_list(n_plans)} for n, n_plans in enumerate([0, 1, 100, 5000, 10, 5000])]
+
+    p = Process(target=_echo, args=(conn2, len(messages)))
+    p.start()
+    try:
+        for msg in messages:
+            conn1.send(msg)
+            assert conn1.poll(10)
+            assert conn1.recv() == msg
+    finally:
+        p.join(10)
+        for buffer in buffers:
+            buffer.close(unlink=True)
+    assert p.exitcode == 0
+
+
+def test_pipe_json_rpc_receive():
+    """
+    JSON-RPC requests and notifications are received and processed (JSON codec).
+    """
+    conn1, conn2, _ = create_message_pipe(codec="json")
+    pc = PipeJsonRpcReceive(conn=conn1)
+    notifications = []
+    pc.add_method(lambda *, value: {"value": value * 2}, "double")
+    pc.add_method(lambda: notifications.append("heartbeat"), "heartbeat")
+    pc.start()
+    try:
+        conn2.send({"method": "heartbeat", "jsonrpc": "2.0"})
+        conn2.send({"method": "double", "params": {"value": 5}, "jsonrpc": "2.0", "id": "1"})
+        assert conn2.poll(5)
+        assert conn2.recv() == {"result": {"value": 10}, "id": "1", "jsonrpc": "2.0"}
+        assert notifications == ["heartbeat"]
+
+        conn2.send({"method": "unknown", "jsonrpc": "2.0", "id": "2"})
+        assert conn2.poll(5)
+        assert conn2.recv()["error"]["message"] == "Method not found"
+    finally:
+        pc.stop()
+
+
+def _measure_throughput(send, recv, msg, n_messages):
+    """
+    Send the messages from the main thread and receive them in a separate thread.
+    Returns the number of messages per second.
+    """
+    received = []
+
+    def receive():
+        for _ in range(n_messages):
+            received.append(recv())
+
+    thread = threading.Thread(target=receive)
+    thread.start()
+    t_start = ttime.perf_counter()
+    for _ in range(n_messages):
+        send(msg)
+    thread.join()
+    rate = n_messages / (ttime.perf_counter() - t_start)
+    assert len(received) == n_messages
+    return rate, received[-1]
+
+
+@_benchmark
+@pytest.mark.parametrize("n_plans, n_messages", [(0, 5000), (10, 2000), (10000, 20)])
+def test_pipe_codec_benchmark(n_plans, n_messages):
+    """
+    Benchmark: throughput of the pipe for messages of different sizes (a short status message,
+    a plan and a large list of plans). The current paths (pickled message sent over
+    ``multiprocessing.Connection`` and JSON string pickled by the connection as used for
+    Watchdog) are compared to `MessageConnection` with different codecs and shared memory.
+    """
+    msg = {"type": "report", "value": {"action": "status", "plans": _plan_list(n_plans)}}
+    rates = {}
+
+    c1, c2 = Pipe()
+    rates["Connection (pickle)"], received = _measure_throughput(c1.send, c2.recv, msg, n_messages)
+    assert received == msg
+
+    rates["Connection (JSON string)"], received = _measure_throughput(
+        lambda m: c1.send(json.dumps(m)), lambda: json.loads(c2.recv()), msg, n_messages)
+    assert received == msg
+
+    codecs = ["pickle", "json"] + (["msgpack"] if msgpack is not None else [])
+    for codec in codecs:
+        c1, c2 = Pipe()
+        mc1, mc2 = MessageConnection(c1, codec=codec), MessageConnection(c2, codec=codec)
+        rates[f"MessageConnection ({codec})"], received = \
+            _measure_throughput(mc1.send, mc2.recv, msg, n_messages)
+        assert received == msg
+
+    if shared_memory is not None:
+        # The buffer fits a few of the largest messages (about 1 MB each)
+        mc1, mc2, buffers = create_message_pipe(codec="pickle", shm_size=5000000)
+        try:
+            rates["MessageConnection (pickle, shared memory)"], received = \
+                _measure_throughput(mc1.send, mc2.recv, msg, n_messages)
+        finally:
+            for buffer in buffers:
+                buffer.close(unlink=True)
+        assert received == msg
+
+    print(f"\nPipe throughput, message with {n_plans} plans (messages/s):")
+    for name, rate in rates.items():
+        print(f"    {name:45s} {rate:12.1f}")
@@ -0,0 +1,186 @@
+import asyncio
+from multiprocessing import Pipe
+import threading
+import time as ttime
+import pytest
+import zmq.asyncio
+
+from bluesky_queueserver.manager.comms import ConnSelector, create_message_pipe, PipeJsonRpcReceive
+from bluesky_queueserver.manager.manager import RunEngineManager
+
+
+def test_conn_selector_delivery():
+    """
+    Messages sent to multiple pipes are delivered to the respective handlers
+    without polling delay. The loop exits promptly once `stop()` is called.
+    """
+    conn1a, conn1b = Pipe()
+    conn2a, conn2b = Pipe()
+
+    received = {1: [], 2: []}
+    event_received = threading.Event()
+
+    def handler1(msg):
+        received[1].append((msg, ttime.perf_counter()))
+        event_received.set()
+
+    def handler2(msg):
+        received[2].append((msg, ttime.perf_counter()))
+        event_received.set()
+
+    cs = ConnSelector()
+    cs.register(conn1a, handler1)
+    cs.register(conn2a, handler2)
+    thread = threading.Thread(target=cs.run)
+    thread.start()
+
+    latencies = []
+    for n in range(50):
+        for conn in (conn1b, conn2b):
+            event_received.clear()
+            t_sent = ttime.perf_counter()
+            conn.send(n)
+            assert event_received.wait(5), "Timeout occurred while waiting for the message"
+            handler_id = 1 if conn is conn1b else 2
+            latencies.append(received[handler_id][-1][1] - t_sent)
+
+    assert [_[0] for _ in received[1]] == list(range(50))
+    assert [_[0] for _ in received[2]] == list(range(50))
+    assert max(latencies) < 0.05, "Message delivery latency is too high"
+
+    cs.stop()
+    thread.join(1)
+    assert not thread.is_alive(), "The loop failed to exit"
+
+
+def test_conn_selector_stop_from_handler():
+    """
+    The loop may be stopped by the message handler.
+    """
+    conn1, conn2 = Pipe()
+    cs = ConnSelector()
+    cs.register(conn1, lambda msg: cs.stop() if msg == "quit" else None)
+    thread = threading.Thread(target=cs.run)
+    thread.start()
+
+    conn2.send("msg")
+    conn2.send("quit")
+    thread.join(1)
+    assert not thread.is_alive(), "The loop failed to exit"
+
+
+def test_pipe_json_rpc_concurrent_requests():
+    """
+    Slow requests don't delay notifications and other requests. Responses are sent
+    as the requests are completed.
+    """
+    conn1, conn2, _ = create_message_pipe(codec="json")
+    pc = PipeJsonRpcReceive(conn=conn1)
+    heartbeats = []
+    pc.add_method(lambda *, timeout: ttime.sleep(timeout) or {"success": True}, "join_re_worker")
+    pc.add_method(lambda: {"worker_alive": True}, "is_worker_alive")
+    pc.add_method(lambda *, value: heartbeats.append(ttime.perf_counter()), "heartbeat")
+    pc.start()
+    try:
+        t_start = ttime.perf_counter()
+        conn2.send({"method": "join_re_worker", "params": {"timeout": 1}, "jsonrpc": "2.0", "id": "1"})
+        conn2.send({"method": "heartbeat", "params": {"value": "alive"}, "jsonrpc": "2.0"})
+        conn2.send({"method": "is_worker_alive", "jsonrpc": "2.0", "id": "2"})
+
+        responses = []
+        for _ in range(2):
+            assert conn2.poll(5)
+            responses.append((conn2.recv(), ttime.perf_counter() - t_start))
+        assert [_[0]["id"] for _ in responses] == ["2", "1"]
+        assert responses[0][1] < 0.5
+        assert responses[1][1] >= 1
+        assert len(heartbeats) == 1
+        assert heartbeats[0] - t_start < 0.5
+    finally:
+        pc.stop()
+
+
+def test_watchdog_send_concurrent():
+    """
+    RE Manager sends requests to Watchdog without waiting for responses to the previous
+    requests. Each request has its own timeout. Late responses are ignored.
+    """
+    conn1, conn2, _ = create_message_pipe(codec="json")
+    conn_worker, _ = Pipe()
+    manager = RunEngineManager(conn_watchdog=conn1, conn_worker=conn_worker)
+
+    pc = PipeJsonRpcReceive(conn=conn2)
+    heartbeats = []
+    pc.add_method(lambda *, timeout: ttime.sleep(timeout) or {"success": True}, "join_re_worker")
+    pc.add_method(lambda: ttime.sleep(1) or {"success": True}, "kill_re_worker")
+    pc.add_method(lambda: {"worker_alive": True}, "is_worker_alive")
+    pc.add_method(lambda *, value: heartbeats.append(value), "heartbeat")
+    pc.start()
+
+    async def testing():
+        manager._loop = asyncio.get_running_loop()
+        manager._loop.add_reader(conn1.fileno(), manager._receive_packet_watchdog)
+        try:
+            t_start = ttime.perf_counter()
+            # The request to join RE Worker is processed for 0.8 s (longer than the default timeout)
+            fut_join = asyncio.ensure_future(manager._watchdog_join_re_worker(timeout=0.8))
+            await asyncio.sleep(0.1)
+            await manager._watchdog_send_heartbeat()
+            assert await manager._watchdog_is_worker_alive() is True
+            assert ttime.perf_counter() - t_start < 0.5
+            assert await fut_join is True
+
+            # Timeout of one request does not affect other requests
+            fut_kill = asyncio.ensure_future(manager._watchdog_kill_re_worker())
+            assert await manager._watchdog_is_worker_alive() is True
+            assert await fut_kill is False
+            assert manager._watchdog_pending_requests == {}
+            await asyncio.sleep(1)  # The late response is received and ignored
+
+            with pytest.raises(asyncio.TimeoutError):
+                await manager._watchdog_send("join_re_worker", timeout=0.5, timeout_comm=0.1)
+        finally:
+            manager._loop.remove_reader(conn1.fileno())
+
+    try:
+        asyncio.run(testing())
+    finally:
+        pc.stop()
+    assert heartbeats == ["alive"]
+
+
+def test_zmq_receiver_restart(caplog):
+    """
+    The task that receives ZeroMQ requests is restarted if receiving of requests fails.
+    """
+    conn_watchdog, _ = Pipe()
+    conn_worker, _ = Pipe()
+    manager = RunEngineManager(conn_watchdog=conn_watchdog, conn_worker=conn_worker)
+    manager._zmq_restart_delay = 0.1
+    n_calls = []
+
+    async def zmq_receive():
+        n_calls.append(1)
+        if len(n_calls) == 1:
+            raise RuntimeError("Receiving failed")
+        manager._event_zmq_stop.set()
+        await asyncio.sleep(10)
+
+    manager._zmq_receive = zmq_receive
+
+    async def testing():
+        manager._ctx = zmq.asyncio.Context()
+        manager._event_zmq_stop = asyncio.Event()
+        manager._zmq_request_semaphore = asyncio.Semaphore(1)
+        try:
+            manager._zmq_socket = manager._ctx.socket(zmq.ROUTER)
+            manager._zmq_socket.bind("tcp://*:5598")
+            task_receive = await asyncio.wait_for(manager._zmq_wait_for_stop(), timeout=5)
+            task_receive.cancel()
+        finally:
+            manager._zmq_socket.close(linger=0)
+            manager._ctx.term()
+
+    asyncio.run(testing())
+    assert len(n_calls) == 2
+    assert "Receiving of ZeroMQ requests failed: Receiving failed" in caplog.text
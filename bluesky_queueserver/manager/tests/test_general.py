@@ -1,17 +1,37 @@
 import time as ttime
 import subprocess
 import asyncio
+import gc
+import json
+import sys
 import pytest
+import zmq
 
 from bluesky_queueserver.manager.qserver_cli import CliClient
 
+# Address of the socket used by RE Manager to publish events
+zmq_publisher_address = "tcp://localhost:5556"
+
 
 @pytest.fixture
 def re_manager():
     """
     Start RE Manager as a subprocess. Tests will communicate with RE Manager via ZeroMQ.
     """
-    p = subprocess.Popen(["start-re-manager"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # The output is discarded: RE Manager is blocked if the pipe buffer is full
+    p = subprocess.Popen(["start-re-manager"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # Wait until RE Manager is ready to accept requests (importing the worker
+    #   dependencies may take several seconds)
+    time_stop = ttime.time() + 30
+    while ttime.time() < time_stop:
+        re_server = CliClient()
+        re_server.set_msg_out("ping", None)
+        asyncio.run(re_server.zmq_single_request())
+        msg, _ = re_server.get_msg_in()
+        if msg is not None:
+            break
+        ttime.sleep(0.5)
 
     yield  # Nothing to return
 
@@ -42,21 +62,33 @@ def test_qserver_cli_and_manager(re_manager):
 
     def wait_for_processing_to_finish(time):
         """
-        Wait until queue is processed. Note: processing of TimeoutError is needed for
-        monitoring RE Manager while it is restarted.
+        Wait until queue is processed. The status of the queue is checked each time
+        RE Manager publishes 'queue_changed' event. The status is also checked once per second
+        if no events are received, which is needed for monitoring RE Manager while it is
+        restarted. Note: processing of TimeoutError is needed for the same reason.
         """
-        dt = 0.5  # Period for checking the queue status
-        time_stop = ttime.time() + time
-        while ttime.time() < time_stop:
-            ttime.sleep(dt/2)
-            try:
-                n_plans, is_plan_running = get_queue_status()
-                if (n_plans == 0) and not is_plan_running:
-                    return True
-            except TimeoutError:
-                pass
-            ttime.sleep(dt/2)
-        return False
+        ctx = zmq.Context()
+        socket = ctx.socket(zmq.SUB)
+        socket.setsockopt(zmq.SUBSCRIBE, b"queue_changed")
+        socket.RCVTIMEO = 1000
+        socket.connect(zmq_publisher_address)
+        try:
+            time_stop = ttime.time() + time
+            while ttime.time() < time_stop:
+                try:
+                    n_plans, is_plan_running = get_queue_status()
+                    if (n_plans == 0) and not is_plan_running:
+                        return True
+                except TimeoutError:
+                    pass
+                try:
+                    socket.recv_multipart()  # Wait for the next event
+                except zmq.Again:
+                    pass
+            return False
+        finally:
+            socket.close(linger=0)
+            ctx.term()
 
     # Clear queue
     subprocess.call(["qserver", "-c", "clear_queue"])
@@ -74,6 +106,32 @@ def test_qserver_cli_and_manager(re_manager):
     assert not is_plan_running, "Plan is executed while it shouldn't"
 
     subprocess.call(["qserver", "-c", "queue_view"])
+
+    re_server = CliClient()
+    re_server.set_msg_out("queue_view", {"start": 1, "count": 1})
+    asyncio.run(re_server.zmq_single_request())
+    msg, _ = re_server.get_msg_in()
+    assert msg["n_plans"] == 3, "Incorrect number of plans in the queue"
+    assert len(msg["queue"]) == 1, "Incorrect number of plans in the selected range"
+    assert msg["queue"][0]["name"] == "scan", "Incorrect plan in the selected range"
+
+    # The queue was not modified since the last request
+    queue_version = msg["queue_version"]
+    re_server.set_msg_out("queue_view", {"queue_version": queue_version})
+    asyncio.run(re_server.zmq_single_request())
+    msg, _ = re_server.get_msg_in()
+    assert msg["modified"] is False, "Queue is reported as modified"
+    assert "queue" not in msg, "Contents of the queue was returned"
+
+    # Paging through the unmodified queue: each page is returned even if the version is the same
+    for start, name in [(0, "count"), (1, "scan"), (2, "count")]:
+        re_server.set_msg_out("queue_view", {"start": start, "count": 1, "queue_version": queue_version})
+        asyncio.run(re_server.zmq_single_request())
+        msg, _ = re_server.get_msg_in()
+        assert msg["modified"] is True, "Contents of the queue page was not returned"
+        assert msg["queue_version"] == queue_version, "Queue version was changed"
+        assert [_["name"] for _ in msg["queue"]] == [name], "Incorrect plan in the selected range"
+
     subprocess.call(["qserver", "-c", "pop_from_queue"])
 
     n_plans, is_plan_running = get_queue_status()
@@ -130,3 +188,369 @@ def test_qserver_cli_and_manager(re_manager):
     assert wait_for_processing_to_finish(60), "Timeout while waiting for process to finish"
 
     subprocess.call(["qserver", "-c", "close_environment"])
+
+
+def test_zmq_concurrent_requests(re_manager):
+    """
+    Read-only requests are processed while RE environment is being created.
+    """
+    async def send_request(command, value=None):
+        re_server = CliClient()
+        re_server.set_msg_out(command, value)
+        await re_server.zmq_single_request()
+        msg, msg_err = re_server.get_msg_in()
+        assert msg is not None, f"Request '{command}' failed: {msg_err}"
+        return msg
+
+    async def testing():
+        task_create = asyncio.ensure_future(send_request("create_environment"))
+
+        # Count the requests that were completed before the environment was created
+        latencies, n_completed = [], 0
+        while not task_create.done():
+            t_start = ttime.time()
+            await send_request("ping")
+            await send_request("queue_view")
+            latencies.append(ttime.time() - t_start)
+            if not task_create.done():
+                n_completed += 1
+
+        msg = await task_create
+        assert msg["success"] is True, f"Failed to create environment: {msg}"
+        return latencies, n_completed
+
+    latencies, n_completed = asyncio.run(testing())
+    assert n_completed > 0, "Requests were not processed while environment was created"
+    assert max(latencies) < 0.5, "Requests were blocked while environment was created"
+
+    subprocess.call(["qserver", "-c", "close_environment"])
+
+
+def test_cli_client_session(re_manager):
+    """
+    Multiple requests are sent using the same connection. The connection is restored
+    after RE Manager is restarted.
+    """
+    n_requests = 500
+    with CliClient() as re_server:
+        t_start = ttime.time()
+        for n in range(n_requests):
+            msg = re_server.send_request("ping")
+            assert "n_plans" in msg, f"Unexpected reply: {msg}"
+        t_elapsed = ttime.time() - t_start
+        assert t_elapsed < 10, f"Processing of {n_requests} requests took too long: {t_elapsed} s"
+
+        # RE Manager is restarted by Watchdog after it is killed
+        with pytest.raises(RuntimeError, match="timeout"):
+            re_server.send_request("kill_manager")
+        time_stop, msg = ttime.time() + 30, None
+        while (msg is None) and (ttime.time() < time_stop):
+            try:
+                msg = re_server.send_request("ping")
+            except RuntimeError:
+                pass
+        assert msg is not None, "Connection was not restored after RE Manager was restarted"
+
+
+def test_cli_client_finalizer(monkeypatch):
+    """
+    The session that was not closed does not cause errors when the object is garbage-collected
+    while another event loop is running in the thread.
+    """
+    errors = []
+    monkeypatch.setattr(sys, "unraisablehook", lambda unraisable: errors.append(unraisable))
+
+    # RE Manager is not running: the request times out, but the socket is open
+    re_server = CliClient(address="tcp://localhost:5599", timeout=0.1)
+    with pytest.raises(RuntimeError, match="timeout"):
+        re_server.send_request("ping")
+
+    async def testing():
+        nonlocal re_server
+        re_server = None
+        gc.collect()
+
+    asyncio.run(testing())
+    assert errors == []
+
+
+def test_add_to_queue_batch(re_manager, tmp_path):
+    """
+    Adding batches of plans to the queue using CLI (from JSONL file) and the session API.
+    """
+    n_plans = 2000
+    plans = [{"name": "count", "args": [["det1", "det2"]], "kwargs": {"num": n % 5 + 1}}
+             for n in range(n_plans)]
+
+    file_name = str(tmp_path / "plans.jsonl")
+    with open(file_name, "w") as f:
+        f.writelines(f"{json.dumps(_)}\n" for _ in plans[:10])
+
+    subprocess.call(["qserver", "-c", "clear_queue"])
+    assert subprocess.call(["qserver", "-c", "add_to_queue_batch", "-f", file_name]) == 0
+
+    with CliClient() as re_server:
+        assert re_server.send_request("ping")["n_plans"] == 10
+
+        msg = re_server.send_request("add_to_queue_batch", plans)
+        assert msg["success"] is True
+        assert msg["n_added"] == n_plans
+        assert len(set(msg["plan_uids"])) == n_plans
+
+        msg = re_server.send_request("queue_view", {"start": 10, "count": 3})
+        assert msg["n_plans"] == n_plans + 10
+        assert [_["kwargs"] for _ in msg["queue"]] == [_["kwargs"] for _ in plans[:3]]
+
+        # Invalid batch is rejected and the queue is not changed
+        msg = re_server.send_request("add_to_queue_batch", [{"name": "count"}, "count"])
+        assert msg == {"success": False, "msg": "Plan #2 is not a dictionary: 'count'"}
+        assert re_server.send_request("ping")["n_plans"] == n_plans + 10
+
+        re_server.send_request("clear_queue")
+
+
+def test_queue_editing(re_manager):
+    """
+    Inserting, moving and removing plans by UID.
+    """
+    with CliClient() as re_server:
+        re_server.send_request("clear_queue")
+        for n in range(3):
+            re_server.send_request("add_to_queue", {"name": "count", "args": [["det1"]], "kwargs": {"num": n}})
+
+        def get_nums():
+            queue = re_server.send_request("queue_view")["queue"]
+            return [_["kwargs"]["num"] for _ in queue], [_["plan_uid"] for _ in queue]
+
+        msg = re_server.send_request("insert_into_queue", {"plan": {"name": "count", "args": [["det1"]],
+                                                                    "kwargs": {"num": 3}}, "pos": 1})
+        assert msg["success"] is True
+        assert msg["pos"] == 1
+        nums, uids = get_nums()
+        assert nums == [0, 3, 1, 2]
+        assert uids[1] == msg["plan"]["plan_uid"]
+
+        msg = re_server.send_request("move_in_queue", {"plan_uid": uids[0], "pos": -1})
+        assert msg == {"success": True, "msg": "", "pos": 3}
+        msg = re_server.send_request("remove_from_queue", {"plan_uid": uids[2]})
+        assert msg["success"] is True
+        assert msg["plan"]["kwargs"]["num"] == 1
+        assert get_nums()[0] == [3, 2, 0]
+
+        msg = re_server.send_request("remove_from_queue", {"plan_uid": uids[2]})
+        assert msg["success"] is False
+        assert "not in the queue" in msg["msg"]
+
+        # Invalid input is reported to the client, the queue is not changed
+        plan = {"name": "count", "args": [["det1"]], "priority": 100}
+        msg = re_server.send_request("add_to_queue", plan)
+        assert msg["success"] is False
+        assert "Priority of the plan must be an integer" in msg["msg"]
+        msg = re_server.send_request("add_to_queue_batch", [plan])
+        assert msg["success"] is False
+        assert "Priority of the plan must be an integer" in msg["msg"]
+        assert get_nums()[0] == [3, 2, 0]
+
+        re_server.send_request("clear_queue")
+
+
+def test_plan_validation(re_manager):
+    """
+    Plans are validated using the registry of plans and devices received from RE Worker.
+    """
+    with CliClient(timeout=10) as re_server:
+        re_server.send_request("clear_queue")
+        assert re_server.send_request("create_environment")["success"] is True
+
+        msg = re_server.send_request("add_to_queue", {"name": "count", "args": [["det1", "det3"]]})
+        assert msg["success"] is False
+        assert "Device 'det3' is not in the list of allowed devices" in msg["msg"]
+        msg = re_server.send_request("add_to_queue_batch", [{"name": "count", "args": [["det1"]]},
+                                                            {"name": "cnt", "args": [["det1"]]}])
+        assert msg["success"] is False
+        assert "Plan #2 is invalid" in msg["msg"]
+        assert re_server.send_request("ping")["n_plans"] == 0
+
+        msg = re_server.send_request("add_to_queue", {"name": "count", "args": [["det1", "det2"]]})
+        assert "plan_uid" in msg
+        assert re_server.send_request("ping")["n_plans"] == 1
+
+        re_server.send_request("clear_queue")
+        re_server.send_request("close_environment")
+
+
+def test_list_runs(re_manager):
+    """
+    The list of runs is returned page by page, the newest runs may be requested first.
+    """
+    n_runs = 3
+    with CliClient(timeout=10) as re_server:
+        re_server.send_request("clear_queue")
+        assert re_server.send_request("create_environment")["success"] is True
+        for n in range(n_runs):
+            re_server.send_request("add_to_queue", {"name": "count", "args": [["det1"]]})
+        re_server.send_request("process_queue")
+
+        time_stop = ttime.time() + 30
+        while ttime.time() < time_stop:
+            msg = re_server.send_request("ping")
+            if (msg["n_plans"] == 0) and not msg["is_plan_running"]:
+                break
+            ttime.sleep(0.5)
+
+        # Documents are inserted into the database by a separate thread
+        time_stop = ttime.time() + 10
+        while ttime.time() < time_stop:
+            msg = re_server.send_request("list_runs")
+            if msg["n_runs"] == n_runs:
+                break
+            ttime.sleep(0.5)
+        assert msg["success"] is True
+        assert msg["n_runs"] == n_runs
+        assert [_["scan_id"] for _ in msg["runs"]] == [1, 2, 3]
+        assert all(_["plan_name"] == "count" and _["exit_status"] == "success" for _ in msg["runs"])
+
+        msg = re_server.send_request("list_runs", {"start": 1, "count": 1, "reverse": True})
+        assert msg["n_runs"] == n_runs
+        assert [_["scan_id"] for _ in msg["runs"]] == [2]
+
+        msg = re_server.send_request("list_runs", {"start": -1})
+        assert msg["success"] is False
+
+        re_server.send_request("close_environment")
+
+
+def test_metrics(re_manager):
+    """
+    Metrics collected by RE Manager: latency of requests, Redis calls, pipe messages, queue length.
+    """
+    with CliClient() as re_server:
+        re_server.send_request("clear_queue")
+        for _ in range(3):
+            re_server.send_request("add_to_queue", {"name": "count", "args": [["det1"]]})
+        for _ in range(5):
+            re_server.send_request("queue_view")
+
+        msg = re_server.send_request("metrics")
+        assert msg["success"] is True
+        metrics = {_["name"]: _ for _ in msg["metrics"]}
+
+        requests = {_["labels"]["command"]: _ for _ in metrics["request_duration_seconds"]["series"]}
+        assert requests["queue_view"]["count"] == 5
+        assert requests["add_to_queue"]["count"] == 3
+        assert requests["queue_view"]["buckets"][-1] == ["+Inf", 5]
+
+        redis_calls = {_["labels"]["script"]: _ for _ in metrics["redis_call_duration_seconds"]["series"]}
+        assert redis_calls["insert_plan_to_queue"]["count"] == 3
+
+        pipe = {(_["labels"]["peer"], _["labels"]["direction"]): _["value"]
+                for _ in metrics["pipe_messages_total"]["series"]}
+        assert pipe[("watchdog", "sent")] > 0
+
+        assert metrics["queue_length"]["series"] == [{"labels": {}, "value": 3}]
+        assert metrics["loop_lag_max_seconds"]["series"][0]["value"] >= 0
+        assert isinstance(msg["loop_stalls"], list)
+
+        re_server.send_request("clear_queue")
+
+
+def test_plan_stats(re_manager):
+    """
+    Timings of executed plans are reported by RE Worker and aggregated by RE Manager.
+    """
+    with CliClient(timeout=10) as re_server:
+        re_server.send_request("clear_queue")
+        assert re_server.send_request("create_environment")["success"] is True
+        re_server.send_request("add_to_queue", {"name": "count", "args": [["det1"]], "kwargs": {"num": 5}})
+        re_server.send_request("add_to_queue", {"name": "count", "args": [["det1", "det2"]]})
+        re_server.send_request("process_queue")
+
+        time_stop = ttime.time() + 30
+        while ttime.time() < time_stop:
+            msg = re_server.send_request("ping")
+            if (msg["n_plans"] == 0) and not msg["is_plan_running"]:
+                break
+            ttime.sleep(0.5)
+
+        msg = re_server.send_request("plan_stats")
+        assert msg["success"] is True
+        assert msg["n_records"] == 2
+        assert list(msg["plans"]) == ["count"]
+        assert msg["plans"]["count"]["count"] == 2
+        assert msg["stages"]["n_documents"]["total"] == 8 + 4
+
+        # The most recent plan is the first
+        recent = msg["recent"]
+        assert [_["n_documents"] for _ in recent] == [4, 8]
+        for record in recent:
+            assert record["plan_state"] == "completed"
+            assert record["time_run"] > 0
+            assert record["time_queued"] >= 0
+            assert record["time_to_start"] >= 0
+            assert record["time_db_insert"] >= 0
+            assert record["n_documents_db_pending"] >= 0
+        # The second plan waited in the queue while the first plan was executed
+        assert recent[0]["time_queued"] >= recent[1]["time_run"]
+
+        msg = re_server.send_request("plan_stats", {"name": "unknown", "n_recent": 1})
+        assert msg["n_records"] == 0
+        assert msg["stages"]["time_run"] is None
+
+        re_server.send_request("close_environment")
+
+
+def test_zmq_published_events(re_manager):
+    """
+    RE Manager publishes events when the queue or the state of RE Manager is changed.
+    """
+    ctx = zmq.Context()
+    socket = ctx.socket(zmq.SUB)
+    socket.setsockopt(zmq.SUBSCRIBE, b"")
+    socket.RCVTIMEO = 100
+    socket.connect(zmq_publisher_address)
+    ttime.sleep(0.5)  # Wait for the subscription to be established
+
+    def wait_for_event(event, time=10):
+        """
+        Receive published events until the event with the given name is received.
+        """
+        time_stop = ttime.time() + time
+        while ttime.time() < time_stop:
+            try:
+                topic, msg_json = socket.recv_multipart()
+            except zmq.Again:
+                continue
+            msg = json.loads(msg_json)
+            assert topic.decode() == msg["event"], "Topic doesn't match the event name"
+            if msg["event"] == event:
+                return msg
+        assert False, f"Timeout occurred while waiting for the event '{event}'"
+
+    try:
+        subprocess.call(["qserver", "-c", "clear_queue"])
+        subprocess.call(["qserver", "-c", "add_to_queue", "-v",
+                         "{'name':'count', 'args':[['det1', 'det2']]}"])
+        msg = wait_for_event("queue_changed")
+        assert msg["n_plans"] == 1
+        assert msg["is_plan_running"] is False
+
+        subprocess.call(["qserver", "-c", "create_environment"])
+        wait_for_event("environment_created")
+
+        subprocess.call(["qserver", "-c", "process_queue"])
+        msg = wait_for_event("plan_started")
+        assert msg["name"] == "count"
+        plan_uid = msg["plan_uid"]
+        msg = wait_for_event("re_state_changed")
+        assert msg["re_state"] == "running"
+        msg = wait_for_event("plan_exit")
+        assert msg["plan_uid"] == plan_uid
+        assert msg["plan_state"] == "completed"
+        msg = wait_for_event("queue_changed")
+        assert msg["n_plans"] == 0
+
+        subprocess.call(["qserver", "-c", "close_environment"])
+        wait_for_event("environment_closed")
+    finally:
+        socket.close(linger=0)
+        ctx.term()
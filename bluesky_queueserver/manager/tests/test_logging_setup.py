@@ -0,0 +1,164 @@
+import io
+import json
+import logging
+import os
+import pprint
+import time as ttime
+import pytest
+
+from bluesky_queueserver.manager.logging_setup import summarize_payload, PPrintForLogging
+
+
+def test_summarize_payload():
+    """
+    Large lists, dictionaries and strings are summarized, small payloads are unchanged.
+    """
+    msg = {"success": True, "msg": "", "plan": {"name": "count", "args": [["det1", "det2"]]}}
+    assert summarize_payload(msg) == msg
+    assert str(PPrintForLogging(msg)) == pprint.pformat(msg)
+
+    msg = {"queue": [{"name": "count", "plan_uid": str(n)} for n in range(1000)],
+           "text": "a" * 1000, "data": b"b" * 1000}
+    s = str(PPrintForLogging(msg, max_items=5, max_str_len=20))
+    assert "<1000 items total>" in s
+    assert "1000 characters total" in s
+    assert "1000 bytes total" in s
+    assert s.count("plan_uid") == 5
+    # The original message is not modified
+    assert len(msg["queue"]) == 1000
+
+    s = str(PPrintForLogging({"a": {"b": {"c": [1, 2, 3]}}}, max_depth=2))
+    assert "<dict of 1 items>" in s
+    s = str(PPrintForLogging({str(n): n for n in range(20)}, max_items=3))
+    assert "<20 items total>" in s
+
+
+def test_formatting_is_deferred():
+    """
+    The payload is formatted only if the record is emitted.
+    """
+    class Payload:
+        n_calls = 0
+
+        def __repr__(self):
+            Payload.n_calls += 1
+            return "payload"
+
+    logger = logging.getLogger("bluesky_queueserver.test_logging_setup")
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        logger.setLevel(logging.WARNING)
+        logger.info("Message: %s", PPrintForLogging([Payload()]))
+        assert Payload.n_calls == 0
+
+        logger.setLevel(logging.INFO)
+        logger.info("Message: %s", PPrintForLogging([Payload()]))
+        assert Payload.n_calls == 1
+        assert stream.getvalue() == "Message: [payload]\n"
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+
+
+# Benchmarks are not run by default: set the environment variable QSERVER_RUN_BENCHMARKS=1 to run them
+_benchmark = pytest.mark.skipif(not os.environ.get("QSERVER_RUN_BENCHMARKS"),
+                                reason="Benchmarks are run only if QSERVER_RUN_BENCHMARKS is set")
+
+
+def _queue_view_messages(n_plans):
+    msg_in = {"command": "queue_view", "params": {}}
+    msg_out = {"queue": [{"name": "count", "args": [["det1", "det2"]], "kwargs": {"num": 10},
+                          "plan_uid": f"{n:032d}"} for n in range(n_plans)],
+               "running_item": {}, "queue_version": 1}
+    return msg_in, msg_out
+
+
+class _TestLogger:
+    """
+    Logger that writes records to a string buffer (the records are not propagated).
+    """
+    def __init__(self, log_level):
+        self.logger = logging.getLogger("bluesky_queueserver.test_logging_setup")
+        self.stream = io.StringIO()
+        self._handler = logging.StreamHandler(self.stream)
+        self._log_level = log_level
+
+    def __enter__(self):
+        self.logger.addHandler(self._handler)
+        self.logger.propagate = False
+        self.logger.setLevel(self._log_level)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.logger.removeHandler(self._handler)
+        self.logger.propagate = True
+        self.logger.setLevel(logging.NOTSET)
+
+
+@pytest.mark.parametrize("log_level", [logging.INFO, logging.WARNING])
+def test_logging_of_requests(log_level, monkeypatch):
+    """
+    Requests and replies are formatted only if logging is enabled, only the summary
+    of the large reply is logged.
+    """
+    n_plans, n_requests = 2000, 10
+    msg_in, msg_out = _queue_view_messages(n_plans)
+
+    n_formatted = 0
+    pprint_str = PPrintForLogging.__str__
+
+    def pprint_str_counted(self):
+        nonlocal n_formatted
+        n_formatted += 1
+        return pprint_str(self)
+
+    monkeypatch.setattr(PPrintForLogging, "__str__", pprint_str_counted)
+
+    with _TestLogger(log_level) as t:
+        for _ in range(n_requests):
+            t.logger.info("ZeroMQ server received request: %s", PPrintForLogging(msg_in))
+            t.logger.info("ZeroMQ server sending response: %s", PPrintForLogging(msg_out))
+
+    if log_level == logging.INFO:
+        assert n_formatted == 2 * n_requests
+        # The summary of the reply is logged, not the full queue
+        assert t.stream.getvalue().count("plan_uid") == 10 * n_requests
+        assert t.stream.getvalue().count(f"<{n_plans} items total>") == n_requests
+    else:
+        assert n_formatted == 0
+        assert t.stream.getvalue() == ""
+
+
+@_benchmark
+@pytest.mark.parametrize("log_level", [logging.INFO, logging.WARNING])
+def test_logging_throughput_benchmark(log_level):
+    """
+    Benchmark: throughput of processing of 'queue_view' requests for the large queue with
+    logging of requests and replies enabled (INFO) and disabled (WARNING). Processing
+    of the request is represented by JSON encoding of the reply (as in RE Manager).
+    Throughput with lazy formatting is compared to eager pretty-printing of the messages.
+    """
+    n_plans, n_requests = 2000, 10
+    msg_in, msg_out = _queue_view_messages(n_plans)
+
+    with _TestLogger(log_level) as t:
+        def process_request(fmt):
+            t.logger.info("ZeroMQ server received request: %s", fmt(msg_in))
+            reply = json.dumps(msg_out).encode()
+            t.logger.info("ZeroMQ server sending response: %s", fmt(msg_out))
+            return reply
+
+        def measure(fmt):
+            t_start = ttime.perf_counter()
+            for _ in range(n_requests):
+                process_request(fmt)
+            return n_requests / (ttime.perf_counter() - t_start)
+
+        rate_eager = measure(pprint.pformat)
+        rate_lazy = measure(PPrintForLogging)
+
+    print(f"Logging level {logging.getLevelName(log_level)}: eager formatting - {rate_eager:.1f} requests/s, "
+          f"lazy formatting - {rate_lazy:.1f} requests/s")
@@ -0,0 +1,46 @@
+import asyncio
+import time as ttime
+
+from bluesky_queueserver.manager.loop_monitor import LoopLagMonitor
+
+
+def test_loop_lag_monitor():
+    """
+    Stalls of the event loop are detected and the offending handler is identified.
+    """
+    async def _slow_handler(delay):
+        ttime.sleep(delay)  # Blocks the loop
+
+    async def _blocking_function(delay):
+        ttime.sleep(delay)
+
+    async def testing():
+        monitor = LoopLagMonitor(interval=0.02, threshold=0.2, n_stalls=2)
+        task = asyncio.ensure_future(monitor.run())
+        await asyncio.sleep(0.1)
+
+        await _slow_handler(0.05)  # Not a stall
+        await asyncio.sleep(0.1)
+        for delay in (0.3, 0.5, 0.4):
+            await _slow_handler(delay)
+            await asyncio.sleep(0.1)
+        await _blocking_function(0.3)
+        await asyncio.sleep(0.1)
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return monitor.get_stats()
+
+    stats = asyncio.run(testing())
+    assert stats["n_stalls"] == 4
+    # The lag is measured from the scheduled wake up time, so it may be shorter than the stall by 'interval'
+    assert 0.45 < stats["lag_max"] < 1.0
+    assert stats["lag_last"] < 0.2
+
+    # Only the longest stalls are kept
+    stalls = stats["longest_stalls"]
+    assert len(stalls) == 2
+    assert 0.45 < stalls[0]["duration"] < 1.0
+    assert 0.35 < stalls[1]["duration"] < stalls[0]["duration"]
+    assert all(_["handler"].startswith("test_loop_monitor.py:") for _ in stalls)
+    assert all(_["handler"].endswith("_slow_handler") for _ in stalls)
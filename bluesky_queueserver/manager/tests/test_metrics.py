@@ -0,0 +1,66 @@
+import time as ttime
+import pytest
+
+from bluesky_queueserver.manager.metrics import Metrics, format_prometheus
+
+
+def test_metrics():
+    """
+    Counters, gauges and histograms with labels.
+    """
+    m = Metrics()
+    m.declare_counter("messages_total", "Number of messages")
+    m.declare_gauge("queue_length", "Number of plans in the queue")
+    m.declare_histogram("request_duration_seconds", "Time of processing", buckets=(0.01, 0.1))
+
+    m.inc("messages_total", peer="worker", direction="sent")
+    m.inc("messages_total", 2, direction="sent", peer="worker")
+    m.inc("messages_total", peer="watchdog", direction="sent")
+    m.set("queue_length", 5)
+    m.set("queue_length", 3)
+    for v in (0.005, 0.05, 0.05, 1.0):
+        m.observe("request_duration_seconds", v, command="queue_view")
+
+    metrics = {_["name"]: _ for _ in m.get_metrics()}
+    assert metrics["messages_total"]["type"] == "counter"
+    assert metrics["messages_total"]["series"] == [
+        {"labels": {"direction": "sent", "peer": "worker"}, "value": 3},
+        {"labels": {"direction": "sent", "peer": "watchdog"}, "value": 1}]
+    assert metrics["queue_length"]["series"] == [{"labels": {}, "value": 3}]
+    hist, = metrics["request_duration_seconds"]["series"]
+    assert hist["buckets"] == [[0.01, 1], [0.1, 3], ["+Inf", 4]]
+    assert hist["count"] == 4
+    assert hist["sum"] == pytest.approx(1.105)
+
+    text = format_prometheus(m.get_metrics())
+    lines = text.splitlines()
+    assert "# HELP qserver_messages_total Number of messages" in lines
+    assert "# TYPE qserver_messages_total counter" in lines
+    assert 'qserver_messages_total{direction="sent",peer="worker"} 3.0' in lines
+    assert "qserver_queue_length 3.0" in lines
+    assert "# TYPE qserver_request_duration_seconds histogram" in lines
+    assert 'qserver_request_duration_seconds_bucket{command="queue_view",le="0.1"} 3' in lines
+    assert 'qserver_request_duration_seconds_bucket{command="queue_view",le="+Inf"} 4' in lines
+    assert 'qserver_request_duration_seconds_count{command="queue_view"} 4' in lines
+
+    with pytest.raises(ValueError, match="already declared"):
+        m.declare_gauge("queue_length", "Number of plans")
+
+
+def test_metrics_overhead():
+    """
+    Updating metrics is cheap enough to keep the instrumentation enabled in production.
+    """
+    m = Metrics()
+    m.declare_histogram("request_duration_seconds", "Time of processing")
+    m.declare_counter("messages_total", "Number of messages")
+
+    n_updates = 100000
+    t_start = ttime.perf_counter()
+    for n in range(n_updates):
+        m.observe("request_duration_seconds", n * 1e-6, command="queue_view")
+        m.inc("messages_total", peer="worker", direction="sent")
+    t_update = (ttime.perf_counter() - t_start) / n_updates / 2
+
+    print(f"Average time of metric update: {t_update * 1e6:.3f} us")
+    assert t_update < 20e-6
@@ -0,0 +1,439 @@
+import asyncio
+import json
+import time as ttime
+import pytest
+
+from bluesky_queueserver.manager.plan_queue_ops import PlanQueueOperations
+
+
+async def _create_pq():
+    """
+    Create an instance of PlanQueueOperations. Redis entries used by the queue are deleted.
+    """
+    pq = PlanQueueOperations()
+    await pq.start()
+    await pq.delete_pool_entries()
+    return pq
+
+
+def test_plan_queue_running_plan_transitions():
+    """
+    Moving plans between the queue and the running plan.
+    """
+    async def testing():
+        pq = await _create_pq()
+
+        plans = [{"name": "a", "plan_uid": "1"}, {"name": "b", "plan_uid": "2"}]
+        for plan in plans:
+            await pq.add_plan_to_queue(plan)
+        assert await pq.get_queue_size() == 2
+        assert await pq.is_plan_running() is False
+
+        plan, n_pending = await pq.set_next_plan_as_running()
+        assert plan == plans[0]
+        assert n_pending == 1
+        assert await pq.get_running_plan_info() == plans[0]
+        assert await pq.get_queue() == plans[1:]
+
+        # The stopped plan is pushed back to the front of the queue
+        assert await pq.set_processed_plan_as_stopped() == plans[0]
+        assert await pq.is_plan_running() is False
+        assert await pq.get_queue() == plans
+
+        # No plan is running: the queue is not changed
+        assert await pq.set_processed_plan_as_stopped() == {}
+        assert await pq.get_queue() == plans
+
+        plan, n_pending = await pq.set_next_plan_as_running()
+        await pq.set_processed_plan_as_completed()
+        assert await pq.is_plan_running() is False
+        assert await pq.get_queue() == plans[1:]
+
+        await pq.set_next_plan_as_running()
+        assert await pq.set_next_plan_as_running() == ({}, 0)
+
+        await pq.clear_running_plan_info()
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_scripts_reloaded():
+    """
+    Lua scripts are registered again if they are removed from Redis script cache.
+    """
+    async def testing():
+        pq = await _create_pq()
+        await pq.add_plan_to_queue({"name": "a", "plan_uid": "1"})
+
+        await pq._r_pool.script_flush()
+        plan, n_pending = await pq.set_next_plan_as_running()
+        assert plan == {"name": "a", "plan_uid": "1"}
+
+        await pq.clear_running_plan_info()
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_clear_queue():
+    """
+    Clearing the queue returns the number of removed plans. Clearing of a large queue
+    is a single operation, so it is expected to take milliseconds.
+    """
+    async def testing():
+        pq = await _create_pq()
+
+        assert await pq.clear_queue() == 0
+
+        n_plans = 10000
+        await pq.add_plans_to_queue([{"name": "count", "plan_uid": str(n)} for n in range(n_plans)])
+        await pq.stop()
+
+        # The queue is loaded from Redis
+        pq = PlanQueueOperations()
+        await pq.start()
+        assert await pq.get_queue_size() == n_plans
+
+        t_start = ttime.perf_counter()
+        n_removed = await pq.clear_queue()
+        t_clear = ttime.perf_counter() - t_start
+        print(f"Clearing the queue with {n_plans} plans: {t_clear * 1000:.3f} ms")
+
+        assert n_removed == n_plans
+        assert await pq.get_queue_size() == 0
+        assert t_clear < 0.1, "Clearing the queue is too slow"
+
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_add_plans_to_queue():
+    """
+    Adding a batch of plans to the queue is a single operation. The batch may be larger
+    than the number of arguments accepted by a single Redis command.
+    """
+    async def testing():
+        pq = await _create_pq()
+
+        await pq.add_plan_to_queue({"name": "a", "plan_uid": "a"})
+        version = pq.queue_version
+
+        # Empty batch doesn't change the queue
+        await pq.add_plans_to_queue([])
+        assert pq.queue_version == version
+
+        n_plans = 10000
+        plans = [{"name": "count", "plan_uid": str(n)} for n in range(n_plans)]
+        t_start = ttime.perf_counter()
+        await pq.add_plans_to_queue(plans)
+        t_add = ttime.perf_counter() - t_start
+        print(f"Adding {n_plans} plans to the queue: {t_add * 1000:.3f} ms")
+
+        assert pq.queue_version == version + 1
+        assert await pq.get_queue_size() == n_plans + 1
+        assert (await pq.get_queue())[1:] == plans
+        await pq.stop()
+
+        # The queue in Redis matches the copy
+        pq = PlanQueueOperations()
+        await pq.start()
+        assert (await pq.get_queue())[1:] == plans
+
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_insert_move_remove():
+    """
+    Inserting, moving and removing plans by UID.
+    """
+    async def testing():
+        pq = await _create_pq()
+
+        def uids():
+            return [_["plan_uid"] for _ in pq._plan_queue]
+
+        async def check_redis():
+            # The copy of the queue matches the queue in Redis
+            pq2 = PlanQueueOperations()
+            await pq2.start()
+            assert await pq2.get_queue() == await pq.get_queue()
+            await pq2.stop()
+
+        for uid in "abc":
+            await pq.add_plan_to_queue({"name": "count", "plan_uid": uid})
+
+        assert await pq.insert_plan_to_queue({"plan_uid": "d"}, 1) == 1
+        assert await pq.insert_plan_to_queue({"plan_uid": "e"}, 0) == 0
+        assert await pq.insert_plan_to_queue({"plan_uid": "f"}, -1) == 4
+        assert await pq.insert_plan_to_queue({"plan_uid": "g"}, 100) == 6
+        assert await pq.insert_plan_to_queue({"plan_uid": "h"}, -100) == 0
+        assert uids() == list("headbfcg")
+        await check_redis()
+
+        assert await pq.move_plan_in_queue("h", 3) == 3
+        assert uids() == list("eadhbfcg")
+        assert await pq.move_plan_in_queue("g", 0) == 0
+        assert await pq.move_plan_in_queue("a", -1) == 7
+        assert await pq.move_plan_in_queue("c", 100) == 7
+        assert uids() == list("gedhbfac")
+        await check_redis()
+
+        assert await pq.remove_plan_from_queue("h") == {"plan_uid": "h"}
+        assert await pq.remove_plan_from_queue("g") == {"plan_uid": "g"}
+        assert uids() == list("edbfac")
+        await check_redis()
+
+        version = pq.queue_version
+        with pytest.raises(ValueError, match="not in the queue"):
+            await pq.remove_plan_from_queue("h")
+        with pytest.raises(ValueError, match="not in the queue"):
+            await pq.move_plan_in_queue("h", 0)
+        with pytest.raises(ValueError, match="already in the queue"):
+            await pq.insert_plan_to_queue({"plan_uid": "a"}, 0)
+        with pytest.raises(ValueError, match="already in the queue"):
+            await pq.add_plans_to_queue([{"plan_uid": "x"}, {"plan_uid": "a"}])
+        with pytest.raises(ValueError, match="identical UIDs"):
+            await pq.add_plans_to_queue([{"plan_uid": "x"}, {"plan_uid": "x"}])
+        with pytest.raises(ValueError, match="plan_uid"):
+            await pq.add_plan_to_queue({"name": "count"})
+        with pytest.raises(ValueError, match="integer"):
+            await pq.insert_plan_to_queue({"plan_uid": "x"}, "0")
+        assert uids() == list("edbfac")
+        assert pq.queue_version == version
+
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_insert_renormalize():
+    """
+    Repeated insertion at the same position exhausts the gap between the scores
+    of the neighboring plans and causes reassignment of the scores.
+    """
+    async def testing():
+        pq = await _create_pq()
+
+        await pq.add_plans_to_queue([{"plan_uid": "a"}, {"plan_uid": "b"}, {"plan_uid": "c"}])
+        score_c = float(await pq._r_pool.zscore(pq._name_plan_queue_index, "c"))
+        uids = ["a", "b", "c"]
+        for n in range(200):
+            await pq.insert_plan_to_queue({"plan_uid": str(n)}, 2)
+            uids.insert(2, str(n))
+        assert [_["plan_uid"] for _ in await pq.get_queue()] == uids
+        # Scores were reassigned
+        assert float(await pq._r_pool.zscore(pq._name_plan_queue_index, "c")) > score_c
+
+        pq2 = PlanQueueOperations()
+        await pq2.start()
+        assert [_["plan_uid"] for _ in await pq2.get_queue()] == uids
+        await pq2.stop()
+
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_large_queue():
+    """
+    Operations on a single plan don't depend on the size of the queue.
+    """
+    async def testing():
+        pq = await _create_pq()
+
+        n_plans = 50000
+        await pq.add_plans_to_queue([{"name": "count", "plan_uid": str(n)} for n in range(n_plans)])
+
+        n_ops = 100
+        t_start = ttime.perf_counter()
+        for n in range(n_ops):
+            await pq.insert_plan_to_queue({"name": "count", "plan_uid": f"x{n}"}, n_plans // 2)
+            await pq.move_plan_in_queue(str(n), n_plans // 3)
+            await pq.remove_plan_from_queue(f"x{n}")
+        t_op = (ttime.perf_counter() - t_start) / n_ops / 3
+        print(f"Average time of operation (queue with {n_plans} plans): {t_op * 1000:.3f} ms")
+        assert t_op < 0.01, "Operations with plans are too slow"
+        assert await pq.get_queue_size() == n_plans
+
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_priorities():
+    """
+    Plans with higher priority are placed closer to the front of the queue. Plans
+    with the same priority are processed in FIFO order. Inserting and moving plans
+    is limited to the range of plans with the same priority.
+    """
+    async def testing():
+        pq = await _create_pq()
+
+        def uids():
+            return [_["plan_uid"] for _ in pq._plan_queue]
+
+        await pq.add_plan_to_queue({"plan_uid": "a"})
+        await pq.add_plan_to_queue({"plan_uid": "b", "priority": -1})
+        await pq.add_plan_to_queue({"plan_uid": "c"})
+        await pq.add_plan_to_queue({"plan_uid": "d", "priority": 5})
+        await pq.add_plan_to_queue({"plan_uid": "e", "priority": 5})
+        assert uids() == list("deacb")
+
+        # Batch of plans with different priorities
+        await pq.add_plans_to_queue([{"plan_uid": "f", "priority": -1}, {"plan_uid": "g", "priority": 10},
+                                     {"plan_uid": "h"}, {"plan_uid": "i", "priority": 5}])
+        assert uids() == list("gdeiachbf")
+
+        # Inserting and moving is limited to the range of plans with the same priority
+        assert await pq.insert_plan_to_queue({"plan_uid": "j"}, 0) == 4
+        assert await pq.insert_plan_to_queue({"plan_uid": "k", "priority": 5}, -1) == 4
+        assert uids() == list("gdeikjachbf")
+        assert await pq.move_plan_in_queue("c", 0) == 5
+        assert await pq.move_plan_in_queue("d", -1) == 4
+        assert uids() == list("geikdcjahbf")
+
+        # The copy matches the queue in Redis
+        pq2 = PlanQueueOperations()
+        await pq2.start()
+        assert await pq2.get_queue() == await pq.get_queue()
+        await pq2.stop()
+
+        # The stopped plan is returned to the front of the range of plans with the same priority
+        plan, _ = await pq.set_next_plan_as_running()
+        assert plan["plan_uid"] == "g"
+        await pq.set_processed_plan_as_completed()
+        plan, _ = await pq.set_next_plan_as_running()
+        assert plan["plan_uid"] == "e"
+        await pq.add_plan_to_queue({"plan_uid": "l", "priority": 6})
+        await pq.set_processed_plan_as_stopped()
+        assert uids() == list("leikdcjahbf")
+
+        processed = []
+        while True:
+            plan, _ = await pq.set_next_plan_as_running()
+            if not plan:
+                break
+            processed.append(plan["plan_uid"])
+            await pq.set_processed_plan_as_completed()
+        assert processed == list("leikdcjahbf")
+
+        for priority in (11, -11, 1.5, "1", True):
+            with pytest.raises(ValueError, match="Priority"):
+                await pq.add_plan_to_queue({"plan_uid": "m", "priority": priority})
+
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_migrate_list():
+    """
+    The queue stored in Redis by older versions (list) is converted at startup.
+    """
+    async def testing():
+        pq = await _create_pq()
+        await pq.add_plan_to_queue({"name": "a", "plan_uid": "a"})
+
+        plans = [{"name": "b", "plan_uid": "b"}, {"name": "c"}, {"name": "d", "plan_uid": "b"}]
+        await pq._r_pool.rpush("plan_queue", *[json.dumps(_) for _ in plans])
+        await pq.stop()
+
+        pq = PlanQueueOperations()
+        await pq.start()
+        queue = await pq.get_queue()
+        assert [_["name"] for _ in queue] == ["a", "b", "c", "d"]
+        assert len(set(_["plan_uid"] for _ in queue)) == 4, "UIDs must be unique"
+        assert await pq._r_pool.exists("plan_queue") == 0
+
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_get_queue_range():
+    """
+    Reading a range of plans from the queue.
+    """
+    async def testing():
+        pq = await _create_pq()
+
+        plans = [{"name": "count", "plan_uid": str(n)} for n in range(10)]
+        for plan in plans:
+            await pq.add_plan_to_queue(plan)
+
+        assert await pq.get_queue_range() == (plans, 10)
+        assert await pq.get_queue_range(start=3, count=4) == (plans[3:7], 10)
+        assert await pq.get_queue_range(start=8, count=4) == (plans[8:], 10)
+        assert await pq.get_queue_range(start=5) == (plans[5:], 10)
+        assert await pq.get_queue_range(start=20, count=4) == ([], 10)
+        assert await pq.get_queue_range(count=0) == ([], 10)
+
+        for start, count in ((-1, None), (0, -1), ("0", None), (0, 1.5)):
+            with pytest.raises(ValueError):
+                await pq.get_queue_range(start=start, count=count)
+
+        await pq.clear_queue()
+        assert await pq.get_queue_range(start=0, count=4) == ([], 0)
+
+        await pq.stop()
+
+    asyncio.run(testing())
+
+
+def test_plan_queue_version():
+    """
+    Queue version is incremented each time the queue or the running plan is modified.
+    The version and the contents of the queue are restored when the queue is reloaded.
+    """
+    async def testing():
+        pq = await _create_pq()
+        versions = [pq.queue_version]
+
+        def check_version_incremented():
+            assert pq.queue_version > versions[-1]
+            versions.append(pq.queue_version)
+
+        await pq.add_plan_to_queue({"name": "a", "plan_uid": "1"})
+        check_version_incremented()
+        await pq.add_plan_to_queue({"name": "b", "plan_uid": "2"})
+        check_version_incremented()
+        await pq.add_plan_to_queue({"name": "c", "plan_uid": "3"})
+        check_version_incremented()
+        await pq.pop_plan_from_queue()
+        check_version_incremented()
+        await pq.set_next_plan_as_running()
+        check_version_incremented()
+
+        # Read operations don't change the version
+        await pq.get_queue()
+        await pq.get_queue_range(start=0, count=1)
+        await pq.is_plan_running()
+        assert pq.queue_version == versions[-1]
+
+        # Reload the queue
+        pq2 = PlanQueueOperations()
+        await pq2.start()
+        assert pq2.queue_version == pq.queue_version
+        assert await pq2.get_queue() == await pq.get_queue() == [{"name": "b", "plan_uid": "2"}]
+        assert await pq2.get_running_plan_info() == {"name": "a", "plan_uid": "1"}
+        await pq2.stop()
+
+        await pq.set_processed_plan_as_stopped()
+        check_version_incremented()
+
+        # Operations that don't modify the queue don't change the version
+        assert await pq.set_processed_plan_as_stopped() == {}
+        await pq.clear_queue()
+        check_version_incremented()
+        assert await pq.pop_plan_from_queue() == {}
+        assert await pq.clear_queue() == 0
+        assert await pq.set_next_plan_as_running() == ({}, 0)
+        assert pq.queue_version == versions[-1]
+
+        await pq.stop()
+
+    asyncio.run(testing())
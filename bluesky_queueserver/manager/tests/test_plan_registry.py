@@ -0,0 +1,82 @@
+import time as ttime
+import pytest
+
+from ophyd.sim import det1, det2, motor  # noqa: F401
+from bluesky.plans import count, scan  # noqa: F401
+
+from bluesky_queueserver.manager.plan_registry import create_plan_registry, PlanValidator
+
+
+def myplan(detectors, sample, *, md=None):
+    yield from count(detectors, md=dict(md or {}, sample=sample))
+
+
+def _create_validator():
+    namespace = {"det1": det1, "det2": det2, "motor": motor, "count": count, "scan": scan,
+                 "myplan": myplan, "PlanValidator": PlanValidator, "_det3": det1}
+    pv = PlanValidator()
+    pv.set_registry(create_plan_registry(namespace))
+    return pv
+
+
+def test_create_plan_registry():
+    registry = create_plan_registry({"det1": det1, "motor": motor, "count": count,
+                                     "PlanValidator": PlanValidator, "_det3": det1, "n": 10})
+    assert set(registry["plans"]) == {"count"}
+    assert registry["devices"] == {"det1": {"classname": "SynGauss", "is_movable": False},
+                                   "motor": {"classname": "SynAxis", "is_movable": True}}
+    params = registry["plans"]["count"]["parameters"]
+    assert params[0] == {"name": "detectors", "kind": "POSITIONAL_OR_KEYWORD", "has_default": False,
+                         "takes_devices": True}
+    assert params[1] == {"name": "num", "kind": "POSITIONAL_OR_KEYWORD", "has_default": True,
+                         "takes_devices": False}
+
+
+@pytest.mark.parametrize("plan, msg", [
+    ({"name": "count", "args": [["det1", "det2"]]}, ""),
+    ({"name": "count", "args": [["det1", "det2"]], "kwargs": {"num": 10, "delay": 1}}, ""),
+    ({"name": "scan", "args": [["det1", "det2"], "motor", -1, 1, 10]}, ""),
+    ({"name": "myplan", "args": [["det1"], "sample A"]}, ""),
+    ({"name": "myplan", "args": [["det1"], ["sample A", "sample B"]], "kwargs": {"md": {"a": "b"}}}, ""),
+    ({"name": "myplan", "args": [["sample A"], "sample A"]}, "Device 'sample A' is not in the list"),
+    ({"name": "cnt", "args": [["det1"]]}, "Plan 'cnt' is not in the list"),
+    ({"name": ["count"], "args": [["det1"]]}, "Plan name must be a string"),
+    ({"name": "count", "args": [["det1", "det3"]]}, "Device 'det3' is not in the list"),
+    ({"name": "count", "args": [["det1", "_det3"]]}, "Device '_det3' is not in the list"),
+    ({"name": "count", "args": [["det1"]], "kwargs": {"nmu": 10}}, "unexpected keyword argument 'nmu'"),
+    ({"name": "count", "args": [["det1"], 10, 1, 5]}, "too many positional arguments"),
+    ({"name": "count"}, "missing a required argument: 'detectors'"),
+    ({"name": "count", "args": ["det1"], "kwargs": []}, "kwargs must be a dictionary"),
+])
+def test_plan_validator(plan, msg):
+    pv = _create_validator()
+    success, err_msg = pv.validate_plan(plan)
+    assert success is (msg == "")
+    assert msg in err_msg
+
+
+def test_plan_validator_cache():
+    """
+    Results of validation are cached. The cache is cleared when the registry is replaced.
+    """
+    pv = _create_validator()
+    plan = {"name": "count", "args": [["det1", "det2"]], "kwargs": {"num": 10, "delay": 1}}
+
+    # All plans are valid if the registry is not set
+    assert PlanValidator().validate_plan({"name": "cnt"}) == (True, "")
+
+    n_plans = 10000
+    t_start = ttime.perf_counter()
+    for n in range(n_plans):
+        assert pv.validate_plan(plan) == (True, "")
+    t_validate = (ttime.perf_counter() - t_start) / n_plans
+    print(f"Validation of the plan (cached result): {t_validate * 1e6:.3f} us")
+    assert len(pv._cache) == 1
+
+    # Identical plans with different UIDs share the cached result
+    assert pv.validate_plan(dict(plan, plan_uid="abc")) == (True, "")
+    assert len(pv._cache) == 1
+
+    pv.set_registry(create_plan_registry({"det1": det1, "count": count}))
+    assert len(pv._cache) == 0
+    assert pv.validate_plan(plan)[0] is False
@@ -0,0 +1,61 @@
+import pytest
+
+from bluesky_queueserver.manager.plan_stats import PlanStats, PLAN_STAGES
+
+
+def _record(n, name="count", **kwargs):
+    record = {"plan_uid": f"uid-{n}", "name": name, "plan_state": "completed", "time_finished": n,
+              "time_queued": 1.0, "time_to_start": 0.1, "time_run": float(n),
+              "time_db_insert": 0.01, "n_documents": 4}
+    record.update(kwargs)
+    return record
+
+
+def test_plan_stats_summary():
+    """
+    Statistics of the stages, totals for each plan and the most recent records.
+    """
+    stats = PlanStats()
+    for n in range(1, 101):
+        stats.add_record(_record(n))
+    stats.add_record(_record(1000, name="scan", time_run=10000.0, time_to_start=None))
+
+    result = stats.get_stats(n_recent=3)
+    assert result["n_records"] == 101
+    assert set(result["stages"]) == set(PLAN_STAGES)
+
+    s = stats.get_stats(name="count")["stages"]["time_run"]
+    assert s["count"] == 100
+    assert s["min"] == 1.0
+    assert s["max"] == 100.0
+    assert s["mean"] == pytest.approx(50.5)
+    assert s["p50"] == 50.0
+    assert s["p95"] == 95.0
+
+    # Missing values are not included in the statistics
+    assert result["stages"]["time_to_start"]["count"] == 100
+    assert result["stages"]["n_documents"]["total"] == 404
+
+    # Plans are sorted by the total run time
+    assert list(result["plans"]) == ["scan", "count"]
+    assert result["plans"]["count"]["count"] == 100
+    assert result["plans"]["count"]["time_run"] == pytest.approx(5050)
+
+    assert [_["plan_uid"] for _ in result["recent"]] == ["uid-1000", "uid-100", "uid-99"]
+
+    result = stats.get_stats(name="unknown")
+    assert result["n_records"] == 0
+    assert all(_ is None for _ in result["stages"].values())
+    assert result["recent"] == []
+
+
+def test_plan_stats_max_records():
+    """
+    Only the most recent records are kept.
+    """
+    stats = PlanStats(max_records=10)
+    for n in range(25):
+        stats.add_record(_record(n))
+    result = stats.get_stats(n_recent=100)
+    assert result["n_records"] == 10
+    assert [_["time_finished"] for _ in result["recent"]] == list(range(24, 14, -1))
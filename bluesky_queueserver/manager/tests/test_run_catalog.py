@@ -0,0 +1,105 @@
+import pytest
+
+from bluesky import RunEngine
+from bluesky.plans import count
+from databroker import Broker
+from ophyd.sim import det1
+
+from bluesky_queueserver.manager.run_catalog import RunCatalog
+
+
+@pytest.mark.filterwarnings("ignore::PendingDeprecationWarning")
+def test_run_catalog(monkeypatch):
+    """
+    Runs are ordered by time and selected page by page. Metadata is read only for the new runs
+    and for the selected page.
+    """
+    n_runs = 20
+    db = Broker.named("temp")
+    RE = RunEngine({})
+    RE.subscribe(db.insert)
+    uids = [RE(count([det1]))[0] for _ in range(n_runs)]
+
+    catalog = RunCatalog(db)
+    runs, n = catalog.list_runs()
+    assert n == n_runs
+    assert [_["uid"] for _ in runs] == uids
+    assert [_["scan_id"] for _ in runs] == list(range(1, n_runs + 1))
+    assert all(_["plan_name"] == "count" and _["exit_status"] == "success" for _ in runs)
+
+    runs, n = catalog.list_runs(start=5, count=3)
+    assert [_["uid"] for _ in runs] == uids[5:8]
+    runs, n = catalog.list_runs(start=5, count=3, reverse=True)
+    assert [_["uid"] for _ in runs] == uids[::-1][5:8]
+    runs, n = catalog.list_runs(start=18, count=5, reverse=True)
+    assert [_["uid"] for _ in runs] == uids[1::-1]
+    runs, n = catalog.list_runs(start=100, reverse=True)
+    assert runs == [] and n == n_runs
+
+    # Count the number of times metadata of runs is read
+    n_reads = 0
+    describe = type(db.v2.walk(depth=1)[uids[0]]).describe
+
+    def describe_counted(self):
+        nonlocal n_reads
+        n_reads += 1
+        return describe(self)
+
+    monkeypatch.setattr(type(db.v2.walk(depth=1)[uids[0]]), "describe", describe_counted)
+
+    # New run: metadata is read for the new run and the selected page
+    uids.append(RE(count([det1]))[0])
+    runs, n = catalog.list_runs(count=2, reverse=True)
+    assert n == n_runs + 1
+    assert [_["uid"] for _ in runs] == uids[:-3:-1]
+    assert n_reads == 3
+
+    with pytest.raises(ValueError, match="non-negative integer"):
+        catalog.list_runs(start=-1)
+    with pytest.raises(ValueError, match="non-negative integer"):
+        catalog.list_runs(count="abc")
+
+
+class _FakeEntry:
+    def __init__(self, uid, time):
+        self.uid, self.time = uid, time
+
+    def describe(self):
+        start = {"uid": self.uid, "time": self.time, "scan_id": self.time, "plan_name": "count"}
+        return {"metadata": {"start": start, "stop": {"exit_status": "success"}}}
+
+
+class _FakeCatalog:
+    def __init__(self):
+        self.entries = {}
+
+    def force_reload(self):
+        pass
+
+    def walk(self, depth=2):
+        return dict(self.entries)
+
+
+class _FakeBroker:
+    def __init__(self):
+        self.v2 = _FakeCatalog()
+
+
+def test_run_catalog_removed_runs():
+    """
+    The index is rebuilt if runs were removed from the catalog, even if the number
+    of runs did not change.
+    """
+    db = _FakeBroker()
+    for n in range(5):
+        db.v2.entries[f"uid{n}"] = _FakeEntry(f"uid{n}", n)
+    catalog = RunCatalog(db)
+    runs, n_runs = catalog.list_runs()
+    assert [_["uid"] for _ in runs] == ["uid0", "uid1", "uid2", "uid3", "uid4"]
+
+    # One run is removed and another run is added
+    del db.v2.entries["uid2"]
+    db.v2.entries["uid5"] = _FakeEntry("uid5", 5)
+    runs, n_runs = catalog.list_runs()
+    assert n_runs == 5
+    assert [_["uid"] for _ in runs] == ["uid0", "uid1", "uid3", "uid4", "uid5"]
@@ -0,0 +1,56 @@
+from multiprocessing import Pipe
+import queue
+import threading
+import time as ttime
+
+from bluesky_queueserver.manager.worker import RunEngineWorker
+
+
+def test_worker_plan_dispatch_latency():
+    """
+    Measure the delay between submitting a plan to the execution queue of RE Worker
+    and the start of its execution in the main thread. Plans are expected to be
+    dispatched as soon as they arrive.
+    """
+    conn1, conn2 = Pipe()
+    worker = RunEngineWorker(conn=conn1)
+    worker._exit_event = threading.Event()
+    worker._execution_queue = queue.Queue()
+
+    latencies = []
+    event_executed = threading.Event()
+
+    def execute_plan(plan, is_resuming):
+        plan()
+
+    # Replace the function that starts Run Engine: only the dispatch mechanism is tested
+    worker._execute_plan = execute_plan
+
+    thread = threading.Thread(target=worker._execute_in_main_thread)
+    thread.start()
+
+    n_plans = 100
+    for _ in range(n_plans):
+        event_executed.clear()
+        t_submitted = ttime.perf_counter()
+
+        def plan():
+            latencies.append(ttime.perf_counter() - t_submitted)
+            event_executed.set()
+
+        worker._execution_queue.put((plan, True))
+        assert event_executed.wait(5), "Timeout occurred while waiting for the plan to start"
+
+    t_exit = ttime.perf_counter()
+    worker._exit_main_thread()
+    thread.join(5)
+    t_exit = ttime.perf_counter() - t_exit
+    assert not thread.is_alive(), "The main thread of RE Worker failed to exit"
+
+    latency_avg = sum(latencies) / len(latencies)
+    print(f"Plan dispatch latency: average {latency_avg * 1000:.3f} ms, "
+          f"maximum {max(latencies) * 1000:.3f} ms, exit {t_exit * 1000:.3f} ms")
+
+    assert len(latencies) == n_plans
+    assert latency_avg < 0.01, "Plan dispatch latency is too high"
+    assert t_exit < 0.5, "The main thread of RE Worker is too slow to exit"
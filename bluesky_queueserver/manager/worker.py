@@ -1,20 +1,23 @@
 from multiprocessing import Process
 import threading
 import queue
-import time as ttime
 from collections.abc import Iterable
 import asyncio
+import time as ttime
 
 from bluesky import RunEngine
 from bluesky.run_engine import get_bluesky_event_loop
 
-from bluesky.callbacks.best_effort import BestEffortCallback
 from databroker import Broker
 
 # The following plans/devices must be imported (otherwise plan parsing wouldn't work)
 from ophyd.sim import det1, det2, motor  # noqa: F401
 from bluesky.plans import count, scan  # noqa: F401
 
+from .comms import ConnSelector
+from .plan_registry import create_plan_registry
+from .callbacks import BufferedCallback, DatabrokerInserter, DocumentPublisher, create_callback
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -27,12 +30,23 @@ class RunEngineWorker(Process):
 
     Parameters
     ----------
-    conn: multiprocessing.Connection
+    conn: multiprocessing.Connection or MessageConnection
         One end of bidirectional (input/output) pipe. The other end is used by RE Manager.
+    config: dict or None
+        Configuration of RE Worker. Supported keys: ``databroker_queue_size`` (maximum number
+        of documents waiting to be inserted into Databroker), ``databroker_backpressure``
+        (the policy used when the queue is full, ``"block"`` or ``"drop_events"``, see
+        `BufferedCallback`), ``databroker_max_batch_size`` (maximum number of documents
+        inserted as one batch), ``callbacks`` (the list of callbacks subscribed to Run Engine,
+        see `create_callback`, default ``["best_effort"]``), ``callback_queue_size`` (maximum
+        number of documents waiting to be processed by each callback), ``document_publisher_address``
+        (address of ZMQ PUB socket used to publish documents, e.g. ``"tcp://*:5578"``,
+        documents are not published if the address is not specified) and
+        ``document_publisher_prefix`` (prefix of published messages, see `DocumentPublisher`).
     args, kwargs
         `args` and `kwargs` of the `multiprocessing.Process`
     """
-    def __init__(self, *args, conn, **kwargs):
+    def __init__(self, *args, conn, config=None, **kwargs):
 
         if not conn:
             raise RuntimeError("Invalid value of parameter 'conn': %S.", str(conn))
@@ -41,6 +55,8 @@ class RunEngineWorker(Process):
 
         # The end of bidirectional Pipe assigned to the worker (for communication with Manager process)
         self._conn = conn
+        # Messages are sent from multiple threads (the lock is created in 'run')
+        self._conn_send_lock = None
 
         self._exit_event = None
         self._execution_queue = None
@@ -49,29 +65,90 @@ class RunEngineWorker(Process):
         #   currently executed. Plan is considered as being executed if it is paused.
         self._running_plan = None
 
+        # Timings of currently executed plan (reported to RE Manager with 'plan_exit' report)
+        self._plan_timing = None
+
         # Reference to Bluesky Run Engine
         self._RE = None
 
         # The thread that receives packets from the pipe 'self._conn'
         self._thread_conn = None
+        self._conn_selector = None
 
         self._db = DB[0]
+        # Documents are inserted into Databroker from a separate thread (created in 'run')
+        self._db_inserter = None
+        # Buffered callbacks (other than Databroker inserter) subscribed to Run Engine
+        self._buffered_callbacks = []
+        # Publishes documents on ZMQ socket (optional)
+        self._document_publisher = None
+
+        self._config = config or {}
+
+        # Registry of plans and devices available in the environment (created in 'run')
+        self._plan_registry = None
 
     def _receive_packet_thread(self):
         """
         The function is running in a separate thread and monitoring the output
-        of the communication Pipe.
+        of the communication Pipe. The thread is idle until a message arrives.
         """
-        while True:
-            if self._exit_event.is_set():
-                break
-            if self._conn.poll(0.1):
-                try:
-                    msg = self._conn.recv()
-                    self._conn_received(msg)
-                except Exception as ex:
-                    logger.exception("Exception occurred while waiting for packet: %s", str(ex))
-                    break
+        self._conn_selector.run()
+
+    def _conn_send(self, msg):
+        """
+        Send the message to RE Manager. The function may be called from any thread.
+        """
+        with self._conn_send_lock:
+            self._conn.send(msg)
+
+    def _document_stream_address(self):
+        """
+        Returns the address of the socket used to publish documents or None.
+        """
+        return self._document_publisher.address if self._document_publisher else None
+
+    def _count_document(self, name, doc):
+        """
+        Count documents emitted by Run Engine during execution of the plan (subscribed to Run Engine).
+        """
+        if self._plan_timing is not None:
+            self._plan_timing["n_documents"] += 1
+
+    def _get_plan_timing(self):
+        """
+        Returns the timings of the current plan: the time from dispatching of the plan by RE Manager
+        to the start of Run Engine, the total time of execution by Run Engine (including the time
+        the plan was executed after being resumed), the number of documents emitted and
+        the time spent inserting documents into Databroker during execution of the plan.
+
+        Documents are inserted into Databroker asynchronously and the report is not delayed
+        until the insertion is completed, so ``time_db_insert`` is approximate: it does not
+        include the documents that are still waiting in the queue when the plan is finished
+        (``n_documents_db_pending``), these documents are counted for the next plan.
+        """
+        t = self._plan_timing
+        time_to_start = None
+        if (t["time_dispatched"] is not None) and (t["time_re_start"] is not None):
+            time_to_start = max(t["time_re_start"] - t["time_dispatched"], 0)
+        db_stats = self._db_inserter.get_stats()
+        return {"time_dispatched": t["time_dispatched"],
+                "time_to_start": time_to_start,
+                "time_run": t["time_run"],
+                "n_documents": t["n_documents"],
+                "time_db_insert": db_stats["latency_total"] - t["db_latency_total"],
+                "n_documents_db_pending": db_stats["queue_depth"]}
+
+    def _re_state_changed(self, new_state, old_state):
+        """
+        Called by Run Engine each time its state is changed ('state_hook').
+        Sends report to RE Manager.
+        """
+        msg = {"type": "report",
+               "value": {"action": "re_state_changed",
+                         "re_state": str(new_state),
+                         "prev_re_state": str(old_state)}}
+        self._conn_send(msg)
 
     def _execute_plan(self, plan, is_resuming):
         """
@@ -88,6 +165,9 @@ class RunEngineWorker(Process):
             aborted, stopped or halted.
         """
         logger.debug("Starting execution of a task")
+        t_start = ttime.time()
+        if (self._plan_timing is not None) and (self._plan_timing["time_re_start"] is None):
+            self._plan_timing["time_re_start"] = t_start
         try:
             result = plan()
             msg = {"type": "report",
@@ -123,7 +203,14 @@ class RunEngineWorker(Process):
         # Include RE state
         msg["value"]["re_state"] = str(self._RE._state)
 
-        self._conn.send(msg)
+        # Include timings of the plan. The timings are accumulated while the plan is paused.
+        if self._plan_timing is not None:
+            self._plan_timing["time_run"] += ttime.time() - t_start
+            msg["value"]["timing"] = self._get_plan_timing()
+            if msg["value"]["plan_state"] != "paused":
+                self._plan_timing = None
+
+        self._conn_send(msg)
         logger.debug("Finished execution of a task")
 
     def _load_new_plan(self, plan):
@@ -143,6 +230,11 @@ class RunEngineWorker(Process):
         """
         # Save reference to the currently executed plan
         self._running_plan = plan
+        self._plan_timing = {"time_dispatched": plan.get("time_dispatched", None),
+                             "time_re_start": None,
+                             "time_run": 0.0,
+                             "n_documents": 0,
+                             "db_latency_total": self._db_inserter.get_stats()["latency_total"]}
 
         plan_name = plan["name"]
         plan_args = plan["args"]
@@ -237,9 +329,17 @@ class RunEngineWorker(Process):
                            "contains": "status",
                            "value": {"running_plan_uid": plan_uid,
                                      "re_state": str(self._RE._state),
+                                     "db_inserter": self._db_inserter.get_stats(),
+                                     "document_stream_address": self._document_stream_address(),
                                      }
                            }
-                self._conn.send(msg_out)
+                self._conn_send(msg_out)
+
+            elif value == "plan_registry":
+                msg_out = {"type": "result",
+                           "contains": "plan_registry",
+                           "value": self._plan_registry}
+                self._conn_send(msg_out)
 
         else:
             # The default acknowledge message (will be sent to `self._conn` if
@@ -259,7 +359,7 @@ class RunEngineWorker(Process):
                 #       the worker process is needed.
                 if self._RE._state != "running":
                     try:
-                        self._exit_event.set()
+                        self._exit_main_thread()
                         msg_ack["value"]["status"] = "accepted"
                     except Exception as ex:
                         msg_ack["value"]["status"] = "error"
@@ -343,28 +443,37 @@ class RunEngineWorker(Process):
                         "Run Engine must be in 'paused' state to continue. " \
                         f"The state is '{self._RE._state}'"
 
-            self._conn.send(msg_ack)
+            self._conn_send(msg_ack)
 
     # ------------------------------------------------------------
 
     def _execute_in_main_thread(self):
         """
-        Run this function to block the main thread. The function is polling
-        `self._execution_queue` and executes the plans that are in the queue.
-        If the queue is empty, then the thread remains idle.
+        Run this function to block the main thread. The function is waiting for
+        plans to be placed in `self._execution_queue` and executes them as soon as they
+        arrive. If the queue is empty, then the thread remains idle.
         """
         # This function blocks the main thread
         while True:
-            # Polling once per second. This is fast enough for slowly executed plans.
-            ttime.sleep(1)
+            # Block until the next plan is submitted. The item is 'None' if the thread
+            #   is woken up by '_exit_main_thread()'.
+            item = self._execution_queue.get()
             # Exit the thread if the Event is set (necessary to gracefully close the process)
             if self._exit_event.is_set():
                 break
-            try:
-                plan, is_resuming = self._execution_queue.get(False)
+            if item is not None:
+                plan, is_resuming = item
                 self._execute_plan(plan, is_resuming)
-            except queue.Empty:
-                pass
+
+    def _exit_main_thread(self):
+        """
+        Set `self._exit_event` and wake up the main thread, which may be blocked
+        waiting for the next plan.
+        """
+        self._exit_event.set()
+        self._execution_queue.put(None)
+        if self._conn_selector:
+            self._conn_selector.stop()
 
     # ------------------------------------------------------------
 
@@ -374,6 +483,7 @@ class RunEngineWorker(Process):
         by the `start` method.
         """
         self._exit_event = threading.Event()
+        self._conn_send_lock = threading.Lock()
 
         # TODO: TC - Do you think that the following code may be included in RE.__init__()
         #   (for Python 3.8 and above)
@@ -382,32 +492,79 @@ class RunEngineWorker(Process):
         asyncio.set_event_loop(loop)
 
         self._RE = RunEngine({})
+        self._RE.state_hook = self._re_state_changed
 
-        bec = BestEffortCallback()
-        self._RE.subscribe(bec)
-
-        # db = Broker.named('temp')
-        self._RE.subscribe(self._db.insert)
+        # Expensive callbacks are processing documents in separate threads, so Run Engine
+        #   only places documents in the queue. The output of the callbacks (e.g. tables printed
+        #   by BestEffortCallback) is not critical, so events are dropped if a callback falls behind.
+        for callback_name in self._config.get("callbacks", ["best_effort"]):
+            try:
+                self._buffered_callbacks.append(
+                    BufferedCallback(create_callback(callback_name),
+                                     queue_size=self._config.get("callback_queue_size", 1000),
+                                     backpressure="drop_events",
+                                     name=f"Callback '{callback_name}'"))
+            except Exception as ex:
+                logger.exception("Failed to create the callback '%s': %s", callback_name, str(ex))
+        for cb in self._buffered_callbacks:
+            cb.start()
+            self._RE.subscribe(cb)
+
+        publisher_address = self._config.get("document_publisher_address", None)
+        if publisher_address:
+            try:
+                prefix = self._config.get("document_publisher_prefix", "").encode()
+                publisher = DocumentPublisher(publisher_address, prefix=prefix)
+                publisher.start()
+                self._RE.subscribe(publisher)
+                self._buffered_callbacks.append(publisher)
+                self._document_publisher = publisher
+                logger.info("Documents are published on %s", publisher.address)
+            except Exception as ex:
+                logger.exception("Failed to start publishing documents on '%s': %s",
+                                 publisher_address, str(ex))
+
+        # Documents are inserted into Databroker from a separate thread, so that
+        #   slow Databroker backend does not throttle data acquisition.
+        self._db_inserter = DatabrokerInserter(
+            self._db,
+            queue_size=self._config.get("databroker_queue_size", 10000),
+            backpressure=self._config.get("databroker_backpressure", "block"),
+            max_batch_size=self._config.get("databroker_max_batch_size", 1000))
+        self._db_inserter.start()
+        self._RE.subscribe(self._db_inserter)
+        self._RE.subscribe(self._count_document)
 
         self._execution_queue = queue.Queue()
 
+        # Plans and devices available in the environment are exported to RE Manager
+        self._plan_registry = create_plan_registry(globals())
+
+        self._conn_selector = ConnSelector()
+        self._conn_selector.register(self._conn, self._conn_received)
         self._thread_conn = threading.Thread(target=self._receive_packet_thread,
                                              name="RE Worker Receive")
         self._thread_conn.start()
 
         # Environment is initialized: send a report
         msg = {"type": "report",
-               "value": {"action": "environment_created"}}
-        self._conn.send(msg)
+               "value": {"action": "environment_created",
+                         "document_stream_address": self._document_stream_address()}}
+        self._conn_send(msg)
 
         # Now make the main thread busy
         self._execute_in_main_thread()
 
         self._thread_conn.join()
 
+        # Insert the remaining documents into Databroker
+        self._db_inserter.stop()
+        for cb in self._buffered_callbacks:
+            cb.stop()
+
         del self._RE
 
         # Finally send a report
         msg = {"type": "report",
                "value": {"action": "environment_closed"}}
-        self._conn.send(msg)
+        self._conn_send(msg)
@@ -3,6 +3,9 @@ import asyncio
 import zmq
 import zmq.asyncio
 
+from ..manager.comms import ZMQCommSendAsync
+from ..manager.metrics import format_prometheus
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -20,23 +23,56 @@ http POST 0.0.0.0:8080/add_to_queue plan:='{"name":"scan", "args":[["det1", "det
 
 
 class WebServer:
-
-    def __init__(self):
+    """
+    Web Server: forwards REST API requests to RE Manager and streams events published
+    by RE Manager to HTTP clients (``/stream`` endpoint).
+
+    Parameters
+    ----------
+    zmq_server_address: str
+        Address of the ZeroMQ socket used by RE Manager to receive requests.
+    zmq_publisher_address: str
+        Address of the ZeroMQ socket used by RE Manager to publish events.
+    stream_coalesce_interval: float
+        Events received from RE Manager are collected during the interval (in seconds)
+        and sent to the HTTP clients as a single batch.
+    stream_max_batches: int
+        Maximum number of batches waiting to be sent to a single HTTP client. The oldest
+        batches are discarded if the client is too slow to receive events.
+    """
+
+    # Events that report current state. Only the latest of those events is kept
+    #   when events are coalesced. Other events are always forwarded to the clients.
+    _stream_state_events = ("queue_changed", "re_state_changed")
+
+    def __init__(self, *, zmq_server_address="tcp://localhost:5555",
+                 zmq_publisher_address="tcp://localhost:5556",
+                 stream_coalesce_interval=0.1, stream_max_batches=100):
         self._loop = asyncio.get_event_loop()
 
         # ZeroMQ communication
         self._ctx = zmq.asyncio.Context()
-        self._zmq_socket = None
-        self._zmq_server_address = "tcp://localhost:5555"
-
-        # Start communication task
-        self._event_zmq_stop = None
-        self._task_zmq_client_conn = asyncio.ensure_future(self._zmq_start_client_conn())
+        self._zmq_comm = ZMQCommSendAsync(zmq_server_address=zmq_server_address)
+        self._zmq_publisher_address = zmq_publisher_address
+
+        # Streaming of events to HTTP clients
+        self._stream_coalesce_interval = stream_coalesce_interval
+        self._stream_max_batches = stream_max_batches
+        self._stream_keepalive_period = 15  # Period (s) of sending keepalive messages to the clients
+        self._stream_clients = set()  # Queues of batches (one queue per client)
+        self._stream_pending_events = []  # Events waiting to be sent to the clients
+        self._stream_last_state = {}  # The latest event of each type from '_stream_state_events'
+        self._event_stream_pending = asyncio.Event()
+
+        # Start communication tasks
+        self._task_zmq_subscribe = asyncio.ensure_future(self._zmq_subscribe())
+        self._task_stream_flush = asyncio.ensure_future(self._stream_flush())
 
     def __del__(self):
-        # Cancel the communication task
-        if not self._task_zmq_client_conn.done():
-            self._task_zmq_client_conn.cancel()
+        # Cancel the communication tasks
+        for task in (self._task_zmq_subscribe, self._task_stream_flush):
+            if not task.done():
+                task.cancel()
 
     def get_loop(self):
         """
@@ -47,37 +83,132 @@ class WebServer:
     # ==========================================================================
     #    Functions that support ZeroMQ communications with RE Manager
 
-    async def _zmq_send(self, msg):
-        await self._zmq_socket.send_json(msg)
-
-    async def _zmq_receive(self):
+    async def _zmq_communicate(self, msg_out):
+        """
+        Send the request to RE Manager and wait for the reply. Any number of requests may be
+        processed concurrently. Returns the dictionary with the error message if communication fails.
+        """
         try:
-            msg = await self._zmq_socket.recv_json()
+            msg_in = await self._zmq_comm.send_message(**msg_out)
+        except asyncio.TimeoutError:
+            logger.error("ZeroMQ communication failed: timeout occurred")
+            msg_in = {"success": False, "msg": "Timeout occurred while waiting for reply from RE Manager"}
         except Exception as ex:
-            # TODO: proper error handling for cases when connection is interrupted.
-            # This is primitive error handling to make sure the server doesn't get stuck
-            #   if there is no reply after timeout. The server still needs to be restarted
-            #   if it was disconnected, since there is not mechanism to reestablish
-            #   connection.
             logger.exception("ZeroMQ communication failed: %s" % str(ex))
-            msg = {}
-        return msg
-
-    async def _zmq_communicate(self, msg_out):
-        await self._zmq_send(msg_out)
-        msg_in = await self._zmq_receive()
+            msg_in = {"success": False, "msg": f"Failed to communicate with RE Manager: {str(ex)}"}
         return msg_in
 
-    async def _zmq_start_client_conn(self):
-        self._event_zmq_stop = asyncio.Event()
-        self._zmq_socket = self._ctx.socket(zmq.REQ)
-        self._zmq_socket.RCVTIMEO = 2000  # Timeout for 'recv' operation
+    async def _zmq_subscribe(self):
+        """
+        Receive events published by RE Manager. A single subscription is shared by
+        all HTTP clients, so the number of connected clients does not affect RE Manager.
+        """
+        socket = self._ctx.socket(zmq.SUB)
+        socket.setsockopt(zmq.SUBSCRIBE, b"")
+        socket.connect(self._zmq_publisher_address)
+        logger.info("Subscribed to events published at '%s'" % str(self._zmq_publisher_address))
+        try:
+            while True:
+                try:
+                    event, data = await socket.recv_multipart()
+                    self._stream_add_event(event.decode(), data.decode())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    logger.error("Failed to receive the event from RE Manager: %s" % str(ex))
+        finally:
+            socket.close(linger=0)
 
-        self._zmq_socket.connect(self._zmq_server_address)
-        logger.info("Connected to ZeroMQ server '%s'" % str(self._zmq_server_address))
+    # =========================================================================
+    #    Streaming of events to HTTP clients (Server-Sent Events)
 
-        # The event must be set somewhere else
-        await self._event_zmq_stop.wait()
+    def _stream_add_event(self, event, data):
+        """
+        Add the event to the list of events waiting to be sent to the clients.
+        The new event of the type listed in '_stream_state_events' replaces the pending
+        event of the same type, because only the latest state is of interest to the clients.
+        The replaced event keeps its position relative to other pending events.
+        """
+        if event in self._stream_state_events:
+            self._stream_last_state[event] = data
+            for n, (pending_event, _) in enumerate(self._stream_pending_events):
+                if pending_event == event:
+                    self._stream_pending_events[n] = (event, data)
+                    self._event_stream_pending.set()
+                    return
+        self._stream_pending_events.append((event, data))
+        self._event_stream_pending.set()
+
+    @staticmethod
+    def _stream_format_events(events):
+        """
+        Format the list of events (tuples of event name and JSON data) as a message
+        of 'text/event-stream' format.
+        """
+        return "".join(f"event: {event}\ndata: {data}\n\n" for event, data in events).encode()
+
+    async def _stream_flush(self):
+        """
+        Send the pending events to the clients. The events are sent as a single batch
+        at most once per coalescing interval. The batch is formatted once and shared
+        by all clients.
+        """
+        while True:
+            await self._event_stream_pending.wait()
+            await asyncio.sleep(self._stream_coalesce_interval)
+            self._event_stream_pending.clear()
+            events, self._stream_pending_events = self._stream_pending_events, []
+            if not events or not self._stream_clients:
+                continue
+            batch = self._stream_format_events(events)
+            for queue in self._stream_clients:
+                self._stream_put(queue, batch)
+
+    @staticmethod
+    def _stream_put(queue, batch):
+        if queue.full():
+            # The client is too slow: discard the oldest batch
+            queue.get_nowait()
+        queue.put_nowait(batch)
+
+    async def _stream_on_shutdown(self, app):
+        """
+        Close the streams when the server is shut down (None is the signal to close the stream).
+        """
+        for queue in self._stream_clients:
+            self._stream_put(queue, None)
+
+    async def _stream_handler(self, request):
+        """
+        Stream events published by RE Manager to the client (Server-Sent Events). The
+        latest known state ('queue_changed' and 're_state_changed' events) is sent
+        as soon as the client is connected. Events may be discarded if the client
+        is too slow: the clients may use 'seq_num' of the events to detect the missing ones.
+        """
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream",
+                                               "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        queue = asyncio.Queue(maxsize=self._stream_max_batches)
+        self._stream_clients.add(queue)
+        try:
+            if self._stream_last_state:
+                await response.write(self._stream_format_events(self._stream_last_state.items()))
+            while True:
+                try:
+                    batch = await asyncio.wait_for(queue.get(), timeout=self._stream_keepalive_period)
+                except asyncio.TimeoutError:
+                    batch = b": keepalive\n\n"
+                if batch is None:
+                    break
+                await response.write(batch)
+        except (ConnectionResetError, ConnectionError):
+            # The client is disconnected
+            pass
+        finally:
+            self._stream_clients.discard(queue)
+
+        return response
 
     # =========================================================================
     #    REST API handlers
@@ -99,9 +230,20 @@ class WebServer:
 
     async def _queue_view_handler(self, request):
         """
-        Returns the contents of the current queue.
+        Returns the contents of the current queue. The optional query parameters
+        'start' and 'count' select the range of plans (e.g. '/queue_view?start=100&count=50').
+        If the full queue is requested, the contents of the queue is not returned if the optional
+        parameter 'queue_version' is equal to the current version of the queue (the queue was
+        not modified).
         """
-        msg = await self._send_command(command="queue_view")
+        value = {}
+        try:
+            for key in ("start", "count", "queue_version"):
+                if key in request.query:
+                    value[key] = int(request.query[key])
+        except ValueError as ex:
+            return web.json_response({"success": False, "msg": f"Invalid query parameter: {str(ex)}"})
+        msg = await self._send_command(command="queue_view", value=value)
         return web.json_response(msg)
 
     async def _add_to_queue_handler(self, request):
@@ -113,6 +255,38 @@ class WebServer:
         msg = await self._send_command(command="add_to_queue", value=data)
         return web.json_response(msg)
 
+    async def _add_to_queue_batch_handler(self, request):
+        """
+        Adds the list of plans to the end of the queue in a single operation
+        """
+        data = await request.json()
+        msg = await self._send_command(command="add_to_queue_batch", value=data)
+        return web.json_response(msg)
+
+    async def _insert_into_queue_handler(self, request):
+        """
+        Inserts new plan into the queue at the given position
+        """
+        data = await request.json()
+        msg = await self._send_command(command="insert_into_queue", value=data)
+        return web.json_response(msg)
+
+    async def _move_in_queue_handler(self, request):
+        """
+        Moves the plan with the given UID to new position in the queue
+        """
+        data = await request.json()
+        msg = await self._send_command(command="move_in_queue", value=data)
+        return web.json_response(msg)
+
+    async def _remove_from_queue_handler(self, request):
+        """
+        Removes the plan with the given UID from the queue
+        """
+        data = await request.json()
+        msg = await self._send_command(command="remove_from_queue", value=data)
+        return web.json_response(msg)
+
     async def _pop_from_queue_handler(self, request):
         """
         Pop the last item from back of the queue
@@ -167,6 +341,50 @@ class WebServer:
         msg = await self._send_command(command="print_db_uids")
         return web.json_response(msg)
 
+    async def _list_runs_handler(self, request):
+        """
+        Returns the list of runs in the database. The optional query parameters 'start' and 'count'
+        select the range of runs, 'reverse=1' returns the newest runs first
+        (e.g. '/list_runs?start=0&count=20&reverse=1').
+        """
+        value = {}
+        try:
+            for key in ("start", "count", "reverse"):
+                if key in request.query:
+                    value[key] = int(request.query[key])
+        except ValueError as ex:
+            return web.json_response({"success": False, "msg": f"Invalid query parameter: {str(ex)}"})
+        msg = await self._send_command(command="list_runs", value=value)
+        return web.json_response(msg)
+
+    async def _plan_stats_handler(self, request):
+        """
+        Returns statistics of timings of executed plans. The optional query parameters 'name'
+        (plan name) and 'n_recent' (the number of the most recent records)
+        (e.g. '/plan_stats?name=count&n_recent=5').
+        """
+        value = {}
+        if "name" in request.query:
+            value["name"] = request.query["name"]
+        try:
+            if "n_recent" in request.query:
+                value["n_recent"] = int(request.query["n_recent"])
+        except ValueError as ex:
+            return web.json_response({"success": False, "msg": f"Invalid query parameter: {str(ex)}"})
+        msg = await self._send_command(command="plan_stats", value=value)
+        return web.json_response(msg)
+
+    async def _metrics_handler(self, request):
+        """
+        Returns the metrics collected by RE Manager in Prometheus text format.
+        The status 503 is returned if the metrics could not be obtained from RE Manager.
+        """
+        msg = await self._send_command(command="metrics")
+        if not msg.get("success", False) or ("metrics" not in msg):
+            return web.Response(status=503, text=f"Failed to obtain metrics: {msg.get('msg', '')}\n")
+        return web.Response(text=format_prometheus(msg["metrics"]),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
     def setup_routes(self, app):
         """
         Setup routes to handler for web.Application
@@ -176,6 +394,10 @@ class WebServer:
                 web.get("/", self._hello_handler),
                 web.get("/queue_view", self._queue_view_handler),
                 web.post("/add_to_queue", self._add_to_queue_handler),
+                web.post("/add_to_queue_batch", self._add_to_queue_batch_handler),
+                web.post("/insert_into_queue", self._insert_into_queue_handler),
+                web.post("/move_in_queue", self._move_in_queue_handler),
+                web.post("/remove_from_queue", self._remove_from_queue_handler),
                 web.post("/pop_from_queue", self._pop_from_queue_handler),
                 web.post("/create_environment", self._create_environment_handler),
                 web.post("/close_environment", self._close_environment_handler),
@@ -183,8 +405,17 @@ class WebServer:
                 web.post("/re_continue", self._re_continue_handler),
                 web.post("/re_pause", self._re_pause_handler),
                 web.post("/print_db_uids", self._print_db_uids_handler),
+                web.get("/list_runs", self._list_runs_handler),
+                web.get("/metrics", self._metrics_handler),
+                web.get("/plan_stats", self._plan_stats_handler),
+                web.get("/stream", self._stream_handler),
             ]
         )
+        app.on_shutdown.append(self._stream_on_shutdown)
+        app.on_cleanup.append(self._on_cleanup)
+
+    async def _on_cleanup(self, app):
+        self._zmq_comm.close()
 
 
 def init_func(argv):
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import time as ttime
+import zmq
+import zmq.asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+
+from bluesky_queueserver.server.server import WebServer
+
+
+async def _read_sse_events(response, n_events, *, timeout=5):
+    """
+    Read 'n_events' events from the stream. Returns the list of tuples (event, data).
+    """
+    events, event = [], None
+
+    async def read():
+        nonlocal event
+        while len(events) < n_events:
+            line = (await response.content.readline()).decode().rstrip("\n")
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+
+    await asyncio.wait_for(read(), timeout=timeout)
+    return events
+
+
+async def _fake_re_manager(zmq_socket, *, delay, ignore_commands=(), replies=None):
+    """
+    Replies to requests received on ROUTER socket after 'delay'. Requests are processed
+    concurrently (as in RE Manager). Requests with commands from 'ignore_commands' are ignored.
+    Replies to selected commands may be passed as a dictionary 'replies' (command -> reply).
+    """
+    replies = replies or {}
+
+    async def process(frames):
+        msg = json.loads(frames[-1])
+        if msg["command"] in ignore_commands:
+            return
+        await asyncio.sleep(delay)
+        reply = replies.get(msg["command"], {"success": True, "msg": msg["command"]})
+        await zmq_socket.send_multipart(frames[:-1] + [json.dumps(reply).encode()])
+
+    tasks = set()
+    while True:
+        frames = await zmq_socket.recv_multipart()
+        task = asyncio.ensure_future(process(frames))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+
+def test_concurrent_requests():
+    """
+    HTTP requests are sent to RE Manager concurrently: the total time of processing
+    of concurrent requests is close to the time of processing of a single request.
+    Timeout of a request does not affect the following requests.
+    """
+    delay, n_requests = 0.2, 50
+
+    async def testing():
+        ctx = zmq.asyncio.Context()
+        router_socket = ctx.socket(zmq.ROUTER)
+        port = router_socket.bind_to_random_port("tcp://127.0.0.1")
+        task_manager = asyncio.ensure_future(
+            _fake_re_manager(router_socket, delay=delay, ignore_commands=("pop_from_queue",)))
+
+        re_server = WebServer(zmq_server_address=f"tcp://127.0.0.1:{port}")
+        app = web.Application()
+        re_server.setup_routes(app)
+
+        async with TestClient(TestServer(app)) as client:
+
+            async def request():
+                resp = await client.get("/queue_view")
+                return await resp.json()
+
+            # Establish connection
+            assert (await request())["success"] is True
+
+            t_start = ttime.time()
+            results = await asyncio.gather(*[request() for _ in range(n_requests)])
+            t_elapsed = ttime.time() - t_start
+
+            assert all(_ == {"success": True, "msg": "queue_view"} for _ in results)
+            # Sequential processing would take 'n_requests * delay' (10 s)
+            assert t_elapsed < 5 * delay, f"Processing of requests took too long: {t_elapsed} s"
+
+            # The request times out, but the following requests are processed normally
+            resp = await client.post("/pop_from_queue")
+            result = await resp.json()
+            assert result["success"] is False
+            assert "Timeout" in result["msg"]
+            assert (await request())["success"] is True
+
+        task_manager.cancel()
+        router_socket.close(linger=0)
+        ctx.term()
+
+    asyncio.run(testing())
+
+
+def test_stream_coalesce_and_fan_out():
+    """
+    Events published by RE Manager are delivered to all clients connected to '/stream'.
+    Bursts of 'queue_changed' events are coalesced, discrete events are delivered in order.
+    """
+    n_clients, n_updates = 5, 100
+
+    async def testing():
+        ctx = zmq.asyncio.Context()
+        pub_socket = ctx.socket(zmq.PUB)
+        port = pub_socket.bind_to_random_port("tcp://127.0.0.1")
+
+        re_server = WebServer(zmq_publisher_address=f"tcp://127.0.0.1:{port}")
+        app = web.Application()
+        re_server.setup_routes(app)
+
+        async with TestClient(TestServer(app)) as client:
+            responses = [await client.get("/stream") for _ in range(n_clients)]
+            # Allow the subscription to be established
+            await asyncio.sleep(0.5)
+
+            async def publish(event, **kwargs):
+                msg = {"event": event}
+                msg.update(kwargs)
+                await pub_socket.send_multipart([event.encode(), json.dumps(msg).encode()])
+
+            await publish("plan_started", plan_uid="abc")
+            for n in range(n_updates):
+                await publish("queue_changed", queue_version=n)
+            await publish("plan_exit", plan_uid="abc")
+
+            for resp in responses:
+                assert resp.headers["Content-Type"] == "text/event-stream"
+                events = await _read_sse_events(resp, 3)
+                # Only the latest 'queue_changed' event is delivered
+                names = [_[0] for _ in events]
+                assert names == ["plan_started", "queue_changed", "plan_exit"]
+                assert events[1][1]["queue_version"] == n_updates - 1
+
+            # The new client receives the latest state as soon as it is connected
+            resp = await client.get("/stream")
+            events = await _read_sse_events(resp, 1)
+            assert events[0] == ("queue_changed", {"event": "queue_changed", "queue_version": n_updates - 1})
+
+        pub_socket.close(linger=0)
+        ctx.term()
+
+    asyncio.run(testing())
+
+
+def test_stream_coalesce_keeps_order():
+    """
+    The coalesced state event keeps its position relative to the discrete events.
+    """
+    async def testing():
+        re_server = WebServer()
+        re_server._stream_add_event("queue_changed", "1")
+        re_server._stream_add_event("plan_exit", "a")
+        re_server._stream_add_event("queue_changed", "2")
+        re_server._stream_add_event("plan_started", "b")
+        assert re_server._stream_pending_events == [("queue_changed", "2"), ("plan_exit", "a"),
+                                                    ("plan_started", "b")]
+
+    asyncio.run(testing())
+
+
+def test_metrics_route():
+    """
+    Metrics obtained from RE Manager are returned in Prometheus text format.
+    """
+    metrics = [{"name": "queue_length", "type": "gauge", "help": "Number of plans in the queue",
+                "series": [{"labels": {}, "value": 3}]},
+               {"name": "request_duration_seconds", "type": "histogram", "help": "Time of processing",
+                "series": [{"labels": {"command": "ping"}, "buckets": [[0.01, 2], ["+Inf", 2]],
+                            "sum": 0.002, "count": 2}]}]
+
+    async def testing():
+        ctx = zmq.asyncio.Context()
+        router_socket = ctx.socket(zmq.ROUTER)
+        port = router_socket.bind_to_random_port("tcp://127.0.0.1")
+        task_manager = asyncio.ensure_future(
+            _fake_re_manager(router_socket, delay=0,
+                             replies={"metrics": {"success": True, "msg": "", "metrics": metrics}}))
+
+        re_server = WebServer(zmq_server_address=f"tcp://127.0.0.1:{port}")
+        app = web.Application()
+        re_server.setup_routes(app)
+
+        async with TestClient(TestServer(app)) as client:
+            resp = await client.get("/metrics")
+            assert resp.status == 200
+            assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            lines = (await resp.text()).splitlines()
+            assert "# TYPE qserver_queue_length gauge" in lines
+            assert "qserver_queue_length 3.0" in lines
+            assert 'qserver_request_duration_seconds_bucket{command="ping",le="0.01"} 2' in lines
+            assert 'qserver_request_duration_seconds_count{command="ping"} 2' in lines
+
+        task_manager.cancel()
+        router_socket.close(linger=0)
+        ctx.term()
+
+    asyncio.run(testing())
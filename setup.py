@@ -58,6 +58,10 @@ setup(
         ]
     },
     install_requires=requirements,
+    extras_require={
+        # Optional codec for messages sent between RE Manager and RE Worker ('--pipe-codec msgpack')
+        'msgpack': ['msgpack'],
+    },
     license="BSD (3-clause)",
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',